@@ -117,17 +117,19 @@ class BatchProcessor:
                 result = response.json()
                 server_results = result.get("results", [])
                 
-                # Convert server results to our standard format
+                # Convert server results to our standard format (per-video result or error)
                 results = []
                 for i, (video_path, server_result) in enumerate(zip(video_paths, server_results)):
+                    error = server_result.get("error")
                     results.append({
                         "video_path": video_path,
-                        "success": True,
-                        "result": server_result,
-                        "error": None
+                        "success": error is None,
+                        "result": server_result.get("result"),
+                        "error": error
                     })
                 
-                print(f"Successfully processed {len(results)} videos")
+                successful = sum(1 for r in results if r["success"])
+                print(f"Successfully processed {successful}/{len(results)} videos")
                 return results
             else:
                 error_msg = response.json().get("error", "Unknown error")
@@ -158,6 +160,121 @@ class BatchProcessor:
                 })
             return results
     
+    def video_to_text_multi(self, video_path: str, prompt_ids: List[str] = ("3", "4"),
+                            max_new_tokens: int = 1024) -> Dict[str, Any]:
+        """
+        Run several prompts on one video with a single server call.
+        
+        Args:
+            video_path (str): Video file path or URL
+            prompt_ids (List[str]): Prompt IDs from prompts.json (default: "3", "4")
+            max_new_tokens (int): Maximum tokens to generate per prompt (default: 1024)
+            
+        Returns:
+            Dict[str, Any]: Result with video path and a prompt_id -> text mapping
+        """
+        print(f"Processing video with prompts {list(prompt_ids)}: {video_path}")
+        
+        try:
+            payload = {
+                "video_path": video_path,
+                "prompt_ids": list(prompt_ids),
+                "max_new_tokens": max_new_tokens
+            }
+            
+            response = self.session.post(
+                f"{self.server_url}/video_to_text_multi",
+                json=payload,
+                timeout=600  # 10 minutes timeout for several prompts
+            )
+            
+            if response.status_code == 200:
+                return {
+                    "video_path": video_path,
+                    "success": True,
+                    "result": response.json().get("results", {}),
+                    "error": None
+                }
+            else:
+                error_msg = response.json().get("error", "Unknown error")
+                return {
+                    "video_path": video_path,
+                    "success": False,
+                    "result": None,
+                    "error": error_msg
+                }
+                
+        except Exception as e:
+            return {
+                "video_path": video_path,
+                "success": False,
+                "result": None,
+                "error": str(e)
+            }
+    
+    def submit_job(self, video_path: str, prompt: str = None, prompt_id: str = "3",
+                   max_new_tokens: int = 1024) -> str:
+        """
+        Queue a video analysis on the server's job API and return the job id
+        without waiting for the model.
+        
+        Args:
+            video_path (str): Video file path or URL
+            prompt (str, optional): Custom prompt to use
+            prompt_id (str): Prompt ID from prompts.json (default: "3")
+            max_new_tokens (int): Maximum tokens to generate (default: 1024)
+            
+        Returns:
+            str: The job id
+        """
+        payload = {
+            "video_path": video_path,
+            "max_new_tokens": max_new_tokens
+        }
+        
+        if prompt:
+            payload["prompt"] = prompt
+        else:
+            payload["prompt_id"] = prompt_id
+        
+        response = self.session.post(f"{self.server_url}/jobs", json=payload, timeout=30)
+        if response.status_code != 202:
+            raise Exception(response.json().get("error", "Unknown error"))
+        return response.json()["job_id"]
+    
+    def wait_for_job(self, job_id: str, poll_interval: float = 2.0, timeout: float = None) -> Dict[str, Any]:
+        """
+        Poll a job until it finishes.
+        
+        Args:
+            job_id (str): Job id returned by submit_job
+            poll_interval (float): Seconds between polls (default: 2.0)
+            timeout (float, optional): Give up after this many seconds
+            
+        Returns:
+            Dict[str, Any]: Result with job id and generated text
+        """
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            try:
+                response = self.session.get(f"{self.server_url}/jobs/{job_id}", timeout=30)
+                job = response.json()
+                if response.status_code != 200:
+                    return {"job_id": job_id, "success": False, "result": None,
+                            "error": job.get("error", "Unknown error")}
+                if job["status"] in ("succeeded", "failed"):
+                    return {
+                        "job_id": job_id,
+                        "success": job["status"] == "succeeded",
+                        "result": job.get("result"),
+                        "error": job.get("error")
+                    }
+            except Exception as e:
+                print(f"Polling job {job_id} failed, retrying: {str(e)}")
+            if deadline and time.time() > deadline:
+                return {"job_id": job_id, "success": False, "result": None, "error": "Timed out waiting for job"}
+            time.sleep(poll_interval)
+    
     def img_to_text(self, image_path: str, prompt: str = None, prompt_id: str = "0", 
                    max_new_tokens: int = 1024) -> Dict[str, Any]:
         """
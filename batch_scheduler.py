@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class InferenceRequest:
+    """One queued video_to_text call."""
+    video_path: str
+    prompt: str
+    max_new_tokens: int = 1024
+    use_cache: bool = True
+    schema: Optional[Dict[str, Any]] = None  # output schema spec from prompts.json
+    sampling: Optional[Dict[str, Any]] = None  # frame sampling policy spec from prompts.json
+    trace: Any = field(default=None, compare=False)  # matching.tracing.Trace when the request is traced
+
+
+class BatchScheduler:
+    """
+    In-process dynamic batching in front of the model.
+
+    Requests submitted from any thread are collected into micro-batches, which
+    are flushed when `max_batch_size` items are waiting or the oldest item has
+    waited `max_wait_ms`. Each batch is passed to `run_batch(items)`, which must
+    return one result per item, in order (an Exception instance fails only that
+    item). Only items with the same `batch_key(item)` share a batch.
+
+    `run_batch` can be any callable, e.g. a stub returning canned answers, so
+    the scheduler runs without a GPU. With `concurrency` > 1 that many batches
+    run at once (e.g. one per inference worker process).
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 4,
+                 max_wait_ms: float = 50.0, batch_key: Optional[Callable[[Any], Hashable]] = None,
+                 concurrency: int = 1):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.batch_key = batch_key or (lambda item: None)
+        self.concurrency = max(1, concurrency)
+        self._queue: Deque[Tuple[Any, Future, float]] = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads: List[threading.Thread] = []
+        # Stats
+        self._batch_sizes: Counter = Counter()
+        self._items = 0
+        self._max_queue_depth = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._threads = [threading.Thread(target=self._loop, name=f"batch-scheduler-{n}", daemon=True)
+                         for n in range(self.concurrency)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop after the queued items have been processed."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item and return a Future for its result."""
+        future: Future = Future()
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("BatchScheduler is not running")
+            self._queue.append((item, future, time.monotonic()))
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._cond.notify_all()
+        return future
+
+    def run(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Submit an item and block until its result is ready."""
+        return self.submit(item).result(timeout)
+
+    @property
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": batches,
+                "items": self._items,
+                "mean_batch_size": self._items / batches if batches else 0.0,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                "mean_queue_wait_ms": 1000.0 * self._total_wait / self._items if self._items else 0.0,
+                "mean_batch_run_ms": 1000.0 * self._total_run / batches if batches else 0.0,
+            }
+
+    def _next_batch(self) -> Optional[List[Tuple[Any, Future, float]]]:
+        """Wait for a batch to fill or time out; None once stopped and drained."""
+        with self._cond:
+            while True:
+                while not self._queue:
+                    if not self._running:
+                        return None
+                    self._cond.wait()
+                deadline = self._queue[0][2] + self.max_wait
+                key = self.batch_key(self._queue[0][0])
+                while self._running and self._queue:
+                    same_key = sum(1 for entry in self._queue if self.batch_key(entry[0]) == key)
+                    remaining = deadline - time.monotonic()
+                    if same_key >= self.max_batch_size or remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, rest = [], deque()
+                while self._queue:
+                    entry = self._queue.popleft()
+                    if len(batch) < self.max_batch_size and self.batch_key(entry[0]) == key:
+                        batch.append(entry)
+                    else:
+                        rest.append(entry)
+                self._queue = rest
+                # Another dispatcher may have taken these items while this one waited
+                if batch:
+                    return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.monotonic()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.run_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"run_batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                results = [e] * len(items)
+            finished = time.monotonic()
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            with self._cond:
+                self._batch_sizes[len(batch)] += 1
+                self._items += len(batch)
+                self._total_wait += sum(started - queued for _, _, queued in batch)
+                self._total_run += finished - started
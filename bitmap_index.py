@@ -0,0 +1,417 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from matching.video_attributes import (
+    BITMASK_ATTRIBUTES, CATEGORIES, ENUM_ATTRIBUTES, FLAG_NAMES, decode, encode, parse_categories,
+)
+
+# Containers with more values than this are stored as 65536-bit bitmaps
+ARRAY_MAX = 4096
+
+
+def _to_bitmap(container: np.ndarray) -> np.ndarray:
+    if container.dtype == np.uint64:
+        return container
+    bits = np.zeros(65536, dtype=bool)
+    bits[container] = True
+    return np.packbits(bits, bitorder="little").view("<u8")
+
+
+def _to_array(words: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder="little")).astype(np.uint16)
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if container.dtype == np.uint64:
+        return int(np.unpackbits(container.view(np.uint8)).sum())
+    return len(container)
+
+
+def _test(words: np.ndarray, lows: np.ndarray) -> np.ndarray:
+    """Bit `low` of each value in a bitmap container."""
+    lows = lows.astype(np.uint64)
+    return ((words[lows >> np.uint64(6)] >> (lows & np.uint64(63))) & np.uint64(1)).astype(bool)
+
+
+def _normalize(container: np.ndarray) -> Optional[np.ndarray]:
+    """Pick the smaller representation; None for an empty container."""
+    if container.dtype == np.uint64:
+        size = _cardinality(container)
+        if size == 0:
+            return None
+        return _to_array(container) if size <= ARRAY_MAX else container
+    if len(container) == 0:
+        return None
+    return _to_bitmap(container) if len(container) > ARRAY_MAX else container
+
+
+def _and(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    a_bits, b_bits = a.dtype == np.uint64, b.dtype == np.uint64
+    if not a_bits and not b_bits:
+        return _normalize(np.intersect1d(a, b, assume_unique=True))
+    if a_bits and b_bits:
+        return _normalize(a & b)
+    array, words = (b, a) if a_bits else (a, b)
+    return _normalize(array[_test(words, array)])
+
+
+def _or(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    if a.dtype != np.uint64 and b.dtype != np.uint64:
+        return _normalize(np.union1d(a, b).astype(np.uint16))
+    return _normalize(_to_bitmap(a) | _to_bitmap(b))
+
+
+def _sub(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    if a.dtype != np.uint64:
+        if b.dtype != np.uint64:
+            return _normalize(np.setdiff1d(a, b, assume_unique=True))
+        return _normalize(a[~_test(b, a)])
+    return _normalize(a & ~_to_bitmap(b))
+
+
+class Bitmap:
+    """
+    Compressed set of non-negative row ids, roaring style: ids are split by
+    their high 16 bits into containers, each a sorted uint16 array while small
+    and a 65536-bit bitmap once it holds more than ARRAY_MAX values.
+    Supports &, |, - (and not), membership and cardinality.
+    """
+
+    __slots__ = ("_containers",)
+
+    def __init__(self, rows: Iterable[int] = ()):
+        self._containers: Dict[int, np.ndarray] = {}
+        rows = np.unique(np.fromiter(rows, dtype=np.int64))
+        if len(rows):
+            highs = rows >> 16
+            bounds = np.flatnonzero(np.diff(highs)) + 1
+            for chunk in np.split(rows, bounds):
+                container = _normalize((chunk & 0xFFFF).astype(np.uint16))
+                if container is not None:
+                    self._containers[int(chunk[0] >> 16)] = container
+
+    @classmethod
+    def _from(cls, containers: Dict[int, np.ndarray]) -> "Bitmap":
+        bitmap = cls()
+        bitmap._containers = containers
+        return bitmap
+
+    def copy(self) -> "Bitmap":
+        return Bitmap._from({high: c.copy() for high, c in self._containers.items()})
+
+    def add(self, row: int):
+        high, low = row >> 16, row & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = np.array([low], dtype=np.uint16)
+        elif container.dtype == np.uint64:
+            container[low >> 6] |= np.uint64(1 << (low & 63))
+        else:
+            pos = int(np.searchsorted(container, low))
+            if pos == len(container) or container[pos] != low:
+                self._containers[high] = _normalize(np.insert(container, pos, low))
+
+    def discard(self, row: int):
+        high, low = row >> 16, row & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            return
+        if container.dtype == np.uint64:
+            container[low >> 6] &= ~np.uint64(1 << (low & 63))
+            container = _normalize(container)
+        else:
+            pos = int(np.searchsorted(container, low))
+            if pos == len(container) or container[pos] != low:
+                return
+            container = _normalize(np.delete(container, pos))
+        if container is None:
+            del self._containers[high]
+        else:
+            self._containers[high] = container
+
+    def __contains__(self, row: int) -> bool:
+        container = self._containers.get(row >> 16)
+        if container is None:
+            return False
+        low = row & 0xFFFF
+        if container.dtype == np.uint64:
+            return bool(int(container[low >> 6]) >> (low & 63) & 1)
+        pos = int(np.searchsorted(container, low))
+        return pos < len(container) and container[pos] == low
+
+    def contains_many(self, rows: np.ndarray) -> np.ndarray:
+        """Boolean membership mask for an array of row ids."""
+        rows = np.asarray(rows, dtype=np.int64)
+        mask = np.zeros(len(rows), dtype=bool)
+        highs = rows >> 16
+        for high in np.unique(highs):
+            container = self._containers.get(int(high))
+            if container is None:
+                continue
+            selected = np.flatnonzero(highs == high)
+            lows = (rows[selected] & 0xFFFF).astype(np.uint16)
+            if container.dtype == np.uint64:
+                mask[selected] = _test(container, lows)
+            else:
+                mask[selected] = np.isin(lows, container, assume_unique=False)
+        return mask
+
+    def __len__(self) -> int:
+        return sum(_cardinality(c) for c in self._containers.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._containers)
+
+    def to_array(self) -> np.ndarray:
+        """All row ids in ascending order."""
+        parts = []
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            lows = _to_array(container) if container.dtype == np.uint64 else container
+            parts.append((high << 16) | lows.astype(np.int64))
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(row) for row in self.to_array())
+
+    def _combine(self, other: "Bitmap", op, keep_left: bool, keep_right: bool) -> "Bitmap":
+        containers = {}
+        for high, container in self._containers.items():
+            other_container = other._containers.get(high)
+            if other_container is None:
+                if keep_left:
+                    containers[high] = container
+                continue
+            result = op(container, other_container)
+            if result is not None:
+                containers[high] = result
+        if keep_right:
+            for high, container in other._containers.items():
+                if high not in self._containers:
+                    containers[high] = container
+        # Containers may be shared between bitmaps; copy before mutating in place
+        return Bitmap._from({high: c.copy() for high, c in containers.items()})
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        return self._combine(other, _and, False, False)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        return self._combine(other, _or, True, True)
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        return self._combine(other, _sub, True, False)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Bitmap) and np.array_equal(self.to_array(), other.to_array())
+
+    def __repr__(self) -> str:
+        return f"Bitmap(len={len(self)})"
+
+
+FacetValue = Tuple[str, Union[str, int]]
+
+
+@dataclass(frozen=True)
+class FacetFilter:
+    """
+    Categorical predicate over a BitmapIndex: every value of `all_of`, at least
+    one value of `any_of` (when given) and none of `none_of`. Values are
+    (facet, value) pairs such as ("language", "Spanish"), ("flags", "pet") or
+    ("categories", "Food & Cooking").
+    """
+    all_of: Tuple[FacetValue, ...] = ()
+    any_of: Tuple[FacetValue, ...] = ()
+    none_of: Tuple[FacetValue, ...] = ()
+
+
+DEFAULT_FACETS = ("gender", "skin_tone", "ethnicity", "language", "flags", "categories")
+
+
+class BitmapIndex:
+    """
+    One compressed bitmap per categorical attribute value, over influencer rows.
+
+    Enum-coded attributes from `matching.video_attributes` get one bitmap per
+    code, bitmask attributes ("flags", "categories") one per set bit, and any
+    other facet one per raw attribute value. A FacetFilter is evaluated with
+    bitmap AND/OR/ANDNOT, and facet counts for the selection are popcounts of
+    its intersection with every bitmap.
+
+    Like TagIndex, the index has add/remove/add_tags/discard_tags, so it can be
+    attached to an InfluencerStore; call `update(influencer)` (or pass the index
+    to `update_attributes`) after attributes change.
+    """
+
+    def __init__(self, influencers: Iterable[Any] = (), facets: Sequence[str] = DEFAULT_FACETS):
+        self.facets = tuple(facets)
+        self._postings: Dict[Tuple[str, Hashable], Bitmap] = {}
+        self._rows: Dict[str, int] = {}
+        self._influencers: List[Any] = []
+        self._keys: List[List[Tuple[str, Hashable]]] = []
+        self._all = Bitmap()
+        # Bulk build: collect each posting's rows, then compress once
+        rows_by_key: Dict[Tuple[str, Hashable], List[int]] = {}
+        for inf in {inf.id: inf for inf in influencers}.values():
+            row = self._rows[inf.id] = len(self._influencers)
+            self._influencers.append(inf)
+            keys = self._facet_keys(inf)
+            self._keys.append(keys)
+            for key in keys:
+                rows_by_key.setdefault(key, []).append(row)
+        self._all = Bitmap(range(len(self._influencers)))
+        for key, rows in rows_by_key.items():
+            self._postings[key] = Bitmap(rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, influencer_id: str) -> bool:
+        return influencer_id in self._rows
+
+    # --- Maintenance ---
+
+    def add(self, influencer: Any):
+        """Index an influencer (re-index it if already present)."""
+        row = self._rows.get(influencer.id)
+        if row is None:
+            row = self._rows[influencer.id] = len(self._influencers)
+            self._influencers.append(influencer)
+            self._keys.append([])
+            self._all.add(row)
+        else:
+            self._influencers[row] = influencer
+        self._index(row, influencer)
+
+    update = add
+
+    def remove(self, influencer_id: str):
+        row = self._rows.pop(influencer_id, None)
+        if row is None:
+            return
+        self._unindex(row)
+        self._influencers[row] = None
+        self._all.discard(row)
+
+    def add_tags(self, influencer_id: str, tags: Iterable[str]):
+        """Tags are not facets; present so the index can be attached to a store."""
+
+    def discard_tags(self, influencer_id: str, tags: Iterable[str]):
+        """Tags are not facets; present so the index can be attached to a store."""
+
+    def _facet_keys(self, influencer: Any) -> List[Tuple[str, Hashable]]:
+        attributes = influencer.attributes
+        keys = []
+        for facet in self.facets:
+            value = attributes.get(facet)
+            if value is None:
+                continue
+            if facet in BITMASK_ATTRIBUTES:
+                value = int(value)
+                keys.extend((facet, 1 << bit) for bit in range(value.bit_length()) if value >> bit & 1)
+            elif isinstance(value, (list, tuple, set)):
+                keys.extend((facet, v) for v in value)
+            elif value != 0 or facet not in ENUM_ATTRIBUTES:
+                keys.append((facet, value))
+        return keys
+
+    def _index(self, row: int, influencer: Any):
+        self._unindex(row)
+        keys = self._facet_keys(influencer)
+        for key in keys:
+            posting = self._postings.get(key)
+            if posting is None:
+                posting = self._postings[key] = Bitmap()
+            posting.add(row)
+        self._keys[row] = keys
+
+    def _unindex(self, row: int):
+        for key in self._keys[row]:
+            posting = self._postings.get(key)
+            if posting is not None:
+                posting.discard(row)
+                if not posting:
+                    del self._postings[key]
+        self._keys[row] = []
+
+    # --- Queries ---
+
+    def bitmap(self, facet: str, value: Union[str, int]) -> Bitmap:
+        """Rows with the given facet value (do not mutate the returned bitmap)."""
+        return self._postings.get((facet, _resolve(facet, value)), Bitmap())
+
+    def select(self, flt: FacetFilter, within: Optional[Bitmap] = None) -> Bitmap:
+        """Rows matching the filter, optionally restricted to `within`."""
+        result = self._all.copy() if within is None else within & self._all
+        for facet, value in flt.all_of:
+            result = result & self.bitmap(facet, value)
+        if flt.any_of:
+            union = Bitmap()
+            for facet, value in flt.any_of:
+                union = union | self.bitmap(facet, value)
+            result = result & union
+        for facet, value in flt.none_of:
+            result = result - self.bitmap(facet, value)
+        return result
+
+    def rows_of(self, influencers: Iterable[Any]) -> Bitmap:
+        """Bitmap of the indexed rows of the given influencers."""
+        return Bitmap(self._rows[inf.id] for inf in influencers if inf.id in self._rows)
+
+    def influencers(self, rows: Bitmap) -> List[Any]:
+        """Influencers of a row bitmap, in the order they were indexed."""
+        return [self._influencers[row] for row in rows]
+
+    def filter(self, influencers: Sequence[Any], flt: FacetFilter) -> List[Any]:
+        """Keep the influencers matching the filter, preserving input order."""
+        selection = self.select(flt)
+        rows = np.fromiter((self._rows.get(inf.id, -1) for inf in influencers), dtype=np.int64,
+                           count=len(influencers))
+        mask = (rows >= 0) & selection.contains_many(np.maximum(rows, 0))
+        return [influencers[int(i)] for i in np.flatnonzero(mask)]
+
+    def facet_counts(self, selection: Union[Bitmap, Iterable[Any]],
+                     facets: Optional[Sequence[str]] = None) -> Dict[str, Dict[Any, int]]:
+        """
+        Number of selected influencers per facet value, e.g.
+        {"language": {"English": 120, "Spanish": 31}, "flags": {"pet": 12}, ...}.
+        """
+        if not isinstance(selection, Bitmap):
+            selection = self.rows_of(selection)
+        wanted = set(facets or self.facets)
+        counts: Dict[str, Dict[Any, int]] = {facet: {} for facet in self.facets if facet in wanted}
+        for (facet, value), posting in self._postings.items():
+            if facet in counts:
+                count = len(selection & posting)
+                if count:
+                    counts[facet][_label(facet, value)] = count
+        return counts
+
+    def search(self, flt: FacetFilter, within: Optional[Bitmap] = None) -> Tuple[List[Any], Dict[str, Dict[Any, int]]]:
+        """Matching influencers together with the facet counts of the selection."""
+        selection = self.select(flt, within)
+        return self.influencers(selection), self.facet_counts(selection)
+
+
+def _resolve(facet: str, value: Union[str, int]) -> Hashable:
+    """Posting key for a user-facing value: enum names -> codes, flag/category names -> bits."""
+    if not isinstance(value, str):
+        return value
+    if facet in ENUM_ATTRIBUTES:
+        return encode(facet, value)
+    if facet == "flags":
+        return FLAG_NAMES.get(value.lower(), 0)
+    if facet == "categories":
+        return parse_categories(value)
+    return value
+
+
+def _label(facet: str, value: Hashable) -> Any:
+    if facet in ENUM_ATTRIBUTES:
+        return decode(facet, value)
+    if facet == "flags":
+        return next((name for name, bit in FLAG_NAMES.items() if bit == value), value)
+    if facet == "categories":
+        return CATEGORIES[int(value).bit_length() - 1]
+    return value
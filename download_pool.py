@@ -0,0 +1,172 @@
+import os
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+
+# runner(cmd, timeout) -> object with `returncode` and `stderr` (like subprocess.CompletedProcess);
+# may raise subprocess.TimeoutExpired
+Runner = Callable[[List[str], float], Any]
+
+
+def run_subprocess(cmd: List[str], timeout: float) -> subprocess.CompletedProcess:
+    return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+
+
+def yt_dlp_command(url: str, output_path: str, proxy: Optional[str] = None) -> List[str]:
+    """
+    yt-dlp command that always leaves the video at `output_path` (.mp4):
+    the output template keeps the stem and the result is remuxed to mp4.
+    """
+    stem = os.path.splitext(output_path)[0].replace("%", "%%")
+    cmd = ["yt-dlp"]
+    if proxy:
+        cmd += ["--proxy", proxy]
+    # Filenames are positional, so a file left by an earlier run must not be reused
+    cmd += ["--user-agent", USER_AGENT, "--remux-video", "mp4", "--force-overwrites", "-o", f"{stem}.%(ext)s", url]
+    return cmd
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    path: Optional[str] = None  # absolute path of the downloaded file, None on failure
+    error: Optional[str] = None
+    attempts: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.path is not None
+
+
+class DownloadPool:
+    """
+    Bounded concurrent yt-dlp downloads.
+
+    At most `max_workers` downloads run at once and at most `per_host` against
+    the same host. Failed attempts (non-zero exit, timeout, missing output
+    file) are retried up to `retries` times with exponential backoff and
+    jitter; the host slot is released while backing off. Output paths are
+    chosen by the caller, so no directory scan is needed, and results come
+    back in input order. `runner` replaces subprocess.run (e.g. a fake yt-dlp
+    in tests) and `sleep` the backoff sleep.
+    """
+
+    def __init__(self, max_workers: int = 4, per_host: int = 2, retries: int = 2, backoff: float = 1.0,
+                 max_backoff: float = 30.0, timeout: float = 300.0, runner: Optional[Runner] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.runner = runner or run_subprocess
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._host_slots: Dict[str, threading.Semaphore] = {}
+        # Aggregate metrics over every download of this pool
+        self._succeeded = 0
+        self._failed = 0
+        self._retried = 0
+        self._bytes = 0
+        self._busy_seconds = 0.0
+        self._wall_seconds = 0.0
+
+    def _slot(self, url: str) -> threading.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.Semaphore(self.per_host)
+            return slot
+
+    def download(self, urls: Sequence[str], output_paths: Sequence[str], proxy: Optional[str] = None,
+                 on_result: Optional[Callable[[int, DownloadResult], None]] = None) -> List[DownloadResult]:
+        """
+        Download urls[i] to output_paths[i]; returns one DownloadResult per url,
+        in input order. `on_result(i, result)` is called as each one finishes.
+        """
+        if len(urls) != len(output_paths):
+            raise ValueError("urls and output_paths must have the same length")
+        started = time.perf_counter()
+
+        def work(i: int) -> DownloadResult:
+            result = self.download_one(urls[i], output_paths[i], proxy)
+            if on_result is not None:
+                on_result(i, result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(urls)))) as executor:
+            results = list(executor.map(work, range(len(urls))))
+        with self._lock:
+            self._wall_seconds += time.perf_counter() - started
+        return results
+
+    def download_one(self, url: str, output_path: str, proxy: Optional[str] = None) -> DownloadResult:
+        """Download a single url (with retries) in the calling thread."""
+        result = DownloadResult(url)
+        output_path = os.path.abspath(output_path)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        cmd = yt_dlp_command(url, output_path, proxy)
+        slot = self._slot(url)
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+                self.sleep(delay * random.uniform(0.5, 1.0))
+                with self._lock:
+                    self._retried += 1
+            result.attempts = attempt + 1
+            with slot:
+                try:
+                    completed = self.runner(cmd, self.timeout)
+                except subprocess.TimeoutExpired:
+                    result.error = f"Timeout after {self.timeout}s"
+                    continue
+                except Exception as e:
+                    result.error = str(e)
+                    continue
+            if completed.returncode != 0:
+                result.error = (completed.stderr or "").strip() or f"yt-dlp exited with {completed.returncode}"
+                continue
+            if not os.path.exists(output_path):
+                result.error = f"Output file not found: {output_path}"
+                continue
+            result.path = output_path
+            result.error = None
+            result.bytes = os.path.getsize(output_path)
+            break
+        result.seconds = time.perf_counter() - started
+        with self._lock:
+            if result.ok:
+                self._succeeded += 1
+                self._bytes += result.bytes
+            else:
+                self._failed += 1
+            self._busy_seconds += result.seconds
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            wall = self._wall_seconds
+            return {
+                "succeeded": self._succeeded,
+                "failed": self._failed,
+                "retries": self._retried,
+                "bytes": self._bytes,
+                "wall_seconds": wall,
+                "videos_per_sec": self._succeeded / wall if wall > 0 else 0.0,
+                "bytes_per_sec": self._bytes / wall if wall > 0 else 0.0,
+                # Sum of per-download time over wall time: the achieved concurrency
+                "mean_concurrency": self._busy_seconds / wall if wall > 0 else 0.0,
+            }
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from matching.result_cache import video_fingerprint
+
+
+class FrameCache:
+    """
+    On-disk cache of decoded and resized video frames (the tensors returned by
+    `process_vision_info`), keyed by (video fingerprint, fps, max_pixels[, max_frames]).
+
+    Frames are stored as .npy files in the dtype they were decoded in and read
+    back memory-mapped without a copy, so a second prompt on the same video
+    skips decoding and gets exactly the pixel values of the first. Files are
+    evicted least recently used first once their total size exceeds `max_bytes`.
+    """
+
+    # Part of every key; bump when the stored format changes (2: frames kept in their decoded dtype)
+    FORMAT_VERSION = 2
+
+    def __init__(self, directory: str = "./cache/frames", max_bytes: int = 8 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(video_url: str, fps: float, max_pixels: int, max_frames: Optional[int] = None) -> str:
+        raw = f"v{FrameCache.FORMAT_VERSION}\0{video_fingerprint(video_url)}\0{float(fps)}\0{int(max_pixels)}"
+        if max_frames:
+            raw += f"\0{int(max_frames)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return base + ".npy", base + ".json"
+
+    def get(self, key: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """Return (frames tensor, video_kwargs) or None on a miss."""
+        array_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                video_kwargs = json.load(f)
+            # Copy-on-write mapping: pages are read lazily and the array is writable
+            frames = np.load(array_path, mmap_mode="c")
+            os.utime(array_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        import torch
+        return torch.from_numpy(frames), video_kwargs
+
+    def put(self, key: str, frames: Any, video_kwargs: Dict[str, Any]):
+        """Store a frames tensor (T, C, H, W) and its video_kwargs."""
+        array_path, meta_path = self._paths(key)
+        array = frames.detach().cpu().numpy() if hasattr(frames, "detach") else np.asarray(frames)
+        tmp = f"{array_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, array_path)
+        tmp = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_jsonable(video_kwargs), f)
+        os.replace(tmp, meta_path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".npy"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                for stale in (path, path[:-len(".npy")] + ".json"):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+                total -= size
+
+    def stats(self) -> Dict[str, float]:
+        files = [e for e in os.scandir(self.directory) if e.name.endswith(".npy")]
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(files),
+            "bytes": sum(e.stat().st_size for e in files),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return value
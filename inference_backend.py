@@ -0,0 +1,710 @@
+import atexit
+import hashlib
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from matching import metrics, tracing
+from matching.output_schema import ChoiceSchema, KeyValueSchema
+
+# Backend states
+IDLE = "idle"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class InferenceBackend:
+    """
+    What the server, jobs and pipelines run inference through.
+
+    The model is loaded lazily: by the first request, or ahead of time with
+    `load()` / `start_warmup()`. Creating a backend and importing this module
+    is cheap, so code that never runs inference (e.g. tag matching) does not
+    pay for torch or the checkpoint. Subclasses implement `_load` and the
+    request methods; `_warmup` runs one tiny generate.
+    """
+
+    name = "base"
+    # Requests the backend can usefully run at once (e.g. worker processes)
+    parallelism = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = IDLE
+        self._error: Optional[str] = None
+        self._load_seconds: Optional[float] = None
+        self._warmup_requested = False
+        self._warmup_seconds: Optional[float] = None
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _warmup(self):
+        pass
+
+    def load(self):
+        """Load the model if it is not loaded yet; concurrent callers wait for one load."""
+        if self._state == READY:
+            return
+        with self._lock:
+            if self._state == READY:
+                return
+            self._state = LOADING
+            started = time.perf_counter()
+            try:
+                self._load()
+            except Exception as e:
+                self._state = FAILED
+                self._error = str(e)
+                raise
+            self._load_seconds = time.perf_counter() - started
+            self._error = None
+            self._state = READY
+
+    def warmup(self):
+        """Load the model and run one tiny generate."""
+        self._warmup_requested = True
+        self.load()
+        started = time.perf_counter()
+        try:
+            self._warmup()
+        except Exception as e:
+            self._error = f"Warm-up failed: {e}"
+            raise
+        finally:
+            self._warmup_seconds = time.perf_counter() - started
+
+    def start_warmup(self, generate: bool = True) -> threading.Thread:
+        """Load (and with `generate`, warm up) in a background thread; see `ready`."""
+        self._warmup_requested = generate
+
+        def run():
+            try:
+                self.warmup() if generate else self.load()
+                print(f"✓ Inference backend {self.name} ready ({self._load_seconds:.1f}s load)")
+            except Exception as e:
+                print(f"✗ Inference backend {self.name} failed to load: {e}")
+
+        thread = threading.Thread(target=run, name=f"{self.name}-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def ready(self) -> bool:
+        """Loaded, and warmed up if a warm-up was requested."""
+        if self._state != READY:
+            return False
+        return not self._warmup_requested or self._warmup_seconds is not None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "state": self._state,
+            "ready": self.ready,
+            "error": self._error,
+            "load_seconds": self._load_seconds,
+            "warmup_seconds": self._warmup_seconds,
+        }
+
+    # --- Requests; every method loads the model on first use ---
+
+    def video_to_text(self, video_url: str, prompt: str = "Describe this video.", max_new_tokens: int = 128,
+                      use_cache: bool = True, on_text: Callable[[str], None] = None, schema=None,
+                      sampling=None) -> str:
+        raise NotImplementedError
+
+    def video_to_text_multi(self, video_url: str, prompts: List[str], max_new_tokens: int = 128,
+                            use_cache: bool = True, schemas: list = None, samplings: list = None) -> List[str]:
+        raise NotImplementedError
+
+    def video_prompts_to_text(self, requests: list, max_new_tokens: int = 128,
+                              use_cache: bool = True) -> List[Dict[str, str]]:
+        raise NotImplementedError
+
+    def video_to_text_stream(self, video_url: str, prompt: str = "Describe this video.", max_new_tokens: int = 128,
+                             use_cache: bool = True, cancel_event: threading.Event = None,
+                             schema=None, sampling=None) -> Iterator[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def prefetch(self, video_url: str, sampling=None) -> bool:
+        """
+        Decode a video's frames into the frame cache that inference will read,
+        ahead of the request (e.g. while the GPU works on the previous video).
+        Returns False when the backend has no such cache.
+        """
+        return False
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {}
+
+    def metrics_snapshots(self) -> List[Tuple[Dict[str, str], List[Dict[str, Any]]]]:
+        """
+        Metrics recorded in other processes (e.g. inference workers), as
+        (extra labels, `metrics.snapshot()`) pairs; in-process backends record
+        into this process's registry and return [].
+        """
+        return []
+
+    def release_memory(self):
+        """Free cached accelerator memory between requests."""
+
+
+class TransformersBackend(InferenceBackend):
+    """In-process Qwen2.5-VL through `matching.video_to_text` (imported on first use)."""
+
+    name = "transformers"
+
+    def __init__(self, warmup_video: str = None):
+        super().__init__()
+        self.warmup_video = warmup_video
+        self._module = None
+
+    def _vtt(self):
+        if self._module is None:
+            from matching import video_to_text
+            self._module = video_to_text
+        return self._module
+
+    def _load(self):
+        self._vtt().load_model()
+
+    def _warmup(self):
+        self._vtt().warmup(self.warmup_video)
+
+    def video_to_text(self, video_url, prompt="Describe this video.", max_new_tokens=128, use_cache=True,
+                      on_text=None, schema=None, sampling=None):
+        self.load()
+        return self._vtt().video_to_text(video_url, prompt=prompt, max_new_tokens=max_new_tokens,
+                                         use_cache=use_cache, on_text=on_text, schema=schema, sampling=sampling)
+
+    def video_to_text_multi(self, video_url, prompts, max_new_tokens=128, use_cache=True, schemas=None,
+                            samplings=None):
+        self.load()
+        return self._vtt().video_to_text_multi(video_url, prompts, max_new_tokens=max_new_tokens,
+                                               use_cache=use_cache, schemas=schemas, samplings=samplings)
+
+    def video_prompts_to_text(self, requests, max_new_tokens=128, use_cache=True):
+        self.load()
+        return self._vtt().video_prompts_to_text(requests, max_new_tokens=max_new_tokens, use_cache=use_cache)
+
+    def video_to_text_stream(self, video_url, prompt="Describe this video.", max_new_tokens=128, use_cache=True,
+                             cancel_event=None, schema=None, sampling=None):
+        self.load()
+        return self._vtt().video_to_text_stream(video_url, prompt=prompt, max_new_tokens=max_new_tokens,
+                                                use_cache=use_cache, cancel_event=cancel_event, schema=schema,
+                                                sampling=sampling)
+
+    def prefetch(self, video_url, sampling=None):
+        vtt = self._vtt()
+        vtt.process_video(vtt.build_messages(video_url, "", sampling), video_url, use_cache=True, sampling=sampling)
+        return True
+
+    def cache_stats(self):
+        vtt = self._vtt()
+        return {"results": vtt.result_cache.stats(), "frames": vtt.frame_cache.stats()}
+
+    def release_memory(self):
+        if self._module is None:
+            return
+        import torch
+        try:
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+                torch.cuda.ipc_collect()
+        except Exception as e:
+            print(f"GPU memory cleanup failed: {e}")
+
+
+class StubBackend(InferenceBackend):
+    """
+    Deterministic answers without a model, for tests and CPU-only boxes. The
+    same (video, prompt) always gives the same text, and with an output schema
+    the answer follows it. `delay` seconds per request simulates generation.
+    """
+
+    name = "stub"
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__()
+        self.delay = delay
+
+    def _load(self):
+        pass
+
+    def answer(self, video_url: str, prompt: str, schema=None) -> str:
+        digest = hashlib.sha256(f"{video_url}\0{prompt}".encode("utf-8")).digest()
+        if isinstance(schema, KeyValueSchema):
+            lines = []
+            for i, field in enumerate(schema.fields):
+                values = field["values"]
+                value = values[digest[i % len(digest)] % len(values)] if values else f"stub-{digest[i % len(digest)]:02x}"
+                lines.append(f"{field['key']}: {value}")
+            return "\n".join(lines)
+        if isinstance(schema, ChoiceSchema):
+            ranked = sorted(schema.options, key=lambda o: hashlib.sha256(digest + o.encode("utf-8")).digest())
+            return "\n".join(ranked[:schema.count])
+        return f"Stub answer for {os.path.basename(video_url)}: #stub{digest.hex()[:8]} #stub{digest.hex()[8:16]}"
+
+    def _generate(self, video_url: str, prompt: str, schema=None) -> str:
+        self.load()
+        with tracing.stage("generate", stub=True):
+            if self.delay:
+                time.sleep(self.delay)
+            return self.answer(video_url, prompt, schema)
+
+    def video_to_text(self, video_url, prompt="Describe this video.", max_new_tokens=128, use_cache=True,
+                      on_text=None, schema=None, sampling=None):
+        text = self._generate(video_url, prompt, schema)
+        if on_text is not None:
+            for chunk in _chunks(text):
+                on_text(chunk)
+        return text
+
+    def video_to_text_multi(self, video_url, prompts, max_new_tokens=128, use_cache=True, schemas=None,
+                            samplings=None):
+        schemas = schemas or [None] * len(prompts)
+        return [self._generate(video_url, prompt, schema) for prompt, schema in zip(prompts, schemas)]
+
+    def video_prompts_to_text(self, requests, max_new_tokens=128, use_cache=True):
+        results = []
+        for request in requests:
+            video_url, prompt = request[:2]
+            if not video_url.startswith("http") and not os.path.exists(video_url):
+                results.append({"error": f"Video not found: {video_url}"})
+                continue
+            results.append({"result": self._generate(video_url, prompt, request[2] if len(request) > 2 else None)})
+        return results
+
+    def video_to_text_stream(self, video_url, prompt="Describe this video.", max_new_tokens=128, use_cache=True,
+                             cancel_event=None, schema=None, sampling=None):
+        started = time.perf_counter()
+        text = self._generate(video_url, prompt, schema)
+        first = time.perf_counter()
+        sent = []
+        for chunk in _chunks(text):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            sent.append(chunk)
+            yield {"text": chunk}
+        finished = time.perf_counter()
+        yield {"done": True, "result": "".join(sent), "cancelled": len(sent) < len(_chunks(text)),
+               "stats": {"cached": False, "ttft_ms": 1000 * (first - started), "total_ms": 1000 * (finished - started),
+                         "output_tokens": len(sent), "tokens_per_sec": None}}
+
+
+def _chunks(text: str) -> List[str]:
+    """Word-sized pieces of a text, as a streamer would emit them."""
+    return re.findall(r"\s*\S+", text) or ([text] if text else [])
+
+
+# --- Worker processes ---
+
+Address = Union[str, Tuple[str, int]]
+
+
+def parse_address(text: str) -> Address:
+    """"host:port" -> (host, port); anything else is a unix socket path."""
+    host, sep, port = text.rpartition(":")
+    if sep and port.isdigit() and "/" not in text:
+        return host, int(port)
+    return text
+
+
+def format_address(address: Address) -> str:
+    return f"{address[0]}:{address[1]}" if isinstance(address, tuple) else address
+
+
+def _local_address(directory: str, index: int) -> Address:
+    if hasattr(socket, "AF_UNIX"):
+        return os.path.join(directory, f"worker-{index}.sock")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()
+
+
+class _Worker:
+    def __init__(self, index: int, address: Address, local: bool):
+        self.index = index
+        self.address = address
+        self.local = local
+        self.process: Optional[subprocess.Popen] = None
+        self.inflight = 0
+        self.served = 0
+        self.failed = 0
+
+
+class WorkerPoolBackend(InferenceBackend):
+    """
+    Inference in separate worker processes, reached over authenticated local
+    sockets (multiprocessing.connection). Each request goes to the worker with
+    the fewest requests in flight, and the server process only waits on
+    sockets, so its request threads stay responsive while workers generate.
+
+    `workers` local processes are started, or one per entry of `devices`
+    (each sees only its GPU through CUDA_VISIBLE_DEVICES); each runs
+    `worker_backend` ("transformers" or "stub"). With `addresses`
+    (["host:port", ...]) the pool uses workers already running elsewhere,
+    e.g. on other GPU boxes, started with
+    `python -m matching.inference_backend --listen 0.0.0.0:6000` and the same
+    MATCHING_WORKER_AUTHKEY. A local worker that dies is restarted on the next
+    request.
+    """
+
+    name = "workers"
+
+    def __init__(self, workers: int = 1, devices: Optional[List[str]] = None, addresses: Optional[List[str]] = None,
+                 worker_backend: str = "transformers", authkey: Optional[bytes] = None,
+                 connect_timeout: float = 120.0):
+        super().__init__()
+        self.worker_backend = worker_backend
+        self.devices = list(devices) if devices else None
+        self.connect_timeout = connect_timeout
+        env_key = os.environ.get("MATCHING_WORKER_AUTHKEY")
+        self.authkey = authkey or (bytes.fromhex(env_key) if env_key else os.urandom(16))
+        self._pool_lock = threading.Lock()
+        self._socket_dir: Optional[str] = None
+        if addresses:
+            self._workers = [_Worker(i, parse_address(a), local=False) for i, a in enumerate(addresses)]
+        else:
+            self._socket_dir = tempfile.mkdtemp(prefix="matching-workers-")
+            count = len(self.devices) if self.devices else max(1, workers)
+            self._workers = [_Worker(i, _local_address(self._socket_dir, i), local=True) for i in range(count)]
+        atexit.register(self.close)
+
+    @property
+    def parallelism(self) -> int:
+        return len(self._workers)
+
+    def _spawn(self, worker: _Worker):
+        env = dict(os.environ, MATCHING_BACKEND=self.worker_backend, MATCHING_WORKER_AUTHKEY=self.authkey.hex(),
+                   MATCHING_WORKER_PARENT=str(os.getpid()))
+        if self.devices:
+            env["CUDA_VISIBLE_DEVICES"] = str(self.devices[worker.index])
+        # The worker imports `matching` from the same place as this process
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (package_root, env.get("PYTHONPATH")) if p)
+        cmd = [sys.executable, "-m", "matching.inference_backend", "--listen", format_address(worker.address)]
+        worker.process = subprocess.Popen(cmd, env=env)
+
+    def _ensure_running(self, worker: _Worker):
+        if not worker.local:
+            return
+        with self._pool_lock:
+            if worker.process is not None and worker.process.poll() is None:
+                return
+            if worker.process is not None:
+                print(f"⚠ Inference worker {worker.index} exited with code {worker.process.returncode}, restarting")
+            self._spawn(worker)
+
+    def _connect(self, worker: _Worker) -> Connection:
+        self._ensure_running(worker)
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                return Client(worker.address, authkey=self.authkey)
+            except OSError as e:
+                if worker.local and worker.process.poll() is not None:
+                    raise Exception(f"Inference worker {worker.index} exited with code {worker.process.returncode}")
+                if time.monotonic() > deadline:
+                    raise Exception(f"Could not connect to inference worker {format_address(worker.address)}: {e}")
+                time.sleep(0.1)
+
+    def _acquire(self, worker: Optional[_Worker] = None) -> _Worker:
+        """Reserve `worker`, or the one with the shortest queue."""
+        with self._pool_lock:
+            if worker is None:
+                worker = min(self._workers, key=lambda w: (w.inflight, w.served))
+            worker.inflight += 1
+            return worker
+
+    def _release(self, worker: _Worker, ok: bool):
+        with self._pool_lock:
+            worker.inflight -= 1
+            worker.served += 1
+            worker.failed += 0 if ok else 1
+
+    def _request(self, method: str, kwargs: Dict[str, Any], on_text: Callable[[str], None] = None,
+                 worker: Optional[_Worker] = None) -> Any:
+        worker = self._acquire(worker)
+        ok = False
+        try:
+            conn = self._connect(worker)
+            try:
+                conn.send((method, dict(kwargs, trace=tracing.active())))
+                while True:
+                    kind, value = conn.recv()
+                    if kind == "text":
+                        if on_text is not None:
+                            on_text(value)
+                    elif kind == "trace":
+                        tracing.merge(value, worker=worker.index)
+                    elif kind == "result":
+                        ok = True
+                        return value
+                    else:
+                        raise Exception(value)
+            finally:
+                conn.close()
+        except (EOFError, ConnectionError) as e:
+            raise Exception(f"Inference worker {worker.index} failed: {e!r}")
+        finally:
+            self._release(worker, ok)
+
+    def _each_worker(self, method: str) -> List[Any]:
+        with ThreadPoolExecutor(max_workers=len(self._workers)) as executor:
+            return list(executor.map(lambda w: self._request(method, {}, worker=w), self._workers))
+
+    def _load(self):
+        self._each_worker("load")
+
+    def _warmup(self):
+        self._each_worker("warmup")
+
+    def status(self):
+        status = super().status()
+        with self._pool_lock:
+            status["workers"] = [{
+                "address": format_address(w.address),
+                "pid": w.process.pid if w.process is not None and w.process.poll() is None else None,
+                "inflight": w.inflight,
+                "served": w.served,
+                "failed": w.failed,
+            } for w in self._workers]
+        return status
+
+    def video_to_text(self, video_url, prompt="Describe this video.", max_new_tokens=128, use_cache=True,
+                      on_text=None, schema=None, sampling=None):
+        self.load()
+        return self._request("video_to_text", {
+            "video_url": video_url, "prompt": prompt, "max_new_tokens": max_new_tokens, "use_cache": use_cache,
+            "schema": schema, "sampling": sampling, "stream_text": on_text is not None,
+        }, on_text=on_text)
+
+    def video_to_text_multi(self, video_url, prompts, max_new_tokens=128, use_cache=True, schemas=None,
+                            samplings=None):
+        self.load()
+        return self._request("video_to_text_multi", {
+            "video_url": video_url, "prompts": prompts, "max_new_tokens": max_new_tokens, "use_cache": use_cache,
+            "schemas": schemas, "samplings": samplings,
+        })
+
+    def video_prompts_to_text(self, requests, max_new_tokens=128, use_cache=True):
+        self.load()
+        return self._request("video_prompts_to_text", {
+            "requests": [tuple(r) for r in requests], "max_new_tokens": max_new_tokens, "use_cache": use_cache,
+        })
+
+    def video_to_text_stream(self, video_url, prompt="Describe this video.", max_new_tokens=128, use_cache=True,
+                             cancel_event=None, schema=None, sampling=None):
+        self.load()
+        return self._stream({"video_url": video_url, "prompt": prompt, "max_new_tokens": max_new_tokens,
+                             "use_cache": use_cache, "schema": schema, "sampling": sampling},
+                            cancel_event or threading.Event())
+
+    def _stream(self, kwargs: Dict[str, Any], cancel_event: threading.Event) -> Iterator[Dict[str, Any]]:
+        worker = self._acquire()
+        ok = False
+        conn = None
+        try:
+            conn = self._connect(worker)
+            conn.send(("video_to_text_stream", dict(kwargs, trace=tracing.active())))
+            cancel_sent = False
+            while True:
+                if cancel_event.is_set() and not cancel_sent:
+                    cancel_sent = True
+                    try:
+                        conn.send(("cancel", None))
+                    except OSError:
+                        pass  # the worker already finished; its last events are still buffered
+                if not conn.poll(0.1):
+                    continue
+                kind, event = conn.recv()
+                if kind == "trace":
+                    tracing.merge(event, worker=worker.index)
+                    continue
+                if kind != "event":
+                    raise Exception(event)
+                yield event
+                if event.get("done"):
+                    ok = True
+                    return
+        except GeneratorExit:
+            ok = True  # the caller stopped reading; not a worker failure
+            raise
+        except (EOFError, ConnectionError) as e:
+            raise Exception(f"Inference worker {worker.index} failed: {e!r}")
+        finally:
+            # Closing the connection early makes the worker cancel the generation
+            if conn is not None:
+                conn.close()
+            self._release(worker, ok)
+
+    def prefetch(self, video_url, sampling=None):
+        # Local workers share this machine's frame cache directory, so any of them
+        # can decode; remote workers each have their own and may not get the request
+        if not all(worker.local for worker in self._workers):
+            return False
+        return self._request("prefetch", {"video_url": video_url, "sampling": sampling})
+
+    def cache_stats(self):
+        stats = []
+        for worker in self._workers:
+            try:
+                stats.append(self._request("cache_stats", {}, worker=worker))
+            except Exception as e:
+                stats.append({"error": str(e)})
+        return {"workers": stats}
+
+    def metrics_snapshots(self):
+        snapshots = []
+        for worker in self._workers:
+            try:
+                snapshots.append(({"worker": str(worker.index)}, self._request("metrics", {}, worker=worker)))
+            except Exception as e:
+                print(f"Could not read metrics of inference worker {worker.index}: {e}")
+        return snapshots
+
+    def close(self):
+        """Stop the local worker processes."""
+        for worker in self._workers:
+            if worker.process is not None and worker.process.poll() is None:
+                worker.process.terminate()
+                try:
+                    worker.process.wait(10)
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+
+
+def _serve_connection(backend: InferenceBackend, conn: Connection):
+    """Answer one request from a WorkerPoolBackend."""
+    try:
+        method, kwargs = conn.recv()
+        # Stage timings of a traced request go back to the server, which owns the trace
+        with tracing.trace(method, requested=kwargs.pop("trace", False), submit=False) as trace:
+            if method == "video_to_text_stream":
+                cancel_event = threading.Event()
+                stream = backend.video_to_text_stream(cancel_event=cancel_event, **kwargs)
+                try:
+                    for event in stream:
+                        # A cancel message, or the server closing the connection, stops generation
+                        while conn.poll():
+                            conn.recv()
+                            cancel_event.set()
+                        if event.get("done") and trace is not None:
+                            conn.send(("trace", trace.to_dict()))
+                        conn.send(("event", event))
+                finally:
+                    stream.close()
+                return
+            if method == "video_to_text":
+                on_text = (lambda text: conn.send(("text", text))) if kwargs.pop("stream_text", False) else None
+                result = backend.video_to_text(on_text=on_text, **kwargs)
+            elif method in ("video_to_text_multi", "video_prompts_to_text", "prefetch", "load", "warmup",
+                            "cache_stats"):
+                result = getattr(backend, method)(**kwargs)
+            elif method == "metrics":
+                result = metrics.snapshot()
+            else:
+                raise Exception(f"Unknown method: {method}")
+        if trace is not None:
+            conn.send(("trace", trace.to_dict()))
+        conn.send(("result", result))
+    except (EOFError, ConnectionError):
+        pass
+    except Exception as e:
+        try:
+            conn.send(("error", str(e)))
+        except (OSError, ConnectionError):
+            pass
+    finally:
+        conn.close()
+        backend.release_memory()
+
+
+def _exit_with_parent(parent_pid: int):
+    while True:
+        time.sleep(1.0)
+        if os.getppid() != parent_pid:
+            os._exit(0)
+
+
+def serve_worker(address: Address, authkey: Optional[bytes] = None):
+    """
+    Run an inference worker: serve requests from a WorkerPoolBackend on
+    `address` with the backend chosen by MATCHING_BACKEND, one thread per
+    connection. Runs until the process is killed.
+    """
+    authkey = authkey or bytes.fromhex(os.environ["MATCHING_WORKER_AUTHKEY"])
+    backend = create_backend()
+    parent = os.environ.get("MATCHING_WORKER_PARENT")
+    if parent:
+        threading.Thread(target=_exit_with_parent, args=(int(parent),), daemon=True).start()
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)
+    with Listener(address, authkey=authkey) as listener:
+        print(f"[Inference worker {os.getpid()} ({backend.name}) listening on {format_address(address)}]")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"✗ Inference worker rejected a connection: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(backend, conn), daemon=True).start()
+
+
+def create_backend(name: str = None) -> InferenceBackend:
+    """
+    Backend selected by `name` or the MATCHING_BACKEND environment variable:
+    "transformers" (default), "stub" or "workers" (configured by
+    MATCHING_WORKERS, MATCHING_WORKER_DEVICES, MATCHING_WORKER_ADDRESSES and
+    MATCHING_WORKER_BACKEND).
+    """
+    name = name or os.environ.get("MATCHING_BACKEND", "transformers")
+    if name == "transformers":
+        return TransformersBackend(warmup_video=os.environ.get("MATCHING_WARMUP_VIDEO") or None)
+    if name == "stub":
+        return StubBackend(delay=float(os.environ.get("MATCHING_STUB_DELAY", 0)))
+    if name == "workers":
+        def env_list(key):
+            return [v.strip() for v in os.environ.get(key, "").split(",") if v.strip()]
+        return WorkerPoolBackend(
+            workers=int(os.environ.get("MATCHING_WORKERS", 1)),
+            devices=env_list("MATCHING_WORKER_DEVICES"),
+            addresses=env_list("MATCHING_WORKER_ADDRESSES"),
+            worker_backend=os.environ.get("MATCHING_WORKER_BACKEND", "transformers"),
+        )
+    raise ValueError(f"Unknown inference backend: {name}")
+
+
+_backend: Optional[InferenceBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> InferenceBackend:
+    """The process-wide backend (see create_backend), created on first call; nothing is loaded yet."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run an inference worker for WorkerPoolBackend")
+    parser.add_argument("--listen", required=True, help="unix socket path or host:port")
+    serve_worker(parse_address(parser.parse_args().listen))
@@ -1,5 +1,11 @@
-from typing import List, Dict, Any, Callable
+from typing import List, Dict, Any, Callable, Union
 from dataclasses import dataclass, field
+from matching.tag_index import TagIndex
+from matching.influencer_store import InfluencerStore
+from matching.ranking import apply_filters, rank_influencers
+from matching.query_parser import CompiledQuery, QueryCompiler, compile_query, normalize_hashtag
+from matching.relevance import TagRelevanceModel
+from matching.bitmap_index import BitmapIndex, FacetFilter
 
 # 1. Influencer Data Model (extensible)
 @dataclass
@@ -14,10 +20,26 @@ class Influencer:
         """Combine all tags for matching."""
         return list(set(self.hashtags + self.video_tags))
 
-# --- Import video_to_text for video tag extraction ---
-from matching.video_to_text import video_to_text
+# --- Video tag extraction runs on the inference backend, which loads the model on first use ---
+from matching.inference_backend import get_backend
 import re
 
+# Prompt used to tag videos for matching
+TAG_PROMPT = (
+    "You are a great specialist. You are good at tagging videos. "
+    "This is a video, please extract all useful hashtag from the video."
+)
+
+def parse_video_tags(text: str) -> List[str]:
+    """Extract normalised hashtags from the model output for TAG_PROMPT."""
+    # Extract hashtags from the output text (e.g., #tag1 #tag2 ...)
+    tags = re.findall(r"#\w+", text)
+    # If no hashtags, try to split by common delimiters (fallback)
+    if not tags:
+        tags = re.split(r"[,;\s]", text)
+    # Normalise the same way as query hashtags so they match at search time
+    return list(dict.fromkeys(t for t in map(normalize_hashtag, tags) if t))
+
 def extract_video_tags(videos: List[str]) -> List[List[str]]:
     """
     Analyze a list of videos and return a list of hashtag lists for each video.
@@ -26,32 +48,58 @@ def extract_video_tags(videos: List[str]) -> List[List[str]]:
     Returns:
         List[List[str]]: List of hashtag lists for each video.
     """
-    prompt = (
-        "You are a great specialist. You are good at tagging videos. "
-        "This is a video, please extract all useful hashtag from the video."
-    )
     tag_lists = []
     for video_path in videos:
-        text = video_to_text(video_path, prompt=prompt)
-        # Extract hashtags from the output text (e.g., #tag1 #tag2 ...)
-        tags = re.findall(r"#\w+", text)
-        # If no hashtags, try to split by common delimiters (fallback)
-        if not tags:
-            tags = re.split(r"[,;\s]", text)
-            tags = [t.strip("# ") for t in tags if t.strip()]
-        tag_lists.append(tags)
+        text = get_backend().video_to_text(video_path, prompt=TAG_PROMPT)
+        tag_lists.append(parse_video_tags(text))
     return tag_lists
 
 # 3. Input filtering function (to extract useful content from user input)
-def filter_user_input(user_input: str) -> List[str]:
-    """Extract keywords or hash tags from user input for matching."""
-    # TODO: Implement more advanced filtering if needed
-    # For now, split by whitespace and lowercase
-    return [w.lower() for w in user_input.strip().split() if w]
+def filter_user_input(user_input: str, compiler: QueryCompiler = None,
+                      index: Union[TagIndex, InfluencerStore] = None) -> List[str]:
+    """
+    Extract keywords or hash tags from user input for matching.
+    If a TagIndex (or InfluencerStore) is given, CJK runs are segmented with its
+    tags ("美妆彩妆" -> 美妆, 彩妆).
+    Numeric constraints such as "预算10000以上" are not returned as tags; use
+    compile_query to get them as RangeFilter predicates.
+    """
+    if isinstance(index, InfluencerStore):
+        index = index.index
+    return list(compile_query(user_input, compiler, index=index).tags)
 
 # 4. Hash tag matching function
-def match_influencers(user_tags: List[str], influencers: List[Influencer]) -> List[Influencer]:
-    """Return influencers whose tags overlap with user_tags."""
+def match_influencers(user_tags: Union[str, List[str], CompiledQuery], influencers: Union[List[Influencer], TagIndex, InfluencerStore],
+                      facets: FacetFilter = None, facet_index: BitmapIndex = None) -> List[Influencer]:
+    """
+    Return influencers whose tags overlap with user_tags.
+    If a TagIndex (or an InfluencerStore, which keeps its own index) is passed
+    instead of a list, only the posting lists of user_tags are visited.
+    If a CompiledQuery is passed, its numeric filters are applied as well; raw
+    search input (a str) is compiled first, against the index's tags if given.
+    A FacetFilter (e.g. language/ethnicity/pet/category) is evaluated on
+    `facet_index` with bitmap operations; with no user tags, every influencer
+    matching the facets is returned.
+    """
+    if isinstance(user_tags, str):
+        index = influencers.index if isinstance(influencers, InfluencerStore) else influencers
+        user_tags = compile_query(user_tags, index=index if isinstance(index, TagIndex) else None)
+    if facets is not None:
+        if facet_index is None:
+            raise ValueError("facet_index is required when facets are given")
+        tags = user_tags.tags if isinstance(user_tags, CompiledQuery) else user_tags
+        if not tags:
+            matched = facet_index.influencers(facet_index.select(facets))
+            filters = user_tags.filters if isinstance(user_tags, CompiledQuery) else ()
+            return apply_filters(matched, filters) if filters else matched
+        return facet_index.filter(match_influencers(user_tags, influencers), facets)
+    if isinstance(user_tags, CompiledQuery):
+        matched = match_influencers(list(user_tags.tags), influencers)
+        return apply_filters(matched, user_tags.filters) if user_tags.filters else matched
+    if isinstance(influencers, InfluencerStore):
+        influencers = influencers.index
+    if isinstance(influencers, TagIndex):
+        return influencers.match(user_tags)
     matched = []
     for inf in influencers:
         if set(user_tags) & set(inf.all_tags()):
@@ -59,8 +107,16 @@ def match_influencers(user_tags: List[str], influencers: List[Influencer]) -> Li
     return matched
 
 # 5. Flexible sorting function
-def sort_influencers(influencers: List[Influencer], sort_key: str, reverse: bool = True) -> List[Influencer]:
-    """Sort influencers by a given attribute (e.g., 'followers', 'exposure')."""
+def sort_influencers(influencers: List[Influencer], sort_key: str, reverse: bool = True,
+                     facets: FacetFilter = None, facet_index: BitmapIndex = None) -> List[Influencer]:
+    """
+    Sort influencers by a given attribute (e.g., 'followers', 'exposure').
+    If facets are given, influencers not matching them in `facet_index` are dropped first.
+    """
+    if facets is not None:
+        if facet_index is None:
+            raise ValueError("facet_index is required when facets are given")
+        influencers = facet_index.filter(influencers, facets)
     return sorted(
         influencers,
         key=lambda inf: inf.attributes.get(sort_key, 0),
@@ -68,11 +124,36 @@ def sort_influencers(influencers: List[Influencer], sort_key: str, reverse: bool
     )
 
 # 6. Add video tags to influencer
-def add_video_tags_to_influencer(influencer: Influencer, video_tags: List[str]):
+TagIndexes = Union[TagIndex, TagRelevanceModel, List[Union[TagIndex, TagRelevanceModel]], None]
+
+def _as_index_list(index: TagIndexes) -> list:
+    if index is None:
+        return []
+    return list(index) if isinstance(index, (list, tuple)) else [index]
+
+def add_video_tags_to_influencer(influencer: Influencer, video_tags: List[str], index: TagIndexes = None):
     """
     Add extracted video tags to the influencer's video_tags list (deduplicated).
+    If an index (TagIndex, TagRelevanceModel or a list of them) is given, the
+    new tags are added to it incrementally; the influencer must already be in
+    every given index (KeyError otherwise).
     """
+    old_tags = set(influencer.all_tags())
     influencer.video_tags = list(set(influencer.video_tags).union(set(video_tags)))
+    added = set(influencer.all_tags()) - old_tags
+    for idx in _as_index_list(index):
+        idx.add_tags(influencer.id, added)
+
+def set_influencer_hashtags(influencer: Influencer, hashtags: List[str], index: TagIndexes = None):
+    """
+    Replace the influencer's hashtags, keeping the index (if given) in sync.
+    """
+    old_tags = set(influencer.all_tags())
+    influencer.hashtags = list(hashtags)
+    new_tags = set(influencer.all_tags())
+    for idx in _as_index_list(index):
+        idx.discard_tags(influencer.id, old_tags - new_tags)
+        idx.add_tags(influencer.id, new_tags - old_tags)
 
 # 7. Example usage (mock data)
 if __name__ == "__main__":
@@ -101,27 +182,41 @@ if __name__ == "__main__":
         ),
     ]
 
+    # Build the inverted tag index and relevance model once; both are updated incrementally afterwards
+    tag_index = TagIndex(influencers)
+    relevance_model = TagRelevanceModel(influencers)
+
     # Example: extract video tags for a list of videos and add to influencer
     video_list = ["./videos/tiktok_@.aplacetoheal_0.mp4"]
     tag_lists = extract_video_tags(video_list)
     print("Extracted video tags:", tag_lists)
     # Add tags to the first influencer as a demo
     if tag_lists:
-        add_video_tags_to_influencer(influencers[0], tag_lists[0])
+        add_video_tags_to_influencer(influencers[0], tag_lists[0], index=[tag_index, relevance_model])
         print("Updated influencer video_tags:", influencers[0].video_tags)
 
-    # User search input
-    user_input = "美妆 彩妆 预算10000以上"
-    user_tags = filter_user_input(user_input)
+    # User search input, compiled against the indexed tag vocabulary
+    user_input = "美妆彩妆 预算10000以上"
+    query = compile_query(user_input, index=tag_index)
+    user_tags = list(query.tags)
+    print("Compiled query:", query)
 
-    # Match influencers
-    matched = match_influencers(user_tags, influencers)
+    # Match influencers (tags + numeric constraints)
+    matched = match_influencers(query, tag_index)
     print(f"Matched influencers: {[inf.name for inf in matched]}")
 
+    # Rank by tag relevance (BM25 over all_tags)
+    ranked = relevance_model.search(user_tags, top_k=20)
+    print("Ranked by relevance:", [(inf.name, round(score, 3)) for inf, score in ranked])
+
     # Sort by followers
     sorted_by_followers = sort_influencers(matched, sort_key="followers")
     print("Sorted by followers:", [(inf.name, inf.attributes["followers"]) for inf in sorted_by_followers])
 
     # Sort by budget
     sorted_by_budget = sort_influencers(matched, sort_key="budget")
-    print("Sorted by budget:", [(inf.name, inf.attributes["budget"]) for inf in sorted_by_budget]) 
\ No newline at end of file
+    print("Sorted by budget:", [(inf.name, inf.attributes["budget"]) for inf in sorted_by_budget])
+
+    # Top-k by followers with the "预算10000以上" constraint
+    top = rank_influencers(tag_index.match(user_tags), sort_key="followers", top_k=20, filters=query.filters)
+    print("Top by followers with budget >= 10000:", [(inf.name, inf.attributes["followers"]) for inf in top]) 
\ No newline at end of file
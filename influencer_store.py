@@ -0,0 +1,328 @@
+from array import array
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from matching.tag_index import TagIndex
+
+
+class InfluencerStore:
+    """
+    Columnar storage for a large influencer catalogue.
+
+    Numeric attributes (followers, exposure, budget, ...) live in typed NumPy
+    columns, tags are interned to integer ids and kept in compact arrays, and
+    callers get lightweight `InfluencerView` objects that behave like
+    `Influencer` for `match_influencers` / `sort_influencers`.
+    Non-numeric attributes are kept in a sparse per-row dict.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._capacity = max(1, capacity)
+        self._size = 0
+        self._ids: List[str] = []
+        self._names: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        # Numeric attribute name -> (values, present mask), both of length capacity
+        self._columns: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._extra: Dict[int, Dict[str, Any]] = {}
+        # Tag interning
+        self._tag_ids: Dict[str, int] = {}
+        self._tags: List[str] = []
+        self._hashtags: List[array] = []
+        self._video_tags: List[array] = []
+        # Inverted index over the store, maintained by the tag setters
+        self.index = TagIndex()
+        # Everything notified of tag changes (the TagIndex plus attached models)
+        self._indexes: List[Any] = [self.index]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator["InfluencerView"]:
+        return (InfluencerView(self, row) for row in range(self._size))
+
+    def __contains__(self, influencer_id: str) -> bool:
+        return influencer_id in self._row_of
+
+    def __getitem__(self, row: int) -> "InfluencerView":
+        if not 0 <= row < self._size:
+            raise IndexError(row)
+        return InfluencerView(self, row)
+
+    def get(self, influencer_id: str) -> Optional["InfluencerView"]:
+        """Return the view for the given influencer id, or None."""
+        row = self._row_of.get(influencer_id)
+        return None if row is None else InfluencerView(self, row)
+
+    def views(self) -> List["InfluencerView"]:
+        """All influencers as a list of views (catalogue order)."""
+        return list(self)
+
+    # --- Adding influencers ---
+
+    def add(self, influencer_id: str, name: str, attributes: Optional[Dict[str, Any]] = None,
+            hashtags: Iterable[str] = (), video_tags: Iterable[str] = ()) -> "InfluencerView":
+        """Append an influencer and return its view."""
+        if influencer_id in self._row_of:
+            raise ValueError(f"Duplicate influencer id: {influencer_id}")
+        if self._size == self._capacity:
+            self._grow()
+        row = self._size
+        self._size += 1
+        self._ids.append(influencer_id)
+        self._names.append(name)
+        self._row_of[influencer_id] = row
+        self._hashtags.append(self._intern_all(hashtags))
+        self._video_tags.append(self._intern_all(video_tags))
+        for key, value in (attributes or {}).items():
+            self.set_attribute(row, key, value)
+        view = InfluencerView(self, row)
+        for index in self._indexes:
+            index.add(view)
+        return view
+
+    def attach(self, index: Any):
+        """
+        Keep another index (e.g. a TagRelevanceModel) in sync with the store.
+        It must provide add(influencer), add_tags(id, tags) and discard_tags(id, tags).
+        """
+        for view in self:
+            index.add(view)
+        self._indexes.append(index)
+
+    def add_influencer(self, influencer: Any) -> "InfluencerView":
+        """Copy an `Influencer` (or any object with the same fields) into the store."""
+        return self.add(influencer.id, influencer.name, influencer.attributes,
+                        influencer.hashtags, influencer.video_tags)
+
+    def extend(self, influencers: Iterable[Any]) -> List["InfluencerView"]:
+        return [self.add_influencer(inf) for inf in influencers]
+
+    def _grow(self):
+        new_capacity = self._capacity * 2
+        for key, (values, present) in self._columns.items():
+            new_values = np.zeros(new_capacity, dtype=values.dtype)
+            new_values[:self._capacity] = values
+            new_present = np.zeros(new_capacity, dtype=bool)
+            new_present[:self._capacity] = present
+            self._columns[key] = (new_values, new_present)
+        self._capacity = new_capacity
+
+    # --- Attributes ---
+
+    def numeric_attributes(self) -> List[str]:
+        return list(self._columns)
+
+    def column(self, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (values, present) for a numeric attribute, both trimmed to the
+        current size. Missing values are 0 in `values` and False in `present`.
+        """
+        col = self._columns.get(key)
+        if col is None:
+            return np.zeros(self._size), np.zeros(self._size, dtype=bool)
+        values, present = col
+        return values[:self._size], present[:self._size]
+
+    def get_attribute(self, row: int, key: str, default: Any = None) -> Any:
+        col = self._columns.get(key)
+        if col is not None and col[1][row]:
+            return col[0][row].item()
+        return self._extra.get(row, {}).get(key, default)
+
+    def set_attribute(self, row: int, key: str, value: Any):
+        if _is_number(value):
+            self._extra.get(row, {}).pop(key, None)
+            values, present = self._ensure_column(key, value)
+            values[row] = value
+            present[row] = True
+            return
+        col = self._columns.get(key)
+        if col is not None:
+            col[1][row] = False
+        self._extra.setdefault(row, {})[key] = value
+
+    def delete_attribute(self, row: int, key: str):
+        col = self._columns.get(key)
+        if col is not None and col[1][row]:
+            col[1][row] = False
+            col[0][row] = 0
+            return
+        extra = self._extra.get(row)
+        if extra is None or key not in extra:
+            raise KeyError(key)
+        del extra[key]
+
+    def attribute_keys(self, row: int) -> List[str]:
+        keys = [key for key, (_, present) in self._columns.items() if present[row]]
+        keys.extend(self._extra.get(row, {}))
+        return keys
+
+    def _ensure_column(self, key: str, value: Any) -> Tuple[np.ndarray, np.ndarray]:
+        dtype = np.float64 if isinstance(value, (float, np.floating)) else np.int64
+        col = self._columns.get(key)
+        if col is None:
+            col = (np.zeros(self._capacity, dtype=dtype), np.zeros(self._capacity, dtype=bool))
+            self._columns[key] = col
+        elif col[0].dtype != np.float64 and dtype == np.float64:
+            # Upcast an integer column the first time a float shows up
+            col = (col[0].astype(np.float64), col[1])
+            self._columns[key] = col
+        return col
+
+    # --- Tags ---
+
+    def tag_id(self, tag: str) -> Optional[int]:
+        """Interned id of `tag`, or None if it has never been seen."""
+        return self._tag_ids.get(tag)
+
+    def tag(self, tag_id: int) -> str:
+        return self._tags[tag_id]
+
+    def _intern(self, tag: str) -> int:
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self._tag_ids[tag] = len(self._tags)
+            self._tags.append(tag)
+        return tag_id
+
+    def _intern_all(self, tags: Iterable[str]) -> array:
+        ids = array("i")
+        seen = set()
+        for tag in tags:
+            tag_id = self._intern(tag)
+            if tag_id not in seen:
+                seen.add(tag_id)
+                ids.append(tag_id)
+        return ids
+
+    def _decode(self, ids: array) -> List[str]:
+        return [self._tags[i] for i in ids]
+
+    def hashtags(self, row: int) -> List[str]:
+        return self._decode(self._hashtags[row])
+
+    def video_tags(self, row: int) -> List[str]:
+        return self._decode(self._video_tags[row])
+
+    def all_tag_ids(self, row: int) -> set:
+        return set(self._hashtags[row]).union(self._video_tags[row])
+
+    def all_tags(self, row: int) -> List[str]:
+        return self._decode(self.all_tag_ids(row))
+
+    def set_hashtags(self, row: int, tags: Iterable[str]):
+        self._set_tags(row, self._hashtags, tags)
+
+    def set_video_tags(self, row: int, tags: Iterable[str]):
+        self._set_tags(row, self._video_tags, tags)
+
+    def _set_tags(self, row: int, column: List[array], tags: Iterable[str]):
+        old_ids = self.all_tag_ids(row)
+        column[row] = self._intern_all(tags)
+        new_ids = self.all_tag_ids(row)
+        influencer_id = self._ids[row]
+        removed, added = self._decode(old_ids - new_ids), self._decode(new_ids - old_ids)
+        for index in self._indexes:
+            index.discard_tags(influencer_id, removed)
+            index.add_tags(influencer_id, added)
+
+
+class InfluencerView:
+    """A row of an `InfluencerStore` that looks like an `Influencer`."""
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: InfluencerStore, row: int):
+        self._store = store
+        self._row = row
+
+    @property
+    def store(self) -> InfluencerStore:
+        return self._store
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    @property
+    def id(self) -> str:
+        return self._store._ids[self._row]
+
+    @property
+    def name(self) -> str:
+        return self._store._names[self._row]
+
+    @property
+    def attributes(self) -> "AttributeView":
+        return AttributeView(self._store, self._row)
+
+    @property
+    def hashtags(self) -> List[str]:
+        return self._store.hashtags(self._row)
+
+    @hashtags.setter
+    def hashtags(self, tags: Iterable[str]):
+        self._store.set_hashtags(self._row, tags)
+
+    @property
+    def video_tags(self) -> List[str]:
+        return self._store.video_tags(self._row)
+
+    @video_tags.setter
+    def video_tags(self, tags: Iterable[str]):
+        self._store.set_video_tags(self._row, tags)
+
+    def all_tags(self) -> List[str]:
+        """Combine all tags for matching."""
+        return self._store.all_tags(self._row)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, InfluencerView) and other._store is self._store and other._row == self._row
+
+    def __hash__(self) -> int:
+        return hash((id(self._store), self._row))
+
+    def __repr__(self) -> str:
+        return (f"InfluencerView(id={self.id!r}, name={self.name!r}, attributes={dict(self.attributes)!r}, "
+                f"hashtags={self.hashtags!r}, video_tags={self.video_tags!r})")
+
+
+class AttributeView(MutableMapping):
+    """Dict-like access to one influencer's attributes inside the store."""
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: InfluencerStore, row: int):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._store.get_attribute(self._row, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        self._store.set_attribute(self._row, key, value)
+
+    def __delitem__(self, key: str):
+        self._store.delete_attribute(self._row, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.attribute_keys(self._row))
+
+    def __len__(self) -> int:
+        return len(self._store.attribute_keys(self._row))
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+_MISSING = object()
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, np.integer, np.floating))
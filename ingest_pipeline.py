@@ -0,0 +1,298 @@
+import os
+import queue
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from matching.download_pool import DownloadPool
+
+_DONE = object()
+
+
+class Stage:
+    """
+    One pipeline step. `func(item)` returns an iterable of output items (a
+    list, a generator or an empty tuple to drop the item); `workers` threads
+    run it, fed by a queue holding at most `queue_size` items.
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Iterable[Any]], workers: int = 1, queue_size: int = 8):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+
+
+class _StageStats:
+    def __init__(self):
+        self.processed = 0
+        self.emitted = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.first_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+
+
+class Pipeline:
+    """
+    Runs stages concurrently with bounded queues in between, so every stage
+    works on a different item at the same time and a slow stage blocks the
+    ones before it (backpressure) instead of letting work pile up.
+
+    An exception in a stage drops that item; it is recorded in `errors` as
+    (stage name, item, exception) and the pipeline carries on.
+    """
+
+    def __init__(self, stages: Sequence[Stage]):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = list(stages)
+        self.errors: List[tuple] = []
+        self._lock = threading.Lock()
+        self._queues: List[queue.Queue] = []
+        self._stats = [_StageStats() for _ in self.stages]
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+
+    def run(self, inputs: Iterable[Any]) -> List[Any]:
+        """Push `inputs` through every stage and return the outputs of the last one."""
+        self._queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        self._started = time.perf_counter()
+        outputs: List[Any] = []
+        remaining = [stage.workers for stage in self.stages]
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index, remaining, outputs),
+                                          name=f"pipeline-{stage.name}-{n}", daemon=True)
+                thread.start()
+                threads.append(thread)
+        for item in inputs:
+            self._queues[0].put(item)
+        for _ in range(self.stages[0].workers):
+            self._queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+        self._finished = time.perf_counter()
+        return outputs
+
+    def _work(self, index: int, remaining: List[int], outputs: List[Any]):
+        stage, stats = self.stages[index], self._stats[index]
+        inbox = self._queues[index]
+        outbox = self._queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            started = time.perf_counter()
+            emitted = 0
+            try:
+                for out in stage.func(item) or ():
+                    emitted += 1
+                    if outbox is None:
+                        with self._lock:
+                            outputs.append(out)
+                    else:
+                        outbox.put(out)
+            except Exception as e:
+                with self._lock:
+                    stats.errors += 1
+                    self.errors.append((stage.name, item, e))
+                print(f"✗ Pipeline stage {stage.name} failed: {e}")
+            finished = time.perf_counter()
+            with self._lock:
+                stats.processed += 1
+                stats.emitted += emitted
+                stats.busy += finished - started
+                stats.first_start = started if stats.first_start is None else min(stats.first_start, started)
+                stats.last_end = finished if stats.last_end is None else max(stats.last_end, finished)
+        # The last worker of a stage tells every worker of the next one to stop
+        with self._lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last and outbox is not None:
+            for _ in range(self.stages[index + 1].workers):
+                outbox.put(_DONE)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-stage throughput (items/sec while active), utilisation and queue depth."""
+        end = self._finished or time.perf_counter()
+        wall = end - self._started if self._started is not None else 0.0
+        with self._lock:
+            stages = {}
+            for index, (stage, stats) in enumerate(zip(self.stages, self._stats)):
+                active = (stats.last_end - stats.first_start) if stats.first_start is not None else 0.0
+                stages[stage.name] = {
+                    "workers": stage.workers,
+                    "processed": stats.processed,
+                    "emitted": stats.emitted,
+                    "errors": stats.errors,
+                    "items_per_sec": stats.processed / active if active > 0 else 0.0,
+                    "utilization": stats.busy / (stage.workers * wall) if wall > 0 else 0.0,
+                    "queue_depth": self._queues[index].qsize() if self._queues else 0,
+                }
+            return {"wall_seconds": wall, "stages": stages}
+
+
+# --- TikTok ingest ---
+
+@dataclass
+class IngestItem:
+    """Work item flowing through the ingest pipeline."""
+    user_url: str
+    influencer: Any = None
+    kind: str = "user"  # user -> video / avatar
+    index: int = 0
+    source_url: str = ""
+    path: Optional[str] = None
+    text: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+
+
+def _username(tiktok_url: str) -> str:
+    match = re.search(r"@([^/?#]+)", tiktok_url)
+    return match.group(1) if match else re.sub(r"\W+", "_", tiktok_url)
+
+
+def ingest_tiktok_users(tiktok_urls: Sequence[str], output_dir: str = None, proxy: str = "http://127.0.0.1:7890",
+                        domain: str = None, posts_per_user: int = 16, since: Any = None, prompt: str = None,
+                        max_new_tokens: int = 1024, index: Any = None, download_workers: int = 4,
+                        download_queue: int = 4, keep_videos: bool = True,
+                        extract: Callable[[str], Any] = None, infer: Callable[[str, str], str] = None,
+                        pool: DownloadPool = None) -> Dict[str, Any]:
+    """
+    Streaming ingest: resolve secUid -> list posts -> download -> frame
+    extraction -> inference -> attach tags to an `Influencer`, with all stages
+    running at once. Downloads run `download_workers` at a time through a
+    DownloadPool; bounded queues (`download_queue`) cap how many downloaded
+    videos wait for the GPU, which bounds disk use. With keep_videos=False a
+    video file is deleted once its tags are attached, or when a later stage
+    fails on it, and is not recorded in "video_paths". A user's latest
+    `posts_per_user` posts (only those newer than `since`, a datetime or unix
+    timestamp, if given) are paged through with the next page prefetched
+    while the current one downloads.
+
+    `index` (a TagIndex / TagRelevanceModel or a list of them) is kept in
+    sync as influencers are created and tagged. `extract(video_path)`
+    pre-decodes frames into the frame cache and `infer(video_path, prompt)`
+    returns the model text; both default to the inference backend (whose
+    `prefetch` decodes where inference runs, or does nothing for backends
+    without a frame cache) and can be replaced (e.g. stubs without a GPU).
+
+    Returns:
+        Dict[str, Any]: {"influencers": [Influencer, ...] in input order,
+            "errors": [(stage, url, message), ...], "stats": per-stage throughput}
+    """
+    from matching.influencer_product_matching import (
+        Influencer, TAG_PROMPT, add_video_tags_to_influencer, parse_video_tags,
+    )
+    from matching.network_tools import download_avatar_image, get_tiktok_sec_user_id, iter_tiktok_user_posts
+
+    output_dir = output_dir or os.getcwd()
+    prompt = prompt or TAG_PROMPT
+    pool = pool or DownloadPool(max_workers=download_workers, per_host=download_workers)
+    if extract is None or infer is None:
+        from matching.inference_backend import get_backend
+    if extract is None:
+        def extract(video_path):
+            get_backend().prefetch(video_path)
+    if infer is None:
+        def infer(video_path, text_prompt):
+            return get_backend().video_to_text(video_path, prompt=text_prompt, max_new_tokens=max_new_tokens)
+    influencers: Dict[str, Any] = {}
+    attach_lock = threading.Lock()
+
+    def resolve(item):
+        sec_user_ids = get_tiktok_sec_user_id(item.user_url, domain)
+        if not sec_user_ids:
+            raise Exception(f"No secUid found for {item.user_url}")
+        item.influencer = Influencer(id=sec_user_ids[0], name=_username(item.user_url), attributes={})
+        with attach_lock:
+            influencers[item.user_url] = item.influencer
+            for idx in (index if isinstance(index, list) else [index] if index is not None else []):
+                idx.add(item.influencer)
+        yield item
+
+    def profile_items(item, profile):
+        item.influencer.attributes["signature"] = profile.get("signature", "")
+        if profile.get("avatarLarger"):
+            yield IngestItem(item.user_url, item.influencer, "avatar", source_url=profile["avatarLarger"])
+
+    def list_posts(item):
+        # Posts are handed to the download stage as they arrive; the first
+        # page also carries the avatar and signature
+        profile: Dict[str, Any] = {}
+        posts = iter_tiktok_user_posts(item.influencer.id, limit=posts_per_user, since=since,
+                                       page_size=min(posts_per_user, 16), domain=domain, profile=profile)
+        count = 0
+        for count, post in enumerate(posts, 1):
+            if count == 1:
+                yield from profile_items(item, profile)
+            yield IngestItem(item.user_url, item.influencer, "video", count - 1, post["video_url"])
+        if count == 0:
+            yield from profile_items(item, profile)
+
+    def download(item):
+        user_dir = os.path.join(output_dir, _username(item.user_url))
+        if item.kind == "avatar":
+            path = download_avatar_image(item.source_url, user_dir, proxy=proxy)
+            item.influencer.attributes["avatar_path"] = path
+            return
+        result = pool.download_one(item.source_url, os.path.join(user_dir, f"tiktok_video_{item.index + 1}.mp4"),
+                                   proxy)
+        if not result.ok:
+            raise Exception(f"Download failed for {item.source_url}: {result.error}")
+        item.path = result.path
+        yield item
+
+    def discard_video(item):
+        if not keep_videos and item.path and os.path.exists(item.path):
+            os.remove(item.path)
+
+    def extract_frames(item):
+        try:
+            extract(item.path)
+        except Exception:
+            # A failed item never reaches attach, so its file is removed here
+            discard_video(item)
+            raise
+        yield item
+
+    def inference(item):
+        try:
+            item.text = infer(item.path, prompt)
+        except Exception:
+            discard_video(item)
+            raise
+        yield item
+
+    def attach(item):
+        try:
+            item.tags = parse_video_tags(item.text or "")
+            with attach_lock:
+                add_video_tags_to_influencer(item.influencer, item.tags, index=index)
+                if keep_videos:
+                    item.influencer.attributes.setdefault("video_paths", []).append(item.path)
+        finally:
+            discard_video(item)
+        yield item
+
+    pipeline = Pipeline([
+        Stage("resolve", resolve, workers=2, queue_size=len(tiktok_urls) or 1),
+        Stage("list_posts", list_posts, workers=2, queue_size=4),
+        Stage("download", download, workers=download_workers, queue_size=min(posts_per_user, 16)),
+        Stage("extract_frames", extract_frames, workers=1, queue_size=download_queue),
+        Stage("inference", inference, workers=1, queue_size=download_queue),
+        Stage("attach", attach, workers=1, queue_size=download_queue),
+    ])
+    pipeline.run(IngestItem(url) for url in tiktok_urls)
+    errors = []
+    for stage, item, error in pipeline.errors:
+        errors.append((stage, item.source_url or item.user_url, str(error)))
+    return {
+        "influencers": [influencers[url] for url in tiktok_urls if url in influencers],
+        "errors": errors,
+        "stats": pipeline.stats(),
+    }
@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobStore:
+    """
+    Persistent job queue in SQLite.
+
+    Jobs move queued -> running -> succeeded/failed. Partial output is appended
+    while a job runs so clients can stream it. Jobs left running by a previous
+    process are put back in the queue when the store is opened.
+    """
+
+    def __init__(self, path: str = "./jobs.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, "
+            "partial TEXT NOT NULL DEFAULT '', result TEXT, error TEXT, "
+            "created REAL NOT NULL, started REAL, finished REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created)")
+        # Work interrupted by a restart starts over
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, partial = '', started = NULL WHERE status = ?", (QUEUED, RUNNING)
+        )
+        self._conn.commit()
+
+    def create(self, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, payload, created) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Move the oldest queued job to running and return it, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, time.time(), row[0])
+            )
+            self._conn.commit()
+        return {"id": row[0], "payload": json.loads(row[1])}
+
+    def append_partial(self, job_id: str, text: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET partial = partial || ? WHERE id = ?", (text, job_id))
+            self._conn.commit()
+
+    def finish(self, job_id: str, result: str):
+        self._close(job_id, SUCCEEDED, result=result)
+
+    def fail(self, job_id: str, error: str):
+        self._close(job_id, FAILED, error=error)
+
+    def _close(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, payload, partial, result, error, created, started, finished "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            queued_ahead = None
+            if row is not None and row[1] == QUEUED:
+                queued_ahead = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created < ?", (QUEUED, row[6])
+                ).fetchone()[0]
+        if row is None:
+            return None
+        job = {
+            "job_id": row[0],
+            "status": row[1],
+            "payload": json.loads(row[2]),
+            "partial": row[3],
+            "result": row[4],
+            "error": row[5],
+            "created": row[6],
+            "started": row[7],
+            "finished": row[8],
+        }
+        if queued_ahead is not None:
+            job["queue_position"] = queued_ahead
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class JobWorker:
+    """
+    Background thread that runs queued jobs one at a time.
+
+    `handler(payload, on_text)` computes the job result; it may call
+    `on_text(chunk)` with partial output, which is buffered and written to the
+    store at most every `flush_interval` seconds.
+    """
+
+    def __init__(self, store: JobStore, handler: Callable[[Dict[str, Any], Callable[[str], None]], str],
+                 poll_interval: float = 0.5, flush_interval: float = 0.25):
+        self.store = store
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.flush_interval = flush_interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="job-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify(self):
+        """Wake the worker after a job was queued."""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            job = self.store.claim()
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        buffer = []
+        last_flush = [time.monotonic()]
+
+        def flush():
+            if buffer:
+                self.store.append_partial(job_id, "".join(buffer))
+                buffer.clear()
+            last_flush[0] = time.monotonic()
+
+        def on_text(chunk: str):
+            buffer.append(chunk)
+            if time.monotonic() - last_flush[0] >= self.flush_interval:
+                flush()
+
+        try:
+            result = self.handler(job["payload"], on_text)
+            flush()
+            self.store.finish(job_id, result)
+        except Exception as e:
+            flush()
+            self.store.fail(job_id, str(e))
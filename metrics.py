@@ -0,0 +1,280 @@
+import math
+import sys
+import threading
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Histogram buckets: latencies in seconds, token counts
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+
+class _Shard:
+    """Values recorded by one thread. Only that thread writes them, so recording takes no lock."""
+
+    __slots__ = ("thread", "values")
+
+    def __init__(self, thread: threading.Thread):
+        self.thread = thread
+        self.values: Dict[Tuple["Metric", tuple], Any] = {}
+
+
+class Metric:
+    """
+    A named metric family. Label values are passed positionally, in the order
+    of `labelnames`; every distinct combination is its own series.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, registry: "Registry", name: str, help: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"name": self.name, "help": self.help, "type": self.kind, "labelnames": self.labelnames}
+
+
+class Counter(Metric):
+    """Monotonic total (e.g. requests, cache hits)."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        values = self.registry._values()
+        key = (self, labels)
+        values[key] = values.get(key, 0.0) + amount
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed `buckets` (upper bounds)."""
+
+    kind = "histogram"
+
+    def __init__(self, registry: "Registry", name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        values = self.registry._values()
+        key = (self, labels)
+        counts = values.get(key)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then the sum
+            counts = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def describe(self) -> Dict[str, Any]:
+        return dict(super().describe(), buckets=self.buckets)
+
+
+class Gauge(Metric):
+    """Current value, usually set by a collector at scrape time (e.g. GPU memory)."""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self.registry._gauges[(self, labels)] = value
+
+
+class Registry:
+    """
+    Process-wide metrics. Counters and histograms are aggregated per thread:
+    each recording thread owns a shard it updates without locking, and
+    `snapshot` sums the shards. Shards of finished threads are folded into
+    one retired shard so short-lived request threads do not pile up.
+    Collectors registered with `register_collector` run on every snapshot
+    to refresh gauges.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._retired: Dict[Tuple[Metric, tuple], Any] = {}
+        self._gauges: Dict[Tuple[Metric, tuple], float] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _values(self) -> Dict[Tuple[Metric, tuple], Any]:
+        try:
+            return self._local.shard.values
+        except AttributeError:
+            shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard.values
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different definition")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, help, labelnames))
+
+    def register_collector(self, collector: Callable[[], None]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    @staticmethod
+    def _add(total: Dict[Tuple[Metric, tuple], Any], key: Tuple[Metric, tuple], value: Any):
+        if isinstance(value, list):
+            current = total.get(key)
+            total[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            total[key] = total.get(key, 0.0) + value
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Current value of every series as plain data (picklable, so inference
+        workers can send theirs to the server): one dict per metric with its
+        description and "samples", a list of (label values, value).
+        """
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live.append(shard)
+                else:
+                    for key, value in shard.values.items():
+                        self._add(self._retired, key, value)
+            self._shards = live
+            total: Dict[Tuple[Metric, tuple], Any] = {}
+            for key, value in self._retired.items():
+                self._add(total, key, value)
+            metrics = list(self._metrics.values())
+        for shard in live:
+            # list() copies the dict in one step, while the owning thread may be adding series
+            for key, value in list(shard.values.items()):
+                self._add(total, key, value)
+        total.update(self._gauges)
+        samples: Dict[str, List[Tuple[tuple, Any]]] = {m.name: [] for m in metrics}
+        for (metric, labels), value in total.items():
+            samples[metric.name].append((labels, value))
+        return [dict(m.describe(), samples=sorted(samples[m.name], key=lambda s: s[0])) for m in metrics]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value))
+    return repr(value)
+
+
+def _series(name: str, labels: Sequence[Tuple[str, Any]], value: float) -> str:
+    if labels:
+        return f'{name}{{{",".join(f"{k}={chr(34)}{_escape(v)}{chr(34)}" for k, v in labels)}}} {_format_value(value)}'
+    return f"{name} {_format_value(value)}"
+
+
+def render(snapshots: Sequence[Tuple[Dict[str, str], List[Dict[str, Any]]]]) -> str:
+    """
+    Prometheus text exposition (format 0.0.4) of one or more snapshots, each
+    with extra labels added to all its series (e.g. {"worker": "0"}).
+    Metrics with the same name are merged under one HELP/TYPE header.
+    """
+    families: Dict[str, Dict[str, Any]] = {}
+    for extra, snapshot in snapshots:
+        for metric in snapshot:
+            family = families.setdefault(metric["name"], {"metric": metric, "series": []})
+            for labels, value in metric["samples"]:
+                family["series"].append((list(zip(metric["labelnames"], labels)) + sorted(extra.items()), value))
+    lines = []
+    for name, family in families.items():
+        metric = family["metric"]
+        lines.append(f"# HELP {name} {_escape(metric['help'])}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in family["series"]:
+            if metric["type"] == "histogram":
+                cumulative = 0
+                for bound, count in zip(list(metric["buckets"]) + [math.inf], value[:-1]):
+                    cumulative += count
+                    le = "+Inf" if math.isinf(bound) else _format_value(float(bound))
+                    lines.append(_series(f"{name}_bucket", labels + [("le", le)], cumulative))
+                lines.append(_series(f"{name}_sum", labels, value[-1]))
+                lines.append(_series(f"{name}_count", labels, cumulative))
+            else:
+                lines.append(_series(name, labels, value))
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def snapshot() -> List[Dict[str, Any]]:
+    return REGISTRY.snapshot()
+
+
+# --- Metrics shared by the inference code and the server ---
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "matching_stage_seconds", "Time spent in each inference stage (see tracing.stage)", ("stage",))
+INPUT_VIDEO_TOKENS = REGISTRY.histogram(
+    "matching_input_video_tokens", "Visual tokens per input video", buckets=TOKEN_BUCKETS)
+INPUT_TOKENS = REGISTRY.histogram(
+    "matching_input_tokens", "Prompt tokens (text and vision, without padding) per generated sequence",
+    buckets=TOKEN_BUCKETS)
+OUTPUT_TOKENS = REGISTRY.histogram(
+    "matching_output_tokens", "Generated tokens per sequence", buckets=TOKEN_BUCKETS)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "matching_cache_lookups_total", "Result and frame cache lookups", ("cache", "result"))
+HTTP_REQUESTS = REGISTRY.counter(
+    "matching_http_requests_total", "HTTP requests by route and status", ("route", "method", "status"))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "matching_http_request_seconds", "HTTP request latency, including streamed bodies", ("route", "method"))
+GPU_MEMORY_ALLOCATED = REGISTRY.gauge(
+    "matching_gpu_memory_allocated_bytes", "GPU memory currently allocated by tensors", ("device",))
+GPU_MEMORY_MAX_ALLOCATED = REGISTRY.gauge(
+    "matching_gpu_memory_max_allocated_bytes", "High-water mark of GPU memory allocated by tensors", ("device",))
+GPU_MEMORY_MAX_RESERVED = REGISTRY.gauge(
+    "matching_gpu_memory_max_reserved_bytes", "High-water mark of GPU memory reserved by the caching allocator",
+    ("device",))
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(1.0, cache, "hit" if hit else "miss")
+
+
+def _collect_gpu_memory():
+    # Only report when this process already uses CUDA; never import torch or create a context here
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_initialized():
+        return
+    for device in range(torch.cuda.device_count()):
+        GPU_MEMORY_ALLOCATED.set(float(torch.cuda.memory_allocated(device)), str(device))
+        GPU_MEMORY_MAX_ALLOCATED.set(float(torch.cuda.max_memory_allocated(device)), str(device))
+        GPU_MEMORY_MAX_RESERVED.set(float(torch.cuda.max_memory_reserved(device)), str(device))
+
+
+REGISTRY.register_collector(_collect_gpu_memory)
@@ -1,9 +1,10 @@
-import requests
-import json
 import re
-import subprocess
 import os
-from typing import List, Dict, Any
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional, Union
+from matching.download_pool import DownloadPool, Runner
+from matching.tiktok_client import run_sync, shared_client
 
 # 全局配置变量
 DEFAULT_DOMAIN = "a10f480ce36a.ngrok-free.app"
@@ -24,42 +25,15 @@ def get_tiktok_sec_user_id(tiktok_url: str, domain: str = None) -> List[str]:
         ['MS4wLjABAAAApam1frHEtkg44uN1CQvup5-y3nfaW1_WBrhLPn124OUbl15DlrsNVEWUSjklRq3h']
     """
     try:
-        # 使用传入的domain或默认domain
-        api_domain = domain or DEFAULT_DOMAIN
-        
         # 提取用户名部分（tiktok.com/后面的参数）
         username_match = re.search(r'tiktok\.com/([^?]+)', tiktok_url)
         if not username_match:
             raise ValueError("Invalid TikTok URL format")
         
-        # 构建完整的API URL
-        api_url = f"https://{api_domain}/api/tiktok/web/get_all_sec_user_id"
-        
-        # 准备请求数据
-        payload = [tiktok_url]
-        
-        # 发送请求
-        headers = {
-            'accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.post(api_url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        
-        # 解析响应
-        result = response.json()
-        
-        # 检查响应状态
-        if result.get('code') == 200:
-            return result.get('data', [])
-        else:
-            raise Exception(f"API returned error code: {result.get('code')}")
+        # 通过共享的异步客户端（连接池复用）发送请求
+        client = shared_client(domain or DEFAULT_DOMAIN)
+        return run_sync(client.get_sec_user_id(tiktok_url))
             
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Network request failed: {str(e)}")
-    except json.JSONDecodeError as e:
-        raise Exception(f"Invalid JSON response: {str(e)}")
     except Exception as e:
         raise Exception(f"Unexpected error: {str(e)}")
 
@@ -74,60 +48,62 @@ def get_tiktok_user_posts(sec_uid: str, cursor: str = "0", count: int = 16, doma
         domain (str): API域名，默认使用全局配置
     
     Returns:
-        Dict[str, Any]: 包含video_urls、avatarLarger、signature等信息的字典
+        Dict[str, Any]: 包含video_urls、avatarLarger、signature等信息的字典，
+            以及下一页的cursor和has_more（翻页请用iter_tiktok_user_posts）
     
     Example:
         >>> get_tiktok_user_posts("MS4wLjABAAAApam1frHEtkg44uN1CQvup5-y3nfaW1_WBrhLPn124OUbl15DlrsNVEWUSjklRq3h")
         {
             "video_urls": ["https://www.tiktok.com/@llaurakam/video/7465340747311631633", ...],
             "avatarLarger": "https://p16-sign-sg.tiktokcdn.com/...",
-            "signature": "kul malaysia 🇲🇾\nIG: @llaurakam 💗\n💌 llaurakam.work@gmail.com"
+            "signature": "kul malaysia 🇲🇾\nIG: @llaurakam 💗\n💌 llaurakam.work@gmail.com",
+            "cursor": "1738000000000",
+            "has_more": True
         }
     """
     try:
-        # 使用传入的domain或默认domain
-        api_domain = domain or DEFAULT_DOMAIN
-        
-        # 构建API URL
-        api_url = f"https://{api_domain}/api/tiktok/web/fetch_user_post_hot_simple"
-        
-        # 准备请求参数
-        params = {
-            'secUid': sec_uid,
-            'cursor': cursor,
-            'count': count,
-            'coverFormat': 2
-        }
-        
-        # 发送请求
-        headers = {
-            'accept': 'application/json'
-        }
-        
-        response = requests.get(api_url, headers=headers, params=params, timeout=30)
-        response.raise_for_status()
-        
-        # 解析响应
-        result = response.json()
-        
-        # 检查响应状态
-        if result.get('code') == 200:
-            data = result.get('data', {})
-            return {
-                'video_urls': data.get('video_urls', []),
-                'avatarLarger': data.get('avatarLarger', ''),
-                'signature': data.get('signature', '')
-            }
-        else:
-            raise Exception(f"API returned error code: {result.get('code')}")
+        # 通过共享的异步客户端（连接池复用）发送请求
+        client = shared_client(domain or DEFAULT_DOMAIN)
+        return run_sync(client.get_user_posts(sec_uid, cursor=cursor, count=count))
             
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Network request failed: {str(e)}")
-    except json.JSONDecodeError as e:
-        raise Exception(f"Invalid JSON response: {str(e)}")
     except Exception as e:
         raise Exception(f"Unexpected error: {str(e)}")
 
+def iter_tiktok_user_posts(sec_uid: str, limit: Optional[int] = None, since: Union[datetime, float, None] = None,
+                           page_size: int = 16, domain: str = None,
+                           profile: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    按cursor逐页遍历用户的帖子（TikTokClient.iter_user_posts的同步版本）
+    
+    下一页在后台事件循环中预取，调用方处理（如下载）当前页时请求已在进行；
+    内存中最多保留两页，与用户帖子总数无关。
+    
+    Args:
+        sec_uid (str): 用户的secUid
+        limit (int): 最多返回的帖子数，默认不限
+        since (datetime | float): 时间下限（datetime或unix时间戳），整页都早于它时停止
+        page_size (int): 每页数量，默认为16
+        domain (str): API域名，默认使用全局配置
+        profile (dict): 若提供，写入第一页的avatarLarger和signature
+    
+    Yields:
+        Dict[str, Any]: {"video_url", "video_id", "create_time"}，create_time为unix时间戳
+    
+    Example:
+        >>> for post in iter_tiktok_user_posts(sec_uid, limit=50, since=datetime(2025, 1, 1)):
+        ...     print(post["video_url"], post["create_time"])
+    """
+    client = shared_client(domain or DEFAULT_DOMAIN)
+    posts = client.iter_user_posts(sec_uid, limit=limit, since=since, page_size=page_size, profile=profile)
+    try:
+        while True:
+            try:
+                yield run_sync(posts.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_sync(posts.aclose())
+
 def download_avatar_image(avatar_url: str, output_dir: str = None, filename: str = None, proxy: str = "http://127.0.0.1:7890") -> str:
     """
     下载并保存头像图片
@@ -166,57 +142,44 @@ def download_avatar_image(avatar_url: str, output_dir: str = None, filename: str
         # 构建完整文件路径
         file_path = os.path.join(output_dir, filename)
         
-        # 设置代理
-        proxies = {
-            'http': proxy,
-            'https': proxy
-        } if proxy else None
-        
-        # 设置请求头
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        
         print(f"Downloading avatar from: {avatar_url}")
         
-        # 下载图片
-        response = requests.get(avatar_url, headers=headers, proxies=proxies, timeout=30)
-        response.raise_for_status()
-        
-        # 保存图片
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
+        # 下载图片（流式写入，复用连接池）
+        run_sync(shared_client(DEFAULT_DOMAIN).download(avatar_url, file_path, proxy=proxy or None))
         
         absolute_path = os.path.abspath(file_path)
         print(f"✓ Avatar saved to: {absolute_path}")
         
         return absolute_path
         
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Failed to download avatar: {str(e)}")
     except Exception as e:
         raise Exception(f"Error saving avatar: {str(e)}")
 
-def download_tiktok_videos(video_urls: List[str], output_dir: str = None, proxy: str = "http://127.0.0.1:7890") -> List[str]:
+def download_tiktok_videos(video_urls: List[str], output_dir: str = None, proxy: str = "http://127.0.0.1:7890",
+                           max_workers: int = 4, per_host: int = 2, retries: int = 2,
+                           runner: Runner = None, pool: DownloadPool = None) -> List[str]:
     """
-    使用yt-dlp从TikTok视频URL列表下载视频
+    使用yt-dlp从TikTok视频URL列表并发下载视频
     
     Args:
         video_urls (List[str]): TikTok视频URL列表
         output_dir (str): 输出目录，默认为当前目录
         proxy (str): 代理设置，默认为"http://127.0.0.1:7890"
+        max_workers (int): 同时进行的下载数
+        per_host (int): 同一主机同时进行的下载数
+        retries (int): 失败后的重试次数（指数退避）
+        runner (Runner): 替换subprocess.run的执行函数（如测试用的假yt-dlp）
+        pool (DownloadPool): 复用已有的下载池（共享并发限制和统计），忽略上面的并发参数
     
     Returns:
-        List[str]: 下载成功的视频文件的绝对路径列表
+        List[str]: 下载成功的视频文件的绝对路径列表（保持输入顺序）
     
     Example:
         >>> urls = ["https://www.tiktok.com/@user/video/1234567890"]
         >>> downloaded_files = download_tiktok_videos(urls)
         >>> print(downloaded_files)
-        ['/path/to/video1.mp4', '/path/to/video2.mp4']
+        ['/path/to/tiktok_video_1.mp4', '/path/to/tiktok_video_2.mp4']
     """
-    downloaded_files = []
-    
     # 设置输出目录
     if output_dir is None:
         output_dir = os.getcwd()
@@ -224,44 +187,26 @@ def download_tiktok_videos(video_urls: List[str], output_dir: str = None, proxy:
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
     
-    for i, url in enumerate(video_urls):
-        try:
-            print(f"Downloading video {i+1}/{len(video_urls)}: {url}")
-            
-            # 构建输出文件名
-            output_filename = os.path.join(output_dir, f"tiktok_video_{i+1}.%(ext)s")
-            
-            # 构建yt-dlp命令
-            cmd = [
-                'yt-dlp',
-                '--proxy', proxy,
-                '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                '-o', output_filename,
-                url
-            ]
-            
-            # 执行下载命令
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
-            if result.returncode == 0:
-                # 查找下载的文件
-                for file in os.listdir(output_dir):
-                    if file.startswith(f"tiktok_video_{i+1}.") and file.endswith(('.mp4', '.webm', '.mkv')):
-                        file_path = os.path.join(output_dir, file)
-                        downloaded_files.append(os.path.abspath(file_path))
-                        print(f"✓ Successfully downloaded: {file}")
-                        break
-                else:
-                    print(f"⚠ Warning: Could not find downloaded file for video {i+1}")
-            else:
-                print(f"✗ Failed to download video {i+1}: {result.stderr}")
-                
-        except subprocess.TimeoutExpired:
-            print(f"✗ Timeout downloading video {i+1}")
-        except Exception as e:
-            print(f"✗ Error downloading video {i+1}: {str(e)}")
+    if pool is None:
+        pool = DownloadPool(max_workers=max_workers, per_host=per_host, retries=retries, runner=runner)
+    
+    # 文件名固定为 tiktok_video_{i}.mp4（yt-dlp 统一 remux 为 mp4），无需扫描目录
+    output_paths = [os.path.join(output_dir, f"tiktok_video_{i+1}.mp4") for i in range(len(video_urls))]
     
-    print(f"\nDownload summary: {len(downloaded_files)}/{len(video_urls)} videos downloaded successfully")
+    def report(i, result):
+        if result.ok:
+            print(f"✓ Successfully downloaded video {i+1}/{len(video_urls)}: {os.path.basename(result.path)}")
+        else:
+            print(f"✗ Failed to download video {i+1} after {result.attempts} attempt(s): {result.error}")
+    
+    started = time.perf_counter()
+    results = pool.download(video_urls, output_paths, proxy=proxy, on_result=report)
+    elapsed = time.perf_counter() - started
+    downloaded_files = [result.path for result in results if result.ok]
+    
+    total_bytes = sum(result.bytes for result in results)
+    print(f"\nDownload summary: {len(downloaded_files)}/{len(video_urls)} videos downloaded successfully "
+          f"in {elapsed:.1f}s ({total_bytes / 1024 / 1024 / max(elapsed, 1e-9):.2f} MB/s)")
     return downloaded_files
 
 def process_tiktok_user(tiktok_url: str, output_dir: str = None, proxy: str = "http://127.0.0.1:7890", domain: str = None) -> Dict[str, Any]:
@@ -368,17 +313,9 @@ def get_tiktok_sec_user_id_batch(tiktok_urls: List[str], domain: str = None) ->
             "https://www.tiktok.com/@user2": ["sec_user_id_2"]
         }
     """
-    results = {}
-    
-    for url in tiktok_urls:
-        try:
-            sec_user_ids = get_tiktok_sec_user_id(url, domain)
-            results[url] = sec_user_ids
-        except Exception as e:
-            results[url] = []
-            print(f"Error processing {url}: {str(e)}")
-    
-    return results
+    # 按批合并为少量 get_all_sec_user_id 请求（失败的URL映射为空列表）
+    client = shared_client(domain or DEFAULT_DOMAIN)
+    return run_sync(client.get_sec_user_ids(tiktok_urls))
 
 # 测试函数
 if __name__ == "__main__":
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+# Decoder phases
+KEY = "key"
+FREE_VALUE = "free_value"
+ENUM_VALUE = "enum_value"
+DONE = "done"
+
+
+class KeyValueSchema:
+    """
+    Output made of fixed `Key: Value` lines in a fixed order (prompt "3").
+    A field with `values` only accepts one of them; other values are free text
+    up to the end of the line.
+    """
+
+    def __init__(self, fields: Sequence[Dict[str, Any]]):
+        self.fields = [{"key": f["key"], "values": list(f.get("values") or [])} for f in fields]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": "key_value", "fields": self.fields}
+
+    def parse(self, text: str) -> Dict[str, Optional[str]]:
+        """Map each key to its (stripped) value, None when the line is missing."""
+        parsed: Dict[str, Optional[str]] = {f["key"]: None for f in self.fields}
+        keys = {f["key"].lower(): f["key"] for f in self.fields}
+        for line in text.splitlines():
+            key, sep, value = line.partition(":")
+            key = keys.get(key.strip().strip("*- ").lower())
+            if sep and key is not None and parsed[key] is None:
+                parsed[key] = value.strip().strip("*").strip()
+        return parsed
+
+    def is_complete(self, text: str) -> bool:
+        return all(v is not None for v in self.parse(text).values())
+
+
+class ChoiceSchema:
+    """Output made of `count` lines, each one of `options` (prompt "4")."""
+
+    def __init__(self, options: Sequence[str], count: int = 1):
+        self.options = list(options)
+        self.count = count
+        self._lookup = {_fold(o): o for o in self.options}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": "choice", "count": self.count, "options": self.options}
+
+    def parse(self, text: str) -> List[str]:
+        """Options found in the text (one per line, in order, deduplicated)."""
+        chosen: List[str] = []
+        for line in text.splitlines():
+            option = self._lookup.get(_fold(re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line)))
+            if option is not None and option not in chosen:
+                chosen.append(option)
+        return chosen[:self.count]
+
+    def is_complete(self, text: str) -> bool:
+        return len(self.parse(text)) >= self.count
+
+
+def schema_from_dict(spec: Optional[Dict[str, Any]]):
+    """Build a schema from its prompts.json form, or None."""
+    if not spec:
+        return None
+    if spec.get("type") == "key_value":
+        return KeyValueSchema(spec["fields"])
+    if spec.get("type") == "choice":
+        return ChoiceSchema(spec["options"], spec.get("count", 1))
+    raise ValueError(f"Unknown output schema type: {spec.get('type')}")
+
+
+def schema_fingerprint(schema) -> str:
+    """Stable id of a schema, for cache keys."""
+    return hashlib.sha256(json.dumps(schema.to_dict(), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _fold(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().strip("*").strip()).lower()
+
+
+# --- Token-level decoding automaton ---
+
+class TokenTable:
+    """
+    Per-tokenizer token classes used by the decoder: line-ending tokens
+    (only newlines and blanks) and tokens allowed inside a free-text value
+    (no newline, not special). Building one decodes the whole vocabulary, so
+    `video_to_text.load_model` builds the model's table up front.
+    """
+
+    def __init__(self, tokenizer):
+        special = set(tokenizer.all_special_ids)
+        self.vocab_size = len(tokenizer)
+        self.newline_ids: Set[int] = set()
+        self.free_ids: List[int] = []
+        ids = [token_id for token_id in range(self.vocab_size) if token_id not in special]
+        backend = getattr(tokenizer, "backend_tokenizer", None)
+        if backend is not None:
+            # Fast tokenizers decode the whole vocabulary in one (parallel) Rust call
+            texts = backend.decode_batch([[token_id] for token_id in ids], skip_special_tokens=False)
+        else:
+            texts = [tokenizer.decode([token_id]) for token_id in ids]
+        for token_id, text in zip(ids, texts):
+            if "\n" in text:
+                if not text.strip(" \t\r\n"):
+                    self.newline_ids.add(token_id)
+            elif text:
+                self.free_ids.append(token_id)
+
+
+_token_tables: Dict[int, TokenTable] = {}
+
+
+def token_table(tokenizer) -> TokenTable:
+    table = _token_tables.get(id(tokenizer))
+    if table is None:
+        table = _token_tables[id(tokenizer)] = TokenTable(tokenizer)
+    return table
+
+
+class _TrieNode:
+    __slots__ = ("children", "terminal", "options")
+
+    def __init__(self):
+        self.children: Dict[int, "_TrieNode"] = {}
+        self.terminal: Optional[int] = None
+        self.options: Set[int] = set()
+
+
+def _build_trie(sequences: Iterable[List[int]]) -> _TrieNode:
+    root = _TrieNode()
+    for index, tokens in enumerate(sequences):
+        node = root
+        node.options.add(index)
+        for token in tokens:
+            node = node.children.setdefault(token, _TrieNode())
+            node.options.add(index)
+        node.terminal = index
+    return root
+
+
+class DecoderState:
+    __slots__ = ("field", "phase", "pos", "node", "value_len", "chosen")
+
+    def __init__(self, field: int, phase: str, node: Optional[_TrieNode] = None):
+        self.field = field
+        self.phase = phase
+        self.pos = 0
+        self.node = node
+        self.value_len = 0
+        self.chosen: Set[int] = set()
+
+
+class SchemaDecoder:
+    """
+    Finite-state decoder for a schema over a tokenizer's vocabulary.
+
+    `allowed(state)` returns either FREE (any free-text token, plus line
+    endings once the value is non-empty) or an explicit list of token ids;
+    `advance(state, token_id)` consumes the sampled token, updating the state
+    in place (and returning it). Keys are forced
+    token by token, enum values and choice options follow a token trie, and
+    once the schema is complete only end-of-sequence tokens are allowed, so
+    generation stops right there.
+    """
+
+    FREE = "free"
+
+    def __init__(self, schema, tokenizer, eos_token_ids: Sequence[int]):
+        self.schema = schema
+        self.table = token_table(tokenizer)
+        self.eos_ids = list(eos_token_ids)
+
+        def encode(text: str) -> List[int]:
+            return tokenizer.encode(text, add_special_tokens=False)
+
+        if isinstance(schema, KeyValueSchema):
+            self.key_tokens = [encode(f"{f['key']}:") for f in schema.fields]
+            self.value_tries = [
+                _build_trie(encode(f" {v}") for v in f["values"]) if f["values"] else None
+                for f in schema.fields
+            ]
+        else:
+            self.option_trie = _build_trie(encode(o) for o in schema.options)
+
+    def initial_state(self) -> DecoderState:
+        if isinstance(self.schema, KeyValueSchema):
+            return DecoderState(0, KEY)
+        return DecoderState(0, ENUM_VALUE, self.option_trie)
+
+    def is_done(self, state: DecoderState) -> bool:
+        return state.phase == DONE
+
+    def _last_item(self, state: DecoderState) -> bool:
+        if isinstance(self.schema, KeyValueSchema):
+            return state.field == len(self.schema.fields) - 1
+        return len(state.chosen) + 1 >= self.schema.count
+
+    def allowed(self, state: DecoderState):
+        if state.phase == DONE:
+            return list(self.eos_ids)
+        if state.phase == KEY:
+            return [self.key_tokens[state.field][state.pos]]
+        if state.phase == FREE_VALUE:
+            return self.FREE
+        allowed = [t for t, child in state.node.children.items() if child.options - state.chosen]
+        if state.node.terminal is not None and state.node.terminal not in state.chosen:
+            allowed.extend(self.table.newline_ids)
+            if self._last_item(state):
+                allowed.extend(self.eos_ids)
+        return allowed
+
+    def line_end_ids(self, state: DecoderState) -> List[int]:
+        """Tokens that may end a free-text value in addition to FREE tokens."""
+        if state.value_len == 0:
+            return []
+        ids = list(self.table.newline_ids)
+        if self._last_item(state):
+            ids.extend(self.eos_ids)
+        return ids
+
+    def advance(self, state: DecoderState, token_id: int) -> DecoderState:
+        if state.phase == DONE:
+            return state
+        if state.phase == KEY:
+            state.pos += 1
+            if state.pos == len(self.key_tokens[state.field]):
+                trie = self.value_tries[state.field]
+                state.phase = ENUM_VALUE if trie is not None else FREE_VALUE
+                state.node = trie
+                state.pos = 0
+                state.value_len = 0
+            return state
+        ends_line = token_id in self.table.newline_ids or token_id in self.eos_ids
+        if state.phase == FREE_VALUE:
+            if ends_line and state.value_len > 0:
+                return self._next_item(state, token_id)
+            state.value_len += 1
+            return state
+        # ENUM_VALUE (key/value enum or choice option)
+        child = state.node.children.get(token_id)
+        if child is not None:
+            state.node = child
+            return state
+        if ends_line and state.node.terminal is not None:
+            if not isinstance(self.schema, KeyValueSchema):
+                state.chosen.add(state.node.terminal)
+            return self._next_item(state, token_id)
+        return state
+
+    def _next_item(self, state: DecoderState, token_id: int) -> DecoderState:
+        # Updates `state` in place, like every other transition
+        if isinstance(self.schema, KeyValueSchema):
+            if token_id in self.eos_ids or state.field == len(self.schema.fields) - 1:
+                state.phase = DONE
+                return state
+            state.field += 1
+            state.phase = KEY
+            state.pos = 0
+            state.node = None
+            state.value_len = 0
+            return state
+        if token_id in self.eos_ids or len(state.chosen) >= self.schema.count:
+            state.phase = DONE
+            return state
+        state.node = self.option_trie
+        return state
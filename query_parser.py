@@ -0,0 +1,234 @@
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from matching.ranking import RangeFilter
+
+# Attribute names users type -> influencer attribute keys
+ATTRIBUTE_ALIASES = {
+    "预算": "budget",
+    "budget": "budget",
+    "粉丝数": "followers",
+    "粉丝": "followers",
+    "followers": "followers",
+    "fans": "followers",
+    "曝光量": "exposure",
+    "曝光": "exposure",
+    "exposure": "exposure",
+    "views": "exposure",
+}
+
+UNIT_MULTIPLIERS = {
+    "k": 1e3, "千": 1e3,
+    "w": 1e4, "万": 1e4,
+    "m": 1e6, "百万": 1e6,
+    "亿": 1e8,
+}
+
+_NUMBER = r"(\d+(?:\.\d+)?)\s*(百万|千|万|亿|[kwm](?![a-z]))?"
+_CJK = r"㐀-䶿一-鿿豈-﫿"
+
+
+@dataclass(frozen=True)
+class CompiledQuery:
+    """A parsed search query: tags to match plus numeric attribute predicates."""
+    text: str
+    tags: Tuple[str, ...]
+    filters: Tuple[RangeFilter, ...] = ()
+
+
+class QueryCompiler:
+    """
+    Compile free-form search input ("美妆彩妆 预算10000以上") into a CompiledQuery.
+
+    - numeric constraints (以上/以下/between/x-y, k/w/万 suffixes) on known
+      attributes become RangeFilter predicates;
+    - hashtags are normalised ('#MakeUp' -> 'makeup');
+    - runs of CJK characters are segmented by forward maximum matching against
+      the tag vocabulary (falling back to jieba when installed and no vocabulary
+      is set), so "美妆彩妆" yields ["美妆", "彩妆"]. `sync_vocabulary` loads
+      the tags of a TagIndex lazily, at compile time (see `compile_query`).
+    Compiled queries are kept in an LRU cache keyed by the raw input text.
+    """
+
+    def __init__(self, vocabulary: Iterable[str] = (), attribute_aliases: Optional[Dict[str, str]] = None,
+                 cache_size: int = 1024):
+        self.attribute_aliases = {k.lower(): v for k, v in (attribute_aliases or ATTRIBUTE_ALIASES).items()}
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, CompiledQuery]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # (id, vocabulary_version) of the TagIndex the vocabulary was last loaded from
+        self._vocabulary_source = None
+        aliases = "|".join(re.escape(a) for a in sorted(self.attribute_aliases, key=len, reverse=True))
+        self._range_re = re.compile(
+            rf"(?P<attr>{aliases})\s*(?:between\s+)?{_NUMBER}\s*(?:-|~|～|到|至|and|to)\s*{_NUMBER}",
+            re.IGNORECASE)
+        self._compare_re = re.compile(
+            rf"(?P<attr>{aliases})\s*(?P<op>>=|<=|>|<|=|:|：|≥|≤)?\s*{_NUMBER}\s*(?P<dir>及以上|以上|以下|以内|之内|起|\+)?",
+            re.IGNORECASE)
+        self.set_vocabulary(vocabulary)
+
+    def set_vocabulary(self, vocabulary: Iterable[str]):
+        """Replace the segmentation vocabulary (e.g. TagIndex.tags()); clears the cache."""
+        words = {normalize_hashtag(w) for w in vocabulary}
+        words.discard("")
+        with self._lock:
+            self._vocabulary = words
+            self._max_word_len = max((len(w) for w in words), default=0)
+            self._vocabulary_source = None
+            self._cache.clear()
+
+    def sync_vocabulary(self, index: Any):
+        """
+        Use the tags of `index` (a TagIndex) as the vocabulary. The tags are
+        reloaded in one pass, and the cache cleared, only when the index's
+        tag set changed since the last sync.
+        """
+        source = (id(index), index.vocabulary_version)
+        with self._lock:
+            if self._vocabulary_source == source:
+                return
+            words = {normalize_hashtag(w) for w in index.tags()}
+            words.discard("")
+            if words != self._vocabulary:
+                self._vocabulary = words
+                self._max_word_len = max((len(w) for w in words), default=0)
+                self._cache.clear()
+            self._vocabulary_source = source
+
+    def add_words(self, vocabulary: Iterable[str]):
+        """Add words to the segmentation vocabulary; clears the cache when any is new."""
+        words = {normalize_hashtag(w) for w in vocabulary}
+        words.discard("")
+        with self._lock:
+            words -= self._vocabulary
+            if not words:
+                return
+            self._vocabulary = self._vocabulary | words
+            self._max_word_len = max(self._max_word_len, max(len(w) for w in words))
+            self._cache.clear()
+
+    def compile(self, text: str) -> CompiledQuery:
+        with self._lock:
+            compiled = self._cache.get(text)
+            if compiled is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        compiled = self._compile(text)
+        with self._lock:
+            self._cache[text] = compiled
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return compiled
+
+    def cache_info(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "max_size": self.cache_size}
+
+    def _compile(self, text: str) -> CompiledQuery:
+        filters: List[RangeFilter] = []
+
+        def take_range(m):
+            key = self.attribute_aliases[m.group("attr").lower()]
+            low, high = _number(m.group(2), m.group(3)), _number(m.group(4), m.group(5))
+            filters.append(RangeFilter(key, min=min(low, high), max=max(low, high)))
+            return " "
+
+        def take_compare(m):
+            key = self.attribute_aliases[m.group("attr").lower()]
+            value = _number(m.group(3), m.group(4))
+            op, direction = m.group("op") or "", m.group("dir") or ""
+            if op in (">=", ">", "≥") or direction in ("及以上", "以上", "起", "+"):
+                filters.append(RangeFilter(key, min=value))
+            elif op in ("<=", "<", "≤") or direction in ("以下", "以内", "之内"):
+                filters.append(RangeFilter(key, max=value))
+            else:
+                filters.append(RangeFilter(key, min=value, max=value))
+            return " "
+
+        rest = self._range_re.sub(take_range, text)
+        rest = self._compare_re.sub(take_compare, rest)
+
+        tags: List[str] = []
+        for token in re.split(r"[\s,，;；、/|]+", rest):
+            token = normalize_hashtag(token)
+            if not token:
+                continue
+            for piece in re.findall(rf"[{_CJK}]+|[^{_CJK}]+", token):
+                if re.match(rf"[{_CJK}]", piece):
+                    tags.extend(self._segment(piece))
+                else:
+                    tags.append(piece)
+        return CompiledQuery(text=text, tags=tuple(dict.fromkeys(tags)), filters=tuple(filters))
+
+    def _segment(self, text: str) -> List[str]:
+        vocabulary, max_word_len = self._vocabulary, self._max_word_len
+        if not vocabulary:
+            return _jieba_cut(text)
+        words, unknown, i = [], "", 0
+        while i < len(text):
+            for size in range(min(max_word_len, len(text) - i), 0, -1):
+                if text[i:i + size] in vocabulary:
+                    if unknown:
+                        words.append(unknown)
+                        unknown = ""
+                    words.append(text[i:i + size])
+                    i += size
+                    break
+            else:
+                unknown += text[i]
+                i += 1
+        if unknown:
+            words.append(unknown)
+        return words
+
+
+def normalize_hashtag(tag: str) -> str:
+    """'#MakeUp' -> 'makeup'."""
+    return tag.strip().lstrip("#").strip().lower()
+
+
+def _number(digits: str, unit: Optional[str]) -> float:
+    value = float(digits) * UNIT_MULTIPLIERS.get((unit or "").lower(), 1.0)
+    return int(value) if value.is_integer() else value
+
+
+def _jieba_cut(text: str) -> List[str]:
+    try:
+        import jieba
+    except ImportError:
+        return [text]
+    return [w for w in jieba.lcut(text) if w.strip()]
+
+
+default_compiler = QueryCompiler()
+
+# One compiler per TagIndex, so each index segments queries with its own tags
+_index_compilers: "weakref.WeakKeyDictionary[Any, QueryCompiler]" = weakref.WeakKeyDictionary()
+_index_compilers_lock = threading.Lock()
+
+
+def compiler_for_index(index: Any) -> QueryCompiler:
+    """Return the compiler bound to `index` (a TagIndex), synced with its current tags."""
+    with _index_compilers_lock:
+        compiler = _index_compilers.get(index)
+        if compiler is None:
+            compiler = _index_compilers[index] = QueryCompiler()
+    compiler.sync_vocabulary(index)
+    return compiler
+
+
+def compile_query(text: str, compiler: Optional[QueryCompiler] = None, index: Any = None) -> CompiledQuery:
+    """
+    Compile `text` with the given compiler. Without one, the compiler bound to
+    `index` is used when an index is given, else the module default.
+    """
+    if compiler is None:
+        compiler = compiler_for_index(index) if index is not None else default_compiler
+    return compiler.compile(text)
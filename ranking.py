@@ -0,0 +1,154 @@
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from matching.influencer_store import InfluencerStore, InfluencerView
+
+
+@dataclass(frozen=True)
+class RangeFilter:
+    """
+    Range predicate on a numeric attribute, e.g. RangeFilter("budget", min=10000)
+    for "预算10000以上". Bounds are inclusive; influencers without the attribute
+    never match.
+    """
+    key: str
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+    def mask(self, values: np.ndarray, present: np.ndarray) -> np.ndarray:
+        mask = present.copy()
+        if self.min is not None:
+            mask &= values >= self.min
+        if self.max is not None:
+            mask &= values <= self.max
+        return mask
+
+
+@dataclass(frozen=True)
+class FlagFilter:
+    """
+    Bitmask predicate on an integer attribute (e.g. the "flags" and "categories"
+    columns written by `matching.video_attributes`): every bit of `all_of` set,
+    at least one bit of `any_of` set (when non-zero) and no bit of `none_of` set.
+    """
+    key: str
+    all_of: int = 0
+    any_of: int = 0
+    none_of: int = 0
+
+    def mask(self, values: np.ndarray, present: np.ndarray) -> np.ndarray:
+        bits = values.astype(np.int64)
+        mask = present.copy()
+        if self.all_of:
+            mask &= (bits & self.all_of) == self.all_of
+        if self.any_of:
+            mask &= (bits & self.any_of) != 0
+        if self.none_of:
+            mask &= (bits & self.none_of) == 0
+        return mask
+
+
+@dataclass(frozen=True)
+class EnumFilter:
+    """Membership predicate on an enum-coded integer attribute (e.g. "language")."""
+    key: str
+    codes: Tuple[int, ...]
+
+    def mask(self, values: np.ndarray, present: np.ndarray) -> np.ndarray:
+        return present & np.isin(values.astype(np.int64), self.codes)
+
+
+Filter = Union[RangeFilter, FlagFilter, EnumFilter]
+
+
+def apply_filters(influencers: Sequence[Any], filters: Iterable[Filter]) -> List[Any]:
+    """Keep the influencers that satisfy every filter, preserving input order."""
+    mask = np.ones(len(influencers), dtype=bool)
+    for flt in filters:
+        values, present = _column(influencers, flt.key)
+        mask &= flt.mask(values, present)
+    return [influencers[int(i)] for i in np.flatnonzero(mask)]
+
+
+def rank_influencers(influencers: Union[Sequence[Any], InfluencerStore], sort_key: str, reverse: bool = True,
+                     top_k: Optional[int] = None, filters: Iterable[Filter] = ()) -> List[Any]:
+    """
+    Filter influencers by numeric range / bitmask / enum predicates and return the top_k by sort_key.
+
+    Filters are evaluated as vectorized masks over the attribute columns and the
+    top_k rows are found with a partial selection, so only the selected rows are
+    fully sorted. Missing sort values count as 0 and ties keep the input order,
+    i.e. the result equals `sort_influencers(filtered, sort_key, reverse)[:top_k]`.
+    Args:
+        influencers: A list of influencers (or store views) or an InfluencerStore.
+        sort_key (str): Numeric attribute to rank by (e.g. 'followers').
+        reverse (bool): Highest first when True.
+        top_k (int, optional): Number of results; all matches when None.
+        filters (Iterable[Filter]): Predicates combined with AND.
+    Returns:
+        List: The ranked influencers (views when given a store).
+    """
+    size = len(influencers)
+    mask = np.ones(size, dtype=bool)
+    for flt in filters:
+        values, present = _column(influencers, flt.key)
+        mask &= flt.mask(values, present)
+    candidates = np.flatnonzero(mask)
+
+    values, _ = _column(influencers, sort_key)
+    keys = values[candidates].astype(np.float64)
+    if reverse:
+        keys = -keys
+    if top_k is not None and top_k < len(candidates):
+        if top_k <= 0:
+            return []
+        selected = _partial_select(keys, top_k)
+        candidates, keys = candidates[selected], keys[selected]
+    # Candidates are in input order, so a stable sort keeps ties in input order
+    order = candidates[np.argsort(keys, kind="stable")]
+
+    if isinstance(influencers, InfluencerStore):
+        return [influencers[int(row)] for row in order]
+    return [influencers[int(i)] for i in order]
+
+
+def _partial_select(keys: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the k smallest keys, resolving ties at the cut-off in favour of
+    earlier positions (matching a stable sort). Returned in ascending position order.
+    """
+    threshold = keys[np.argpartition(keys, k - 1)[k - 1]]
+    below = np.flatnonzero(keys < threshold)
+    equal = np.flatnonzero(keys == threshold)[:k - len(below)]
+    return np.sort(np.concatenate([below, equal]))
+
+
+def _column(influencers: Union[Sequence[Any], InfluencerStore], key: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(values, present) for `key` aligned with `influencers`; missing values are 0."""
+    if isinstance(influencers, InfluencerStore):
+        return influencers.column(key)
+    store = _common_store(influencers)
+    if store is not None:
+        values, present = store.column(key)
+        rows = np.fromiter((inf.row for inf in influencers), dtype=np.int64, count=len(influencers))
+        return values[rows], present[rows]
+    raw = [inf.attributes.get(key) for inf in influencers]
+    present = np.fromiter((_is_number(v) for v in raw), dtype=bool, count=len(raw))
+    values = np.fromiter((v if ok else 0 for v, ok in zip(raw, present)), dtype=np.float64, count=len(raw))
+    return values, present
+
+
+def _common_store(influencers: Sequence[Any]) -> Optional[InfluencerStore]:
+    """The store all items are views of, if any."""
+    if not influencers or not isinstance(influencers[0], InfluencerView):
+        return None
+    store = influencers[0].store
+    if all(isinstance(inf, InfluencerView) and inf.store is store for inf in influencers):
+        return store
+    return None
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, np.integer, np.floating)) and value == value
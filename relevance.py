@@ -0,0 +1,168 @@
+import math
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+
+class TagRelevanceModel:
+    """
+    BM25 relevance model over influencer tags.
+
+    Each influencer is a document whose terms are its `all_tags()` (binary term
+    frequency). Document frequencies and document lengths are kept up to date
+    incrementally through `add_tags` / `discard_tags`, the same interface as
+    `TagIndex`, so the model can be passed wherever an index is maintained.
+    Query-time scoring is a sparse matrix/vector product over the columns of
+    the query tags; rows changed since the matrix was last built are scored
+    directly and the matrix is rebuilt once enough of them pile up.
+    """
+
+    def __init__(self, influencers: Iterable[Any] = (), k1: float = 1.2, b: float = 0.75,
+                 rebuild_ratio: float = 0.01):
+        self.k1 = k1
+        self.b = b
+        self.rebuild_ratio = rebuild_ratio
+        self._vocab: Dict[str, int] = {}
+        self._df = np.zeros(0, dtype=np.int64)
+        self._influencers: List[Any] = []
+        self._row_of: Dict[str, int] = {}
+        self._doc_tags: List[Set[int]] = []
+        self._doc_len = np.zeros(0, dtype=np.float64)
+        self._total_len = 0
+        self._live = 0
+        # Binary doc-term matrix as of the last build, plus rows changed since
+        self._matrix = sparse.csc_matrix((0, 0), dtype=np.float64)
+        self._pending: Set[int] = set()
+        for inf in influencers:
+            self.add(inf)
+
+    def __len__(self) -> int:
+        return self._live
+
+    # --- Incremental maintenance ---
+
+    def add(self, influencer: Any):
+        """Register an influencer and count all of its current tags."""
+        if influencer.id in self._row_of:
+            self.remove(influencer.id)
+        row = len(self._influencers)
+        self._influencers.append(influencer)
+        self._row_of[influencer.id] = row
+        self._doc_tags.append(set())
+        if row >= len(self._doc_len):
+            self._doc_len = _grow(self._doc_len, row + 1)
+        self._live += 1
+        self._pending.add(row)
+        self.add_tags(influencer.id, influencer.all_tags())
+
+    def remove(self, influencer_id: str):
+        """Drop an influencer; its row stays allocated but scores 0."""
+        row = self._row_of.pop(influencer_id, None)
+        if row is None:
+            return
+        self._discard_ids(row, set(self._doc_tags[row]))
+        self._influencers[row] = None
+        self._live -= 1
+
+    def add_tags(self, influencer_id: str, tags: Iterable[str]):
+        row = self._row_of[influencer_id]
+        doc = self._doc_tags[row]
+        added = 0
+        for tag in tags:
+            term = self._term(tag)
+            if term not in doc:
+                doc.add(term)
+                self._df[term] += 1
+                added += 1
+        if added:
+            self._doc_len[row] += added
+            self._total_len += added
+            self._pending.add(row)
+
+    def discard_tags(self, influencer_id: str, tags: Iterable[str]):
+        row = self._row_of[influencer_id]
+        terms = {self._vocab[t] for t in tags if t in self._vocab}
+        self._discard_ids(row, terms & self._doc_tags[row])
+
+    def _discard_ids(self, row: int, terms: Set[int]):
+        if not terms:
+            return
+        self._doc_tags[row] -= terms
+        for term in terms:
+            self._df[term] -= 1
+        self._doc_len[row] -= len(terms)
+        self._total_len -= len(terms)
+        self._pending.add(row)
+
+    def _term(self, tag: str) -> int:
+        term = self._vocab.get(tag)
+        if term is None:
+            term = self._vocab[tag] = len(self._vocab)
+            if term >= len(self._df):
+                self._df = _grow(self._df, term + 1)
+        return term
+
+    def rebuild(self):
+        """Rebuild the doc-term matrix from the current tag sets."""
+        rows = len(self._influencers)
+        lengths = np.fromiter((len(d) for d in self._doc_tags), dtype=np.int64, count=rows)
+        indptr = np.zeros(rows + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.fromiter((t for d in self._doc_tags for t in d), dtype=np.int32, count=int(indptr[-1]))
+        data = np.ones(len(indices), dtype=np.float64)
+        self._matrix = sparse.csr_matrix((data, indices, indptr), shape=(rows, len(self._vocab))).tocsc()
+        self._pending.clear()
+
+    # --- Scoring ---
+
+    def idf(self, tag: str) -> float:
+        term = self._vocab.get(tag)
+        df = int(self._df[term]) if term is not None else 0
+        return math.log(1.0 + (self._live - df + 0.5) / (df + 0.5))
+
+    def search(self, user_tags: Iterable[str], top_k: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """
+        Rank influencers by BM25 relevance of their tags to user_tags.
+        Args:
+            user_tags (Iterable[str]): Query tags, e.g. the output of filter_user_input.
+            top_k (int, optional): Number of results; all influencers with a
+                positive score when None.
+        Returns:
+            List[Tuple[Any, float]]: (influencer, score) pairs, best first; ties
+            keep catalogue order.
+        """
+        terms = sorted({self._vocab[t] for t in user_tags if t in self._vocab})
+        if not terms or not self._live:
+            return []
+        if len(self._pending) > self.rebuild_ratio * len(self._influencers):
+            self.rebuild()
+
+        df = self._df[terms].astype(np.float64)
+        weights = np.log1p((self._live - df + 0.5) / (df + 0.5))
+        built_terms = [i for i, t in enumerate(terms) if t < self._matrix.shape[1]]
+        overlap = np.zeros(len(self._influencers))
+        if built_terms:
+            columns = self._matrix[:, [terms[i] for i in built_terms]]
+            overlap[:self._matrix.shape[0]] = columns @ weights[built_terms]
+        if self._pending:
+            weight_of = dict(zip(terms, weights))
+            for row in self._pending:
+                overlap[row] = sum(weight_of.get(t, 0.0) for t in self._doc_tags[row])
+
+        # Removed rows have no tags left, so they never get a positive overlap
+        rows = np.flatnonzero(overlap > 0)
+        avg_len = self._total_len / self._live if self._live else 1.0
+        norm = 1.0 - self.b + self.b * self._doc_len[rows] / max(avg_len, 1e-9)
+        scores = overlap[rows] * (self.k1 + 1.0) / (1.0 + self.k1 * norm)
+
+        order = np.argsort(-scores, kind="stable")
+        if top_k is not None:
+            order = order[:max(top_k, 0)]
+        return [(self._influencers[rows[i]], float(scores[i])) for i in order]
+
+
+def _grow(values: np.ndarray, min_size: int) -> np.ndarray:
+    grown = np.zeros(max(min_size, 2 * len(values), 16), dtype=values.dtype)
+    grown[:len(values)] = values
+    return grown
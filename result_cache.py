@@ -0,0 +1,141 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that do not change which video a URL points to
+TRACKING_PARAMS = {"is_from_webapp", "sender_device", "sender_web_id", "lang", "_r", "_t", "share_app_id"}
+
+_fingerprints: Dict[Tuple[str, int, int], str] = {}
+_fingerprints_lock = threading.Lock()
+
+
+def canonical_url(url: str) -> str:
+    """Lowercase scheme/host, drop the fragment and tracking parameters, sort the rest."""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k not in TRACKING_PARAMS and not k.startswith("utm_"))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), urlencode(query), ""))
+
+
+def video_fingerprint(video_url: str) -> str:
+    """
+    sha256 identifying a video: of the canonical URL for http(s) paths, of the
+    file bytes for local files. File hashes are memoised by (path, size, mtime)
+    so a video is only read once per process.
+    """
+    if video_url.startswith("http"):
+        return hashlib.sha256(canonical_url(video_url).encode("utf-8")).hexdigest()
+    path = os.path.abspath(video_url)
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns)
+    with _fingerprints_lock:
+        digest = _fingerprints.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with _fingerprints_lock:
+            _fingerprints[memo_key] = digest
+    return digest
+
+
+class ResultCache:
+    """
+    Persistent SQLite cache of generated text, keyed by
+    (video fingerprint, prompt hash, max_new_tokens, model path).
+    Least recently used entries are evicted once the stored results exceed
+    `max_bytes`. The stored size is kept as a running total, summed once at
+    open and updated on every insert and eviction, so writes do not rescan
+    the table. Hit/miss counters are kept per process.
+    """
+
+    def __init__(self, path: str = "./cache/video_to_text.sqlite", max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self._conn.commit()
+        self._bytes = self._stored_bytes()
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    @staticmethod
+    def make_key(video_url: str, prompt: str, max_new_tokens: int, model_path: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        raw = "\0".join([video_fingerprint(video_url), prompt_hash, str(max_new_tokens), model_path])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, result: str):
+        size = len(result.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, result, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, result, size, now, now),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            oldest = self._conn.execute(
+                "SELECT key, size FROM results ORDER BY last_access LIMIT 64").fetchall()
+            if not oldest:
+                self._bytes = 0
+                break
+            for key, size in oldest:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._bytes -= size
+                if self._bytes <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            total = self._bytes
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
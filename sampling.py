@@ -0,0 +1,206 @@
+import hashlib
+import json
+import math
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Sampling used before per-prompt policies, and still the default
+DEFAULT_FPS = 1.0
+DEFAULT_MAX_PIXELS = 360 * 420
+# Visual tokens one video may take when its policy sets no budget (0 = unbounded, the legacy sampling)
+DEFAULT_VISUAL_TOKEN_BUDGET = int(os.environ.get("MATCHING_VISUAL_TOKEN_BUDGET", 0))
+# Qwen2.5-VL: one token per 28x28 pixels (14px patches merged 2x2), two frames per temporal patch
+PATCH = 28
+FRAME_FACTOR = 2
+
+
+class SamplingPolicy:
+    """
+    How frames are taken from a video for one prompt (the "sampling" entry
+    of a prompt in prompts.json).
+
+    Candidate frames are decoded at `fps` and `max_pixels` (at most
+    `max_candidates`, by default 4 x `max_frames` with keyframes). Of those,
+    `max_frames` are kept: evenly spaced, or with `keyframes` the strongest
+    scene changes (mean thumbnail difference to the previous frame of at
+    least `scene_threshold`, 0..1) plus frames filling the largest gaps in
+    the timeline. If the video is still above `max_visual_tokens` (None =
+    DEFAULT_VISUAL_TOKEN_BUDGET, 0 = unbounded), fewer frames are kept, down
+    to `min_frames`, and then the frames are downscaled.
+
+    Raises ValueError for a non-positive `fps`, `max_pixels`, `max_frames` or
+    `max_candidates`, a negative `max_visual_tokens` or `min_frames`, or a
+    `scene_threshold` outside 0..1.
+    """
+
+    def __init__(self, fps: float = DEFAULT_FPS, max_pixels: int = DEFAULT_MAX_PIXELS,
+                 max_frames: Optional[int] = None, keyframes: bool = False, scene_threshold: float = 0.1,
+                 max_visual_tokens: Optional[int] = None, min_frames: int = 4, max_candidates: Optional[int] = None):
+        self.fps = float(fps)
+        self.max_pixels = int(max_pixels)
+        self.max_frames = None if max_frames is None else int(max_frames)
+        self.keyframes = bool(keyframes)
+        self.scene_threshold = float(scene_threshold)
+        self.max_visual_tokens = None if max_visual_tokens is None else int(max_visual_tokens)
+        self.max_candidates = None if max_candidates is None else int(max_candidates)
+        for name in ("fps", "max_pixels", "max_frames", "max_candidates"):
+            value = getattr(self, name)
+            if value is not None and not value > 0:
+                raise ValueError(f"Sampling option {name} must be positive, got {value}")
+        for name, value in (("max_visual_tokens", self.max_visual_tokens), ("min_frames", int(min_frames))):
+            if value is not None and value < 0:
+                raise ValueError(f"Sampling option {name} must not be negative, got {value}")
+        if not 0 <= self.scene_threshold <= 1:
+            raise ValueError(f"Sampling option scene_threshold must be within 0..1, got {self.scene_threshold}")
+        self.min_frames = max(FRAME_FACTOR, int(min_frames))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"fps": self.fps, "max_pixels": self.max_pixels, "max_frames": self.max_frames,
+                "keyframes": self.keyframes, "scene_threshold": self.scene_threshold,
+                "max_visual_tokens": self.max_visual_tokens, "min_frames": self.min_frames,
+                "max_candidates": self.max_candidates}
+
+    @property
+    def budget(self) -> int:
+        """Visual token budget of one video, 0 when unbounded."""
+        return DEFAULT_VISUAL_TOKEN_BUDGET if self.max_visual_tokens is None else self.max_visual_tokens
+
+    @property
+    def candidate_limit(self) -> Optional[int]:
+        """Most frames to decode, None for every frame at `fps`."""
+        if self.max_candidates:
+            return self.max_candidates
+        if self.keyframes and self.max_frames:
+            return 4 * self.max_frames
+        return None
+
+    def video_element(self, video_url: str) -> Dict[str, Any]:
+        """The video entry of a chat message, as read by `process_vision_info`."""
+        element = {"type": "video", "video": video_url, "max_pixels": self.max_pixels, "fps": self.fps}
+        if self.candidate_limit:
+            element["max_frames"] = self.candidate_limit
+        return element
+
+
+DEFAULT_POLICY = SamplingPolicy()
+
+
+def sampling_from_dict(spec: Optional[Dict[str, Any]]) -> Optional[SamplingPolicy]:
+    """Build a policy from its prompts.json form, or None."""
+    if not spec:
+        return None
+    unknown = set(spec) - set(SamplingPolicy().to_dict())
+    if unknown:
+        raise ValueError(f"Unknown sampling options: {sorted(unknown)}")
+    return SamplingPolicy(**spec)
+
+
+def sampling_fingerprint(policy: SamplingPolicy) -> str:
+    """Stable id of a policy, for cache keys."""
+    return hashlib.sha256(json.dumps(policy.to_dict(), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def visual_tokens(frames: int, height: int, width: int) -> int:
+    """Visual tokens of `frames` frames of height x width pixels."""
+    return max(1, math.ceil(frames / FRAME_FACTOR)) * max(1, height // PATCH) * max(1, width // PATCH)
+
+
+def scene_scores(frames) -> List[float]:
+    """
+    Per-frame scene change score of a (T, C, H, W) tensor with 0..255 values:
+    mean absolute difference (0..1) between 16x16 grayscale thumbnails of
+    the frame and the previous one; 0 for the first frame.
+    """
+    import torch
+    gray = frames.float().mean(dim=1, keepdim=True)
+    thumbs = torch.nn.functional.adaptive_avg_pool2d(gray, 16).flatten(1)
+    diffs = (thumbs[1:] - thumbs[:-1]).abs().mean(dim=1) / 255.0
+    return [0.0] + diffs.tolist()
+
+
+def select_keyframes(scores: Sequence[float], count: int, threshold: float) -> List[int]:
+    """
+    Indices of `count` frames: the first one, up to half of the slots for the
+    strongest scene changes (score >= threshold), and the rest placed in the
+    middle of the largest gaps so the whole video stays covered.
+    """
+    total = len(scores)
+    if count >= total:
+        return list(range(total))
+    selected = {0}
+    cuts = sorted((i for i in range(1, total) if scores[i] >= threshold), key=lambda i: -scores[i])
+    slots = max(0, count // 2 - 1)
+    for i in cuts:
+        if slots == 0:
+            break
+        # A change spread over neighbouring frames is one cut
+        if all(abs(i - j) > 1 for j in selected):
+            selected.add(i)
+            slots -= 1
+    while len(selected) < count:
+        ordered = sorted(selected)
+        # (distance to the nearest selected frame, index) of the best frame in each gap
+        best = (total - 1 - ordered[-1], total - 1)
+        for a, b in zip(ordered, ordered[1:]):
+            best = max(best, ((b - a) // 2, (a + b) // 2))
+        if best[0] == 0:
+            break
+        selected.add(best[1])
+    return sorted(selected)
+
+
+def evenly_spaced(total: int, count: int) -> List[int]:
+    if count >= total:
+        return list(range(total))
+    if count <= 1:
+        return [0]
+    return [round(i * (total - 1) / (count - 1)) for i in range(count)]
+
+
+def apply_policy(policy: SamplingPolicy, frames,
+                 video_kwargs: Dict[str, Any]) -> Tuple[Any, Dict[str, Any], Dict[str, Any]]:
+    """
+    Reduce decoded candidate frames (a (T, C, H, W) tensor) to the policy's
+    frame budget and visual token budget.
+
+    Returns:
+        (frames, video_kwargs, info): the kept frames, video_kwargs with the
+            effective fps of the kept frames, and {"candidates", "frames",
+            "height", "width", "visual_tokens"}.
+    """
+    total, _, height, width = frames.shape
+    count = min(total, policy.max_frames or total)
+    budget = policy.budget
+    if budget:
+        fit = FRAME_FACTOR * (budget // (max(1, height // PATCH) * max(1, width // PATCH)))
+        count = min(count, max(fit, min(policy.min_frames, total)))
+    if count < total:
+        # Frames go to the model in temporal pairs
+        count = max(FRAME_FACTOR, count - count % FRAME_FACTOR)
+        if policy.keyframes:
+            indices = select_keyframes(scene_scores(frames), count, policy.scene_threshold)
+        else:
+            indices = evenly_spaced(total, count)
+        frames = frames[indices]
+        fps = video_kwargs.get("fps")
+        if fps is not None:
+            scale = len(indices) / total
+            video_kwargs = dict(video_kwargs, fps=[f * scale for f in fps] if isinstance(fps, list) else fps * scale)
+    count = frames.shape[0]
+    if budget and visual_tokens(count, height, width) > budget:
+        import torch
+        scale = math.sqrt(budget / visual_tokens(count, height, width))
+        new_height = max(PATCH, int(height * scale) // PATCH * PATCH)
+        new_width = max(PATCH, int(width * scale) // PATCH * PATCH)
+        while visual_tokens(count, new_height, new_width) > budget and max(new_height, new_width) > PATCH:
+            if new_height >= new_width:
+                new_height -= PATCH
+            else:
+                new_width -= PATCH
+        frames = torch.nn.functional.interpolate(
+            frames.float(), size=(new_height, new_width), mode="bicubic", align_corners=False, antialias=True,
+        ).clamp_(0, 255).to(frames.dtype)
+        height, width = new_height, new_width
+    info = {"candidates": total, "frames": count, "height": height, "width": width,
+            "visual_tokens": visual_tokens(count, height, width)}
+    return frames, video_kwargs, info
@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import time
+
+from matching.output_schema import ChoiceSchema, schema_from_dict
+from matching.sampling import SamplingPolicy, sampling_from_dict
+from matching.video_attributes import load_batch_results, parse_attributes
+
+# batch_results.json 中视频所在目录（与 batch_curl_requests.py 相同）
+BASE_PATH = "/media/tangshi/AI001/data/gc"
+# Parsed prompt "3" attributes compared with the baseline
+ATTRIBUTES = ("skin_tone", "gender", "ethnicity", "language", "flags")
+
+
+def load_prompt(prompt_id: str) -> dict:
+    with open(os.path.join(os.path.dirname(__file__), "prompts.json"), "r", encoding="utf-8") as f:
+        return json.load(f)[str(prompt_id)]
+
+
+def run_variant(policy: SamplingPolicy, videos: list, prompt: str, schema, max_new_tokens: int) -> list:
+    """
+    Answer `prompt` for every (name, path) in `videos` with one sampling
+    policy. Frames come from the frame cache when possible, so the timing
+    covers prefill and decode only.
+    """
+    from matching import video_to_text as vtt
+    _, processor = vtt.load_model()
+    rows = []
+    for name, path in videos:
+        messages = vtt.build_messages(path, prompt, policy)
+        _, video_inputs, video_kwargs = vtt.process_video(messages, path, use_cache=True, sampling=policy)
+        text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        started = time.perf_counter()
+        output = vtt.generate_texts([text], None, video_inputs, video_kwargs, max_new_tokens, schemas=[schema])[0]
+        rows.append({
+            "video": name,
+            "frames": int(video_inputs[0].shape[0]),
+            "visual_tokens": vtt.estimate_video_tokens(video_inputs[0]),
+            "generate_seconds": time.perf_counter() - started,
+            "result": output,
+        })
+        print(f"  {name}: {rows[-1]['frames']} frames, {rows[-1]['visual_tokens']} visual tokens, "
+              f"{rows[-1]['generate_seconds']:.2f}s")
+    return rows
+
+
+def score_attributes(rows: list, baseline: dict) -> dict:
+    """Per-attribute agreement of prompt "3" answers with the baseline answers."""
+    matched = {key: 0 for key in ATTRIBUTES}
+    compared = {key: 0 for key in ATTRIBUTES}
+    for row in rows:
+        expected = baseline.get(row["video"])
+        if expected is None:
+            continue
+        parsed = parse_attributes(row["result"] or "")
+        for key in ATTRIBUTES:
+            if key in expected:
+                compared[key] += 1
+                matched[key] += int(parsed.get(key) == expected[key])
+    accuracy = {key: matched[key] / compared[key] for key in ATTRIBUTES if compared[key]}
+    accuracy["overall"] = sum(matched.values()) / max(1, sum(compared.values()))
+    return accuracy
+
+
+def score_agreement(rows: list, reference: list, schema) -> dict:
+    """Agreement with reference answers: overlap of chosen options for choice prompts, else exact match."""
+    expected = {row["video"]: row["result"] for row in reference}
+    scores = []
+    for row in rows:
+        if row["video"] not in expected:
+            continue
+        if isinstance(schema, ChoiceSchema):
+            ours, theirs = set(schema.parse(row["result"])), set(schema.parse(expected[row["video"]]))
+            scores.append(len(ours & theirs) / max(1, schema.count))
+        else:
+            scores.append(float(row["result"].strip() == expected[row["video"]].strip()))
+    return {"overall": sum(scores) / len(scores) if scores else 0.0}
+
+
+def summarize(rows: list) -> dict:
+    count = max(1, len(rows))
+    return {
+        "videos": len(rows),
+        "mean_frames": sum(r["frames"] for r in rows) / count,
+        "mean_visual_tokens": sum(r["visual_tokens"] for r in rows) / count,
+        "max_visual_tokens": max((r["visual_tokens"] for r in rows), default=0),
+        "mean_generate_seconds": sum(r["generate_seconds"] for r in rows) / count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Accuracy and visual-token cost of frame sampling policies. Every video of the baseline "
+                    "file is answered with the legacy sampling (all frames at 1 fps, no token budget), with the "
+                    "prompt's sampling and proposed_sampling from prompts.json and with any --policy given. Prompt 3 answers are scored "
+                    "against batch_results.json; other prompts against the legacy sampling's answers.")
+    parser.add_argument("--video-dir", default=BASE_PATH, help="Directory holding the baseline videos")
+    parser.add_argument("--baseline", default=os.path.join(os.path.dirname(__file__), "batch_results.json"))
+    parser.add_argument("--prompt-id", default="3")
+    parser.add_argument("--policy", action="append", default=[], help="Extra policy as JSON (repeatable)")
+    parser.add_argument("--max-new-tokens", type=int, default=1024)
+    parser.add_argument("--output", default="sampling_benchmark.json")
+    args = parser.parse_args()
+
+    prompt_entry = load_prompt(args.prompt_id)
+    schema = schema_from_dict(prompt_entry.get("schema"))
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        names = list(json.load(f))
+    videos = [(name, os.path.join(args.video_dir, name)) for name in names]
+    missing = [path for _, path in videos if not os.path.exists(path)]
+    if missing:
+        print(f"Skipping {len(missing)} missing videos: {missing}")
+    videos = [(name, path) for name, path in videos if os.path.exists(path)]
+    if not videos:
+        raise Exception(f"No baseline videos found in {args.video_dir}")
+
+    variants = [("legacy", SamplingPolicy(max_visual_tokens=0))]
+    if prompt_entry.get("sampling"):
+        variants.append((f"prompt_{args.prompt_id}", sampling_from_dict(prompt_entry["sampling"])))
+    if prompt_entry.get("proposed_sampling"):
+        variants.append((f"proposed_{args.prompt_id}", sampling_from_dict(prompt_entry["proposed_sampling"])))
+    for i, spec in enumerate(args.policy):
+        variants.append((f"policy_{i + 1}", sampling_from_dict(json.loads(spec))))
+
+    baseline = load_batch_results(args.baseline) if args.prompt_id == "3" else None
+    report = {}
+    legacy_rows = None
+    for name, policy in variants:
+        print(f"[{name}] {policy.to_dict()}")
+        rows = run_variant(policy, videos, prompt_entry["prompt"], schema, args.max_new_tokens)
+        legacy_rows = legacy_rows or rows
+        accuracy = score_attributes(rows, baseline) if baseline is not None else \
+            score_agreement(rows, legacy_rows, schema)
+        report[name] = {"policy": policy.to_dict(), **summarize(rows), "accuracy": accuracy, "rows": rows}
+
+    print(f"\n{'variant':<12} {'frames':>7} {'tokens':>8} {'max tok':>8} {'gen s':>7}  accuracy")
+    for name, entry in report.items():
+        accuracy = ", ".join(f"{k}={v:.2f}" for k, v in entry["accuracy"].items())
+        print(f"{name:<12} {entry['mean_frames']:>7.1f} {entry['mean_visual_tokens']:>8.0f} "
+              f"{entry['max_visual_tokens']:>8} {entry['mean_generate_seconds']:>7.2f}  {accuracy}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nReport saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+# 1. Encoders (pluggable; anything with `dim` and `encode(texts) -> (n, dim) array`)
+class HashingEncoder:
+    """
+    Deterministic offline encoder: hashes character n-grams of each tag into a
+    fixed-size vector. It has no notion of meaning across languages, but it is
+    stable across processes, which makes it the stub for tests.
+    """
+
+    def __init__(self, dim: int = 256, ngram_range: Tuple[int, int] = (1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.name = f"hashing-{dim}-{ngram_range[0]}-{ngram_range[1]}"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        lo, hi = self.ngram_range
+        for i, text in enumerate(texts):
+            text = normalize_tag(text)
+            for n in range(lo, hi + 1):
+                for j in range(len(text) - n + 1):
+                    digest = hashlib.md5(text[j:j + n].encode("utf-8")).digest()
+                    bucket = int.from_bytes(digest[:4], "little") % self.dim
+                    vectors[i, bucket] += 1.0 if digest[4] & 1 else -1.0
+        return _normalize_rows(vectors)
+
+
+class SentenceTransformerEncoder:
+    """Local CPU sentence-embedding model (requires `sentence-transformers`)."""
+
+    def __init__(self, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2", device: str = "cpu"):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode([normalize_tag(t) for t in texts], convert_to_numpy=True)
+        return _normalize_rows(vectors.astype(np.float32))
+
+
+def normalize_tag(tag: str) -> str:
+    """'#MakeupTutorial' -> 'makeup tutorial'."""
+    tag = tag.strip().lstrip("#")
+    tag = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", tag)
+    return re.sub(r"[_\s]+", " ", tag).lower()
+
+
+# 2. Memory-mapped float16 embedding matrix
+class EmbeddingMatrix:
+    """
+    Row-per-influencer float16 embedding matrix, memory-mapped from `path`
+    (kept in RAM when path is None). Capacity doubles as rows are appended.
+
+    With a path, the row count and a caller-defined key per row (`keys`) are
+    saved by `flush` to a sidecar file `<path>.json`, so reopening the matrix
+    restores its rows. The data file is only ever grown, never truncated.
+    """
+
+    def __init__(self, dim: int, path: Optional[str] = None, capacity: int = 1024):
+        self.dim = dim
+        self.path = path
+        self.size = 0
+        # Key of each row (e.g. influencer id and tag fingerprint), persisted with the rows
+        self.keys: List[Any] = []
+        if path is not None and os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["dim"] != dim:
+                raise ValueError(f"{path} holds {meta['dim']}-dim embeddings, expected {dim}")
+            self.size = int(meta["size"])
+            self.keys = list(meta.get("keys", []))[:self.size]
+            self.keys += [None] * (self.size - len(self.keys))
+        self._data = self._allocate(max(1, capacity, self.size))
+
+    @property
+    def meta_path(self) -> str:
+        return f"{self.path}.json"
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if self.path is None:
+            return np.zeros((capacity, self.dim), dtype=np.float16)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        row_bytes = self.dim * 2
+        if not os.path.exists(self.path):
+            return np.memmap(self.path, dtype=np.float16, mode="w+", shape=(capacity, self.dim))
+        # Map the file at its existing length, extending it when more rows are needed
+        capacity = max(capacity, os.path.getsize(self.path) // row_bytes)
+        if os.path.getsize(self.path) < capacity * row_bytes:
+            with open(self.path, "r+b") as f:
+                f.truncate(capacity * row_bytes)
+        return np.memmap(self.path, dtype=np.float16, mode="r+", shape=(capacity, self.dim))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, vector: np.ndarray, key: Any = None) -> int:
+        if self.size == len(self._data):
+            if isinstance(self._data, np.memmap):
+                self._data.flush()
+                self._data = self._allocate(2 * len(self._data))
+            else:
+                grown = np.zeros((2 * len(self._data), self.dim), dtype=np.float16)
+                grown[:self.size] = self._data[:self.size]
+                self._data = grown
+        self._data[self.size] = vector
+        self.keys.append(key)
+        self.size += 1
+        return self.size - 1
+
+    def __setitem__(self, row: int, vector: np.ndarray):
+        self._data[row] = vector
+
+    def rows(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """float32 copy of the given rows (all rows when None), for exact scoring."""
+        if rows is None:
+            return np.asarray(self._data[:self.size], dtype=np.float32)
+        return np.asarray(self._data[rows], dtype=np.float32)
+
+    def flush(self):
+        """Write the rows, then the row count and keys (rows past the saved count are ignored on reopen)."""
+        if not isinstance(self._data, np.memmap):
+            return
+        self._data.flush()
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "size": self.size, "keys": self.keys}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+
+
+# 3. IVF approximate nearest neighbour index
+class IVFIndex:
+    """
+    Inverted-file ANN index: rows are assigned to the nearest of `nlist`
+    k-means centroids, and a query only visits the `nprobe` closest lists.
+    """
+
+    def __init__(self, nlist: int = 256, nprobe: int = 8, iterations: int = 10, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        # row -> (list it is in, position in that list), for O(1) swap-removal on reassignment
+        self._assignment: Dict[int, Tuple[int, int]] = {}
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray, sample_size: int = 100000):
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > sample_size:
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        k = min(self.nlist, len(vectors))
+        centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+        for _ in range(self.iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(k):
+                members = vectors[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize_rows(centroids)
+        self.centroids = centroids
+        self._lists = [[] for _ in range(k)]
+        self._assignment = {}
+
+    def add(self, rows: Iterable[int], vectors: np.ndarray):
+        assign = np.argmax(vectors @ self.centroids.T, axis=1)
+        for row, c in zip(rows, assign):
+            c = int(c)
+            old = self._assignment.get(row)
+            if old is not None:
+                if old[0] == c:
+                    continue
+                members, position = self._lists[old[0]], old[1]
+                last = members.pop()
+                if last != row:
+                    members[position] = last
+                    self._assignment[last] = (old[0], position)
+            self._assignment[row] = (c, len(self._lists[c]))
+            self._lists[c].append(row)
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        nearest = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        rows = [row for c in nearest for row in self._lists[c]]
+        return np.asarray(sorted(rows), dtype=np.int64)
+
+
+# 4. Semantic matcher
+class SemanticMatcher:
+    """
+    Embedding-based influencer matching.
+
+    Each influencer's tag set is embedded once (mean of its tag embeddings,
+    with per-tag vectors cached) and stored in an `EmbeddingMatrix`. With a
+    `path`, rows saved by `flush()` are reused across processes: an added
+    influencer whose stored row has the same tags and encoder is not embedded
+    again, and its row is overwritten when they differ. Queries
+    are answered through an `IVFIndex` once `train()` has been called (exact
+    brute force before that), and candidates are re-ranked with exact cosine
+    similarity. The matcher also implements add / add_tags / discard_tags, so
+    it can be attached to an `InfluencerStore` or passed as an index to
+    `add_video_tags_to_influencer`.
+    """
+
+    def __init__(self, encoder: Any = None, path: Optional[str] = None, nlist: int = 256, nprobe: int = 8):
+        self.encoder = encoder or HashingEncoder()
+        self.matrix = EmbeddingMatrix(self.encoder.dim, path)
+        self.ann = IVFIndex(nlist=nlist, nprobe=nprobe)
+        self._tag_vectors: Dict[str, np.ndarray] = {}
+        # Rows restored from disk stay None until their influencer is added again
+        self._influencers: List[Any] = [None] * len(self.matrix)
+        self._row_of: Dict[str, int] = {}
+        self._stored_row: Dict[str, int] = {key[0]: row for row, key in enumerate(self.matrix.keys) if key}
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def _embed_tags(self, tags: List[str]) -> np.ndarray:
+        missing = [t for t in set(tags) if t not in self._tag_vectors]
+        if missing:
+            for tag, vector in zip(missing, self.encoder.encode(missing)):
+                self._tag_vectors[tag] = vector
+        if not tags:
+            return np.zeros(self.encoder.dim, dtype=np.float32)
+        mean = np.mean([self._tag_vectors[t] for t in tags], axis=0)
+        return _normalize_rows(mean[None, :])[0]
+
+    def _fingerprint(self, tags: List[str]) -> str:
+        text = "\n".join([getattr(self.encoder, "name", type(self.encoder).__name__)] + sorted(tags))
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def add(self, influencer: Any):
+        tags = influencer.all_tags()
+        key = [influencer.id, self._fingerprint(tags)]
+        row = self._row_of.get(influencer.id)
+        if row is None:
+            row = self._stored_row.pop(influencer.id, None)
+        if row is not None and self.matrix.keys[row] == key:
+            vector = self.matrix.rows([row])[0]
+        else:
+            vector = self._embed_tags(tags)
+            if row is None:
+                row = self.matrix.append(vector, key)
+                self._influencers.append(None)
+            else:
+                self.matrix[row] = vector
+                self.matrix.keys[row] = key
+        self._influencers[row] = influencer
+        self._row_of[influencer.id] = row
+        if self.ann.trained:
+            self.ann.add([row], vector[None, :])
+
+    def add_tags(self, influencer_id: str, tags: Iterable[str]):
+        self._refresh(influencer_id)
+
+    def discard_tags(self, influencer_id: str, tags: Iterable[str]):
+        self._refresh(influencer_id)
+
+    def _refresh(self, influencer_id: str):
+        row = self._row_of.get(influencer_id)
+        if row is not None:
+            self.add(self._influencers[row])
+
+    def train(self):
+        """Train the IVF index on the current embeddings and assign all rows."""
+        vectors = self.matrix.rows()
+        if not len(vectors):
+            return
+        self.ann.train(vectors)
+        self.ann.add(range(len(vectors)), vectors)
+        self.matrix.flush()
+
+    def flush(self):
+        """Persist the embeddings (only with a path)."""
+        self.matrix.flush()
+
+    def search(self, user_tags: List[str], top_k: int = 20) -> List[Tuple[Any, float]]:
+        """
+        Return the top_k influencers by cosine similarity between the query tags
+        and their tag sets, as (influencer, score) pairs, best first.
+        """
+        if not user_tags or not len(self.matrix):
+            return []
+        query = self._embed_tags(list(user_tags))
+        if self.ann.trained:
+            rows = self.ann.candidates(query)
+            scores = self.matrix.rows(rows) @ query
+        else:
+            rows = np.arange(len(self.matrix))
+            scores = self.matrix.rows() @ query
+        # Skip restored rows whose influencer has not been added in this process
+        live = np.fromiter((self._influencers[r] is not None for r in rows), dtype=bool, count=len(rows))
+        rows, scores = rows[live], scores[live]
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [(self._influencers[rows[i]], float(scores[i])) for i in order]
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
@@ -0,0 +1,100 @@
+from typing import Any, Dict, Iterable, List, Set
+
+
+class TagIndex:
+    """
+    Inverted index from tag to the ids of the influencers that carry it.
+
+    The index is kept up to date incrementally (see `add_video_tags_to_influencer`
+    and `set_influencer_hashtags`), so a lookup only touches the posting lists of
+    the query tags instead of scanning the whole catalogue. `vocabulary_version`
+    changes whenever a tag gains its first or loses its last influencer, so a
+    QueryCompiler can reload `tags()` only when the vocabulary changed.
+    """
+
+    def __init__(self, influencers: Iterable[Any] = ()):
+        self._postings: Dict[str, Set[str]] = {}
+        self._influencers: Dict[str, Any] = {}
+        # Insertion order of each id, used to return matches in catalogue order
+        self._order: Dict[str, int] = {}
+        self._next_order = 0
+        self.vocabulary_version = 0
+        for inf in influencers:
+            self.add(inf)
+
+    def __len__(self) -> int:
+        return len(self._influencers)
+
+    def __contains__(self, influencer_id: str) -> bool:
+        return influencer_id in self._influencers
+
+    def get(self, influencer_id: str) -> Any:
+        """Return the indexed influencer with the given id, or None."""
+        return self._influencers.get(influencer_id)
+
+    def add(self, influencer: Any):
+        """Register an influencer and index all of its current tags."""
+        if influencer.id in self._influencers:
+            self.remove(influencer.id)
+        self._influencers[influencer.id] = influencer
+        self._order[influencer.id] = self._next_order
+        self._next_order += 1
+        self.add_tags(influencer.id, influencer.all_tags())
+
+    def remove(self, influencer_id: str):
+        """Drop an influencer and all of its postings."""
+        influencer = self._influencers.pop(influencer_id, None)
+        if influencer is None:
+            return
+        del self._order[influencer_id]
+        self.discard_tags(influencer_id, influencer.all_tags())
+
+    def add_tags(self, influencer_id: str, tags: Iterable[str]):
+        """
+        Add `influencer_id` to the posting list of each tag. The influencer
+        must have been registered with `add` first.
+        """
+        if influencer_id not in self._influencers:
+            raise KeyError(f"Influencer {influencer_id} is not in the index; add() it first")
+        for tag in tags:
+            posting = self._postings.get(tag)
+            if posting is None:
+                posting = self._postings[tag] = set()
+                self.vocabulary_version += 1
+            posting.add(influencer_id)
+
+    def discard_tags(self, influencer_id: str, tags: Iterable[str]):
+        """Remove `influencer_id` from the posting list of each tag."""
+        for tag in tags:
+            posting = self._postings.get(tag)
+            if posting is None:
+                continue
+            posting.discard(influencer_id)
+            if not posting:
+                del self._postings[tag]
+                self.vocabulary_version += 1
+
+    def tags(self) -> List[str]:
+        """All tags carried by at least one indexed influencer."""
+        return list(self._postings)
+
+    def posting(self, tag: str) -> Set[str]:
+        """Return the ids carrying `tag` (do not mutate the returned set)."""
+        return self._postings.get(tag, set())
+
+    def candidate_ids(self, user_tags: Iterable[str]) -> Set[str]:
+        """Union of the posting lists of `user_tags`."""
+        ids: Set[str] = set()
+        for tag in set(user_tags):
+            posting = self._postings.get(tag)
+            if posting:
+                ids |= posting
+        return ids
+
+    def match(self, user_tags: Iterable[str]) -> List[Any]:
+        """
+        Return influencers whose tags overlap with user_tags, in the order they
+        were added to the index (same order as a linear scan of the catalogue).
+        """
+        ids = sorted(self.candidate_ids(user_tags), key=self._order.__getitem__)
+        return [self._influencers[i] for i in ids]
@@ -0,0 +1,14 @@
+import importlib.util
+import os
+import sys
+
+# The repository root is the `matching` package; make it importable under that
+# name whatever the checkout directory is called.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if "matching" not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        "matching", os.path.join(ROOT, "__init__.py"), submodule_search_locations=[ROOT])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["matching"] = module
+    spec.loader.exec_module(module)
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from matching.batch_scheduler import BatchScheduler
+
+
+class StubModel:
+    """run_batch stub: echoes items and records the batches it was given."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, items):
+        with self._lock:
+            self.batches.append(list(items))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        return [ValueError(item) if item == "bad" else f"answer:{item}" for item in items]
+
+
+def run_all(scheduler, items):
+    futures = [scheduler.submit(item) for item in items]
+    return [f.result(5) for f in futures]
+
+
+def test_full_batches_flush_without_waiting():
+    model = StubModel()
+    scheduler = BatchScheduler(model, max_batch_size=4, max_wait_ms=10000)
+    scheduler.start()
+    try:
+        started = time.monotonic()
+        assert run_all(scheduler, list("abcd")) == [f"answer:{c}" for c in "abcd"]
+        assert time.monotonic() - started < 5
+    finally:
+        scheduler.stop(5)
+    assert model.batches == [list("abcd")]
+
+
+def test_partial_batch_flushes_after_max_wait():
+    model = StubModel()
+    scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=50)
+    scheduler.start()
+    try:
+        assert run_all(scheduler, ["a", "b"]) == ["answer:a", "answer:b"]
+    finally:
+        scheduler.stop(5)
+    assert model.batches == [["a", "b"]]
+    assert scheduler.stats()["items"] == 2
+
+
+def test_batch_key_separates_items():
+    model = StubModel()
+    scheduler = BatchScheduler(model, max_batch_size=4, max_wait_ms=20, batch_key=lambda item: item[0])
+    scheduler.start()
+    try:
+        run_all(scheduler, ["x1", "y1", "x2", "y2"])
+    finally:
+        scheduler.stop(5)
+    assert sorted(model.batches) == [["x1", "x2"], ["y1", "y2"]]
+
+
+def test_exception_fails_only_its_item():
+    scheduler = BatchScheduler(StubModel(), max_batch_size=3, max_wait_ms=20)
+    scheduler.start()
+    try:
+        futures = [scheduler.submit(item) for item in ["a", "bad", "c"]]
+        assert futures[0].result(5) == "answer:a"
+        with pytest.raises(ValueError):
+            futures[1].result(5)
+        assert futures[2].result(5) == "answer:c"
+    finally:
+        scheduler.stop(5)
+
+
+def test_single_dispatcher_runs_one_batch_at_a_time():
+    model = StubModel(delay=0.02)
+    scheduler = BatchScheduler(model, max_batch_size=2, max_wait_ms=1)
+    scheduler.start()
+    try:
+        threads = [threading.Thread(target=scheduler.run, args=(str(i), 5)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        scheduler.stop(5)
+    assert model.max_running == 1
+    assert sum(len(b) for b in model.batches) == 10
+
+
+def test_submit_after_stop_is_rejected():
+    scheduler = BatchScheduler(StubModel())
+    scheduler.start()
+    scheduler.stop(5)
+    with pytest.raises(RuntimeError):
+        scheduler.submit("a")
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from matching.frame_cache import FrameCache
+
+
+def test_frames_are_stored_in_their_decoded_dtype(tmp_path):
+    cache = FrameCache(str(tmp_path))
+    frames = np.random.default_rng(0).uniform(0, 255, size=(4, 3, 28, 28)).astype(np.float32)
+    key = FrameCache.make_key("https://example.com/a.mp4", 1.0, 360 * 420)
+    cache.put(key, frames, {"fps": [1.0]})
+    stored = np.load(tmp_path / f"{key}.npy")
+    assert stored.dtype == np.float32
+    np.testing.assert_array_equal(stored, frames)
+
+
+def test_hit_returns_the_same_values_without_copy(tmp_path):
+    torch = pytest.importorskip("torch")
+    cache = FrameCache(str(tmp_path))
+    frames = torch.rand(4, 3, 28, 28) * 255
+    key = FrameCache.make_key("https://example.com/a.mp4", 1.0, 360 * 420)
+    cache.put(key, frames, {"fps": [1.0]})
+    cached, video_kwargs = cache.get(key)
+    assert cached.dtype == frames.dtype
+    assert torch.equal(cached, frames)
+    assert video_kwargs == {"fps": [1.0]}
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from matching import network_tools
+from matching.download_pool import DownloadResult
+from matching.ingest_pipeline import Pipeline, Stage, ingest_tiktok_users
+
+
+class FakePool:
+    """Writes a small file instead of downloading."""
+
+    def download_one(self, url, path, proxy=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"video")
+        return DownloadResult(url, path=path)
+
+
+@pytest.fixture
+def tiktok(monkeypatch):
+    posts = [{"video_url": f"https://cdn.example.com/v{i}.mp4", "video_id": str(i), "create_time": 0}
+             for i in range(3)]
+    monkeypatch.setattr(network_tools, "get_tiktok_sec_user_id", lambda url, domain=None: ["sec-1"])
+    monkeypatch.setattr(network_tools, "iter_tiktok_user_posts", lambda *args, **kwargs: iter(posts))
+    return posts
+
+
+def ingest(tmp_path, infer, keep_videos):
+    return ingest_tiktok_users(["https://www.tiktok.com/@alice"], output_dir=str(tmp_path), posts_per_user=3,
+                               keep_videos=keep_videos, pool=FakePool(), extract=lambda path: None, infer=infer)
+
+
+def video_files(tmp_path):
+    return sorted(f for _, _, files in os.walk(tmp_path) for f in files)
+
+
+def test_failed_items_are_deleted_when_videos_are_not_kept(tmp_path, tiktok):
+    def infer(path, prompt):
+        if path.endswith("_2.mp4"):
+            raise Exception("GPU fell over")
+        return "#makeup #lipstick"
+
+    result = ingest(tmp_path, infer, keep_videos=False)
+    influencer = result["influencers"][0]
+    assert video_files(tmp_path) == []
+    assert "video_paths" not in influencer.attributes
+    assert sorted(influencer.video_tags) == ["lipstick", "makeup"]
+    assert [stage for stage, _, _ in result["errors"]] == ["inference"]
+
+
+def test_kept_videos_are_recorded(tmp_path, tiktok):
+    result = ingest(tmp_path, lambda path, prompt: "#makeup", keep_videos=True)
+    paths = result["influencers"][0].attributes["video_paths"]
+    assert len(paths) == 3 and all(os.path.exists(p) for p in paths)
+
+
+def test_pipeline_records_errors_and_keeps_going():
+    def half(item):
+        if item % 2:
+            raise ValueError(item)
+        yield item * 10
+
+    pipeline = Pipeline([Stage("half", half, workers=2), Stage("identity", lambda item: [item])])
+    assert sorted(pipeline.run(range(6))) == [0, 20, 40]
+    assert sorted(item for _, item, _ in pipeline.errors) == [1, 3, 5]
+    assert pipeline.stats()["stages"]["half"]["errors"] == 3
+
+
+def test_default_stages_go_through_the_backend(tmp_path, tiktok, monkeypatch):
+    import sys
+
+    from matching import inference_backend
+
+    backend = inference_backend.StubBackend()
+    monkeypatch.setattr(inference_backend, "_backend", backend)
+    result = ingest_tiktok_users(["https://www.tiktok.com/@alice"], output_dir=str(tmp_path), posts_per_user=3,
+                                 pool=FakePool())
+    assert result["errors"] == []
+    assert result["influencers"][0].video_tags
+    # Frame prefetch is the backend's job; the calling process never loads the model code
+    assert "matching.video_to_text" not in sys.modules
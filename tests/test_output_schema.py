@@ -0,0 +1,92 @@
+import json
+import os
+
+import pytest
+
+from matching.output_schema import DONE, SchemaDecoder, TokenTable, schema_from_dict
+
+PROMPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts.json")
+EOS = 0
+
+
+class CharTokenizer:
+    """One token per character; id 0 is end-of-sequence."""
+
+    def __init__(self):
+        self.chars = ["<eos>"] + [chr(c) for c in range(32, 127)] + ["\n"]
+        self.ids = {c: i for i, c in enumerate(self.chars)}
+        self.all_special_ids = [EOS]
+
+    def __len__(self):
+        return len(self.chars)
+
+    def encode(self, text, add_special_tokens=False):
+        return [self.ids[c] for c in text]
+
+    def decode(self, ids):
+        return "".join(self.chars[i] for i in ids)
+
+
+def load_schema(prompt_id):
+    with open(PROMPTS, "r", encoding="utf-8") as f:
+        return schema_from_dict(json.load(f)[prompt_id]["schema"])
+
+
+def drive(decoder, tokenizer, text):
+    """Feed `text` then EOS, checking every token is allowed; return the final state."""
+    state = decoder.initial_state()
+    for token_id in tokenizer.encode(text) + [EOS]:
+        allowed = decoder.allowed(state)
+        if allowed == SchemaDecoder.FREE:
+            allowed = set(decoder.table.free_ids) | set(decoder.line_end_ids(state))
+        assert token_id in allowed, f"{tokenizer.decode([token_id])!r} rejected in {state.phase} of field {state.field}"
+        state = decoder.advance(state, token_id)
+    return state
+
+
+def test_key_value_answer_reaches_done():
+    tokenizer = CharTokenizer()
+    decoder = SchemaDecoder(load_schema("3"), tokenizer, [EOS])
+    answer = ("Skin Tone: Fair\nGender: Male & Female\nEthnicity: White\nLanguage: English\n"
+              "Couple Appears?: Yes\nPet Appears?: Yes\nChild Appears?: No")
+    assert drive(decoder, tokenizer, answer).phase == DONE
+
+
+def test_key_value_forces_keys_and_enum_values():
+    tokenizer = CharTokenizer()
+    decoder = SchemaDecoder(load_schema("3"), tokenizer, [EOS])
+    state = decoder.initial_state()
+    # advance updates the state in place, which is how SchemaLogitsProcessor keeps its per-row states
+    for token_id in tokenizer.encode("Skin Tone: Fair\n"):
+        assert decoder.advance(state, token_id) is state
+    assert (state.field, state.phase) == (1, "key")
+    assert decoder.allowed(state) == tokenizer.encode("G")
+    for token_id in tokenizer.encode("Gender:"):
+        decoder.advance(state, token_id)
+    assert decoder.allowed(state) == tokenizer.encode(" ")
+    # EOS is only allowed once the last field has a value
+    assert EOS not in decoder.allowed(state)
+
+
+def test_choice_answer_reaches_done():
+    tokenizer = CharTokenizer()
+    schema = load_schema("4")
+    decoder = SchemaDecoder(schema, tokenizer, [EOS])
+    answer = "\n".join(schema.options[:schema.count])
+    assert drive(decoder, tokenizer, answer).phase == DONE
+
+
+def test_choice_rejects_repeated_option():
+    tokenizer = CharTokenizer()
+    schema = load_schema("4")
+    decoder = SchemaDecoder(schema, tokenizer, [EOS])
+    with pytest.raises(AssertionError):
+        drive(decoder, tokenizer, "\n".join([schema.options[0]] * schema.count))
+
+
+def test_token_table_classes():
+    tokenizer = CharTokenizer()
+    table = TokenTable(tokenizer)
+    assert table.newline_ids == {tokenizer.ids["\n"]}
+    assert EOS not in table.free_ids
+    assert tokenizer.ids["a"] in table.free_ids
@@ -0,0 +1,50 @@
+from matching.influencer_product_matching import Influencer, filter_user_input, match_influencers
+from matching.query_parser import QueryCompiler, compiler_for_index
+from matching.tag_index import TagIndex
+
+
+def _index():
+    return TagIndex([
+        Influencer(id="1", name="A", attributes={"budget": 20000}, hashtags=["美妆", "护肤"]),
+        Influencer(id="2", name="B", attributes={"budget": 5000}, hashtags=["彩妆"]),
+        Influencer(id="3", name="C", attributes={"budget": 8000}, hashtags=["健身"]),
+    ])
+
+
+def test_index_compiler_segments_indexed_tags():
+    index = _index()
+    assert filter_user_input("美妆彩妆 预算10000以上", index=index) == ["美妆", "彩妆"]
+    assert [inf.id for inf in match_influencers(filter_user_input("美妆彩妆", index=index), index)] == ["1", "2"]
+    assert [inf.id for inf in match_influencers("美妆彩妆 预算10000以上", index)] == ["1"]
+
+
+def test_indexes_do_not_share_vocabulary():
+    index = _index()
+    other = TagIndex([Influencer(id="9", name="Z", attributes={}, hashtags=["美妆彩妆"])])
+    assert filter_user_input("美妆彩妆", index=other) == ["美妆彩妆"]
+    assert filter_user_input("美妆彩妆", index=index) == ["美妆", "彩妆"]
+    assert compiler_for_index(index) is not compiler_for_index(other)
+
+
+def test_vocabulary_reloaded_only_when_index_tags_change():
+    index = _index()
+    compiler = compiler_for_index(index)
+    compiler.compile("美妆彩妆")
+    index.add_tags("3", ["健身"])  # no new tag: the compiled query stays cached
+    assert compiler_for_index(index).compile("美妆彩妆") is compiler.compile("美妆彩妆")
+    index.add_tags("3", ["护肤霜"])
+    assert filter_user_input("护肤霜", index=index) == ["护肤霜"]
+    index.discard_tags("3", ["护肤霜"])
+    assert filter_user_input("护肤霜", index=index) == ["护肤", "霜"]
+
+
+def test_add_words_extends_vocabulary():
+    compiler = QueryCompiler(vocabulary=["美妆"])
+    assert compiler.compile("美妆口红").tags == ("美妆", "口红")
+    compiler.add_words(["口红", "红"])
+    assert compiler.compile("美妆口红护肤").tags == ("美妆", "口红", "护肤")
+
+
+def test_numeric_constraints():
+    query = QueryCompiler().compile("粉丝10w以上 预算5000-8000")
+    assert {(f.key, f.min, f.max) for f in query.filters} == {("followers", 100000, None), ("budget", 5000, 8000)}
@@ -0,0 +1,23 @@
+from matching.result_cache import ResultCache
+
+
+def test_running_total_tracks_inserts_replacements_and_clear(tmp_path):
+    cache = ResultCache(str(tmp_path / "c.sqlite"), max_bytes=1000)
+    cache.put("a", "x" * 100)
+    cache.put("b", "y" * 200)
+    cache.put("a", "z" * 50)
+    assert cache.stats()["bytes"] == 250
+    assert ResultCache(str(tmp_path / "c.sqlite"), max_bytes=1000).stats()["bytes"] == 250
+    cache.clear()
+    assert cache.stats()["bytes"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "c.sqlite"), max_bytes=300)
+    for key in "abc":
+        cache.put(key, key * 100)
+    assert cache.get("a") == "a" * 100
+    cache.put("d", "d" * 100)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["a" * 100, "c" * 100, "d" * 100]
+    assert cache.stats()["bytes"] == 300
@@ -0,0 +1,57 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from matching.sampling import DEFAULT_POLICY, SamplingPolicy, apply_policy, sampling_from_dict, select_keyframes
+
+PROMPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts.json")
+
+
+def frames(count, height=308, width=420):
+    return np.zeros((count, 3, height, width), dtype=np.float32)
+
+
+def test_default_policy_keeps_legacy_sampling():
+    kept, video_kwargs, info = apply_policy(DEFAULT_POLICY, frames(180), {"fps": [1.0]})
+    assert kept.shape[0] == 180
+    assert video_kwargs == {"fps": [1.0]}
+    assert info["frames"] == 180
+
+
+def test_prompt_policies_are_opt_in():
+    with open(PROMPTS, "r", encoding="utf-8") as f:
+        prompts = json.load(f)
+    assert all("sampling" not in entry for entry in prompts.values())
+    for entry in prompts.values():
+        sampling_from_dict(entry.get("proposed_sampling"))
+
+
+def test_frame_budget_scales_fps():
+    policy = SamplingPolicy(max_frames=10, max_visual_tokens=0)
+    kept, video_kwargs, info = apply_policy(policy, frames(40), {"fps": [1.0]})
+    assert kept.shape[0] == 10
+    assert video_kwargs["fps"] == [0.25]
+
+
+def test_token_budget_drops_frames_first():
+    # 11 x 15 patches per frame, one temporal patch per two frames
+    policy = SamplingPolicy(max_visual_tokens=165 * 4, min_frames=4)
+    _, _, info = apply_policy(policy, frames(40), {"fps": [1.0]})
+    assert (info["frames"], info["visual_tokens"]) == (8, 660)
+
+
+def test_keyframes_include_scene_cuts():
+    scores = [0.0] * 30
+    scores[7] = scores[21] = 0.5
+    selected = select_keyframes(scores, 6, threshold=0.1)
+    assert len(selected) == 6 and {0, 7, 21} <= set(selected)
+
+
+def test_invalid_policy_is_rejected():
+    for spec in ({"max_frames": -3}, {"fps": 0}, {"max_pixels": 0}, {"max_candidates": -1},
+                 {"max_visual_tokens": -5}, {"min_frames": -1}, {"scene_threshold": 2}):
+        with pytest.raises(ValueError):
+            sampling_from_dict(spec)
+    assert SamplingPolicy(max_visual_tokens=0, min_frames=0).budget == 0
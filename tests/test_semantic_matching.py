@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+
+from matching.semantic_matching import EmbeddingMatrix, HashingEncoder, IVFIndex, SemanticMatcher
+
+
+class Inf:
+    def __init__(self, id, tags):
+        self.id = id
+        self.tags = list(tags)
+
+    def all_tags(self):
+        return list(self.tags)
+
+
+class CountingEncoder(HashingEncoder):
+    def __init__(self):
+        super().__init__(dim=32)
+        self.calls = 0
+
+    def encode(self, texts):
+        self.calls += len(texts)
+        return super().encode(texts)
+
+
+def test_embedding_matrix_reopens_rows_past_initial_capacity(tmp_path):
+    path = str(tmp_path / "emb.f16")
+    matrix = EmbeddingMatrix(4, path, capacity=2)
+    vectors = np.eye(4, dtype=np.float32)[[0, 1, 2, 3, 0]]
+    for i, v in enumerate(vectors):
+        matrix.append(v, key=f"row{i}")
+    matrix.flush()
+    size = os.path.getsize(path)
+
+    reopened = EmbeddingMatrix(4, path, capacity=2)
+    assert len(reopened) == 5
+    assert reopened.keys == [f"row{i}" for i in range(5)]
+    np.testing.assert_array_equal(reopened.rows(), vectors)
+    assert os.path.getsize(path) == size
+
+    reopened.append(vectors[1], key="row5")
+    assert reopened.rows()[:5].tolist() == vectors.tolist()
+
+
+def test_semantic_matcher_reuses_stored_embeddings(tmp_path):
+    path = str(tmp_path / "emb.f16")
+    first = SemanticMatcher(encoder=CountingEncoder(), path=path)
+    first.add(Inf("a", ["makeup", "lipstick"]))
+    first.add(Inf("b", ["football"]))
+    first.flush()
+
+    encoder = CountingEncoder()
+    second = SemanticMatcher(encoder=encoder, path=path)
+    # Restored rows are not returned before their influencer is added again
+    assert second.search(["makeup"]) == []
+    encoder.calls = 0
+    second.add(Inf("a", ["makeup", "lipstick"]))
+    assert encoder.calls == 0
+    second.add(Inf("b", ["football", "soccer"]))
+    assert encoder.calls == 2
+    assert len(second.matrix) == 2
+    assert [inf.id for inf, _ in second.search(["lipstick"], top_k=1)] == ["a"]
+
+
+def test_ivf_reassignment_moves_rows_between_lists():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((200, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ann = IVFIndex(nlist=8, nprobe=8)
+    ann.train(vectors)
+    ann.add(range(200), vectors)
+    ann.add(range(0, 200, 3), -vectors[::3])
+    ann.add(range(0, 200, 2), vectors[::2])
+    assert sorted(ann.candidates(vectors[0]).tolist()) == list(range(200))
+    for c, members in enumerate(ann._lists):
+        for position, row in enumerate(members):
+            assert ann._assignment[row] == (c, position)
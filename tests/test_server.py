@@ -0,0 +1,45 @@
+import importlib
+
+import pytest
+
+from matching import inference_backend
+
+VIDEO = "https://cdn.example.com/v.mp4"
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(inference_backend, "_backend", inference_backend.StubBackend())
+        mp.setenv("MATCHING_PRELOAD", "0")
+        mp.setenv("MATCHING_JOBS_DB", str(tmp_path_factory.mktemp("jobs") / "jobs.sqlite"))
+        server = importlib.import_module("matching.video_to_text_server")
+        yield server.app.test_client()
+
+
+@pytest.mark.parametrize("sampling", [{"max_frames": -3}, {"fps": 0}, {"max_pixels": -1},
+                                      {"max_candidates": 0}, {"max_visual_tokens": -1}, {"min_frames": -2}])
+def test_invalid_sampling_policy_is_rejected(client, sampling):
+    response = client.post("/video_to_text", json={"video_path": VIDEO, "prompt_id": "1", "sampling": sampling})
+    assert response.status_code == 400
+    assert "Invalid sampling policy" in response.get_json()["error"]
+
+
+def test_valid_sampling_policy_is_accepted(client):
+    response = client.post("/video_to_text", json={"video_path": VIDEO, "prompt_id": "1",
+                                                   "sampling": {"max_frames": 8, "max_visual_tokens": 0}})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("prompts", [["describe"], "describe", {"3": 5}])
+def test_multi_rejects_malformed_prompts(client, prompts):
+    response = client.post("/video_to_text_multi", json={"video_path": VIDEO, "prompts": prompts})
+    assert response.status_code == 400
+    assert "prompts" in response.get_json()["error"]
+
+
+def test_multi_accepts_prompt_overrides(client):
+    response = client.post("/video_to_text_multi", json={"video_path": VIDEO, "prompt_ids": ["3", "4"],
+                                                         "prompts": {"4": "Describe the video."}})
+    assert response.status_code == 200
+    assert set(response.get_json()["results"]) == {"3", "4"}
@@ -0,0 +1,30 @@
+import pytest
+
+from matching.tag_index import TagIndex
+
+
+class Inf:
+    def __init__(self, id, tags):
+        self.id = id
+        self.tags = list(tags)
+
+    def all_tags(self):
+        return list(self.tags)
+
+
+def test_match_returns_catalogue_order():
+    index = TagIndex([Inf("a", ["美妆"]), Inf("b", ["护肤"]), Inf("c", ["美妆", "护肤"])])
+    assert [inf.id for inf in index.match(["护肤", "美妆"])] == ["a", "b", "c"]
+
+
+def test_add_tags_rejects_unknown_influencer():
+    index = TagIndex([Inf("a", ["美妆"])])
+    with pytest.raises(KeyError):
+        index.add_tags("ghost", ["美妆"])
+    assert [inf.id for inf in index.match(["美妆"])] == ["a"]
+
+
+def test_add_tags_after_add():
+    index = TagIndex([Inf("a", ["美妆"])])
+    index.add_tags("a", ["口红"])
+    assert [inf.id for inf in index.match(["口红"])] == ["a"]
@@ -0,0 +1,245 @@
+import asyncio
+import os
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from matching.tiktok_client import RateLimiter, TikTokClient
+
+SEC_PATH = "/api/tiktok/web/get_all_sec_user_id"
+POSTS_PATH = "/api/tiktok/web/fetch_user_post_hot_simple"
+# Newest post first; each page holds PAGE_SIZE posts one hour apart
+START = 1_700_000_000
+PAGE_SIZE = 3
+PAGES = 4
+
+
+def video_url(n):
+    return f"https://www.tiktok.com/@alice/video/{(START - 3600 * n) << 32}"
+
+
+class StubApi:
+    """Local stand-in for the TikTok metadata API and a CDN."""
+
+    def __init__(self):
+        self.sec_batches = []
+        self.pages = []
+        self.peers = set()
+        self.hosts = []
+        self.app = web.Application()
+        self.app.router.add_post(SEC_PATH, self.sec_user_id)
+        self.app.router.add_get(POSTS_PATH, self.user_posts)
+        self.app.router.add_get("/video/ok.mp4", self.video)
+        self.app.router.add_get("/video/truncated.mp4", self.truncated_video)
+
+    def seen(self, request):
+        self.peers.add(request.transport.get_extra_info("peername"))
+        self.hosts.append(request.host)
+
+    async def sec_user_id(self, request):
+        self.seen(request)
+        urls = await request.json()
+        self.sec_batches.append(urls)
+        if any("broken" in url for url in urls):
+            if len(urls) > 1:
+                return web.Response(status=500)
+            return web.json_response({"code": 500, "data": None})
+        return web.json_response({"code": 200, "data": [f"sec-{url.rsplit('@', 1)[-1]}" for url in urls]})
+
+    async def user_posts(self, request):
+        self.seen(request)
+        page = int(request.query["cursor"])
+        self.pages.append(page)
+        first = page * PAGE_SIZE
+        return web.json_response({"code": 200, "data": {
+            "video_urls": [video_url(n) for n in range(first, first + PAGE_SIZE)],
+            "avatarLarger": "https://cdn.example.com/a.jpg",
+            "signature": "hi",
+            "cursor": str(page + 1),
+            "hasMore": page + 1 < PAGES,
+        }})
+
+    async def video(self, request):
+        self.seen(request)
+        return web.Response(body=b"v" * 200_000)
+
+    async def truncated_video(self, request):
+        response = web.StreamResponse()
+        response.content_length = 1_000_000
+        await response.prepare(request)
+        await response.write(b"v" * 100_000)
+        request.transport.close()
+        return response
+
+
+def run(test):
+    """Run `test(api, client)` against a fresh stub server."""
+    async def main():
+        api = StubApi()
+        async with TestServer(api.app) as server:
+            client = TikTokClient(str(server.make_url("")), rate=0, batch_size=3)
+            try:
+                return await test(api, client)
+            finally:
+                await client.close()
+    return asyncio.run(main())
+
+
+def test_sec_user_ids_are_batched():
+    urls = [f"https://www.tiktok.com/@user{i}" for i in range(7)]
+
+    async def test(api, client):
+        result = await client.get_sec_user_ids(urls + urls[:2])
+        assert result == {url: [f"sec-user{i}"] for i, url in enumerate(urls)}
+        assert sorted(len(batch) for batch in api.sec_batches) == [1, 3, 3]
+
+    run(test)
+
+
+def test_failed_batch_falls_back_to_single_urls():
+    urls = ["https://www.tiktok.com/@a", "https://www.tiktok.com/@broken", "https://www.tiktok.com/@b"]
+
+    async def test(api, client):
+        result = await client.get_sec_user_ids(urls)
+        assert result == {urls[0]: ["sec-a"], urls[1]: [], urls[2]: ["sec-b"]}
+        assert api.sec_batches[0] == urls
+        assert sorted(map(tuple, api.sec_batches[1:])) == sorted((url,) for url in urls)
+
+    run(test)
+
+
+def test_requests_reuse_one_connection():
+    async def test(api, client):
+        for i in range(10):
+            await client.get_sec_user_id(f"https://www.tiktok.com/@user{i}")
+        assert len(api.peers) == 1
+
+    run(test)
+
+
+def test_env_proxy_is_honoured(monkeypatch):
+    # The stub doubles as the proxy: requests for an unresolvable host only succeed through it
+    async def main():
+        api = StubApi()
+        async with TestServer(api.app) as server:
+            monkeypatch.setenv("http_proxy", str(server.make_url("")))
+            monkeypatch.delenv("no_proxy", raising=False)
+            monkeypatch.delenv("NO_PROXY", raising=False)
+            async with TikTokClient("http://tiktok-api.invalid", rate=0) as client:
+                assert await client.get_sec_user_id("https://www.tiktok.com/@alice") == ["sec-alice"]
+        assert api.hosts == ["tiktok-api.invalid"]
+
+    asyncio.run(main())
+
+
+def test_rate_limiter_spaces_requests():
+    async def main():
+        limiter = RateLimiter(rate=20, burst=1)
+        started = time.monotonic()
+        for _ in range(5):
+            await limiter.acquire()
+        return time.monotonic() - started
+
+    # The first acquisition uses the burst; the other four wait 1/20 s each
+    assert asyncio.run(main()) >= 4 / 20 * 0.9
+
+
+def test_client_rate_limit_applies_to_api_calls():
+    async def test(api, client):
+        client._limiter = RateLimiter(rate=20, burst=1)
+        started = time.monotonic()
+        await asyncio.gather(*(client.get_sec_user_id(f"https://www.tiktok.com/@u{i}") for i in range(5)))
+        assert time.monotonic() - started >= 4 / 20 * 0.9
+
+    run(test)
+
+
+def test_download_writes_file(tmp_path):
+    async def test(api, client):
+        path = await client.download(f"{client.base_url}/video/ok.mp4", str(tmp_path / "v" / "ok.mp4"))
+        assert os.path.getsize(path) == 200_000
+        assert os.listdir(tmp_path / "v") == ["ok.mp4"]
+
+    run(test)
+
+
+def test_failed_download_removes_temp_file(tmp_path):
+    async def test(api, client):
+        try:
+            await client.download(f"{client.base_url}/video/truncated.mp4", str(tmp_path / "bad.mp4"))
+        except Exception as e:
+            assert "Failed to download" in str(e)
+        else:
+            raise AssertionError("truncated download did not fail")
+        assert os.listdir(tmp_path) == []
+
+    run(test)
+
+
+def test_iter_user_posts_walks_cursor():
+    async def test(api, client):
+        profile = {}
+        posts = [p async for p in client.iter_user_posts("sec-alice", page_size=PAGE_SIZE, profile=profile)]
+        assert [p["video_url"] for p in posts] == [video_url(n) for n in range(PAGE_SIZE * PAGES)]
+        assert posts[0]["create_time"] == START
+        assert api.pages == list(range(PAGES))
+        assert profile == {"avatarLarger": "https://cdn.example.com/a.jpg", "signature": "hi"}
+
+    run(test)
+
+
+def test_iter_user_posts_stops_at_limit():
+    async def test(api, client):
+        posts = [p async for p in client.iter_user_posts("sec-alice", limit=5, page_size=PAGE_SIZE)]
+        assert len(posts) == 5
+        # The second page covers the limit, so no third page is requested
+        assert api.pages == [0, 1]
+
+    run(test)
+
+
+def test_iter_user_posts_stops_at_since():
+    async def test(api, client):
+        # Posts 0..4 are at most 4 hours old; page 2 (posts 6..8) is entirely older
+        since = START - 3600 * 4
+        posts = [p async for p in client.iter_user_posts("sec-alice", since=since, page_size=PAGE_SIZE)]
+        assert [p["video_url"] for p in posts] == [video_url(n) for n in range(5)]
+        assert api.pages == [0, 1, 2]
+
+    run(test)
+
+
+def test_iter_user_posts_prefetches_one_page():
+    async def test(api, client):
+        posts = client.iter_user_posts("sec-alice", page_size=PAGE_SIZE)
+        await posts.__anext__()
+        # Give a prefetch of further pages time to happen if it were going to
+        await asyncio.sleep(0.2)
+        assert api.pages == [0, 1]
+        for _ in range(PAGE_SIZE):
+            await posts.__anext__()
+        await asyncio.sleep(0.2)
+        assert api.pages == [0, 1, 2]
+        await posts.aclose()
+
+    run(test)
+
+
+def test_sync_wrappers_share_the_background_loop():
+    from matching import network_tools
+    from matching.tiktok_client import run_sync
+
+    api = StubApi()
+    server = TestServer(api.app)
+    run_sync(server.start_server())
+    try:
+        domain = str(server.make_url("")).rstrip("/")
+        urls = ["https://www.tiktok.com/@a", "https://www.tiktok.com/@b"]
+        assert network_tools.get_tiktok_sec_user_id_batch(urls, domain) == {urls[0]: ["sec-a"], urls[1]: ["sec-b"]}
+        posts = list(network_tools.iter_tiktok_user_posts("sec-a", limit=4, page_size=PAGE_SIZE, domain=domain))
+        assert [p["video_url"] for p in posts] == [video_url(n) for n in range(4)]
+        assert len(api.peers) == 1
+    finally:
+        run_sync(network_tools.shared_client(domain).close())
+        run_sync(server.close())
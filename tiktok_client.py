@@ -0,0 +1,256 @@
+import asyncio
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Coroutine, Dict, List, Optional, Sequence, Union
+
+import aiohttp
+
+from matching.download_pool import USER_AGENT
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._updated is not None:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class TikTokClient:
+    """
+    asyncio client for the TikTok metadata API.
+
+    All requests share one keep-alive connection pool (`max_connections`),
+    at most `concurrency` run at once and they are spaced by a token-bucket
+    rate limit (`rate` requests/sec). Like the `requests` calls it replaces, it
+    honours the http(s)_proxy / no_proxy environment variables. Use as `async with TikTokClient(domain) as
+    client: ...` or call `close()` when done.
+    """
+
+    def __init__(self, domain: str, concurrency: int = 8, rate: float = 10.0, max_connections: int = 16,
+                 timeout: float = 30.0, batch_size: int = 20):
+        self.base_url = domain if domain.startswith("http") else f"https://{domain}"
+        self.batch_size = max(1, batch_size)
+        self.max_connections = max_connections
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._limiter = RateLimiter(rate)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "TikTokClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, trust_env=True,
+                                                  headers={"accept": "application/json"})
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _api(self, method: str, path: str, **kwargs) -> Any:
+        """Call an API endpoint and return `data` of a {"code": 200, "data": ...} response."""
+        async with self._semaphore:
+            await self._limiter.acquire()
+            try:
+                async with self._get_session().request(method, f"{self.base_url}{path}", **kwargs) as response:
+                    response.raise_for_status()
+                    result = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise Exception(f"Network request failed: {e}")
+            except ValueError as e:
+                raise Exception(f"Invalid JSON response: {e}")
+        if result.get("code") != 200:
+            raise Exception(f"API returned error code: {result.get('code')}")
+        return result.get("data")
+
+    async def get_sec_user_id(self, tiktok_url: str) -> List[str]:
+        """sec_user_id list for one TikTok user URL."""
+        return await self._api("POST", "/api/tiktok/web/get_all_sec_user_id", json=[tiktok_url]) or []
+
+    async def get_sec_user_ids(self, tiktok_urls: Sequence[str]) -> Dict[str, List[str]]:
+        """
+        sec_user_ids for many URLs, sent `batch_size` URLs per request (batches
+        run concurrently). The API answers a batch with one entry per URL, in
+        order; a batch whose answer does not line up is retried URL by URL.
+        URLs that fail map to [].
+        """
+        urls = list(dict.fromkeys(tiktok_urls))
+        batches = [urls[i:i + self.batch_size] for i in range(0, len(urls), self.batch_size)]
+        results: Dict[str, List[str]] = {}
+
+        async def one(url: str):
+            try:
+                results[url] = await self.get_sec_user_id(url)
+            except Exception as e:
+                print(f"Error processing {url}: {str(e)}")
+                results[url] = []
+
+        async def run_batch(batch: List[str]):
+            if len(batch) == 1:
+                await one(batch[0])
+                return
+            try:
+                data = await self._api("POST", "/api/tiktok/web/get_all_sec_user_id", json=batch)
+            except Exception as e:
+                print(f"Batch of {len(batch)} URLs failed ({e}), retrying one by one")
+                data = None
+            if isinstance(data, list) and len(data) == len(batch):
+                for url, entry in zip(batch, data):
+                    results[url] = [entry] if isinstance(entry, str) else list(entry or [])
+            else:
+                await asyncio.gather(*(one(url) for url in batch))
+
+        await asyncio.gather(*(run_batch(batch) for batch in batches))
+        return {url: results.get(url, []) for url in tiktok_urls}
+
+    async def get_user_posts(self, sec_uid: str, cursor: str = "0", count: int = 16) -> Dict[str, Any]:
+        """
+        One page of a user's posts: video_urls, avatarLarger, signature, plus
+        the pagination state (cursor of the next page and has_more).
+        """
+        params = {"secUid": sec_uid, "cursor": cursor, "count": count, "coverFormat": 2}
+        data = await self._api("GET", "/api/tiktok/web/fetch_user_post_hot_simple", params=params) or {}
+        return {
+            "video_urls": data.get("video_urls", []),
+            "avatarLarger": data.get("avatarLarger", ""),
+            "signature": data.get("signature", ""),
+            "cursor": str(data.get("cursor", "")),
+            "has_more": bool(data.get("hasMore", data.get("has_more", False))),
+        }
+
+    async def iter_user_posts(self, sec_uid: str, limit: Optional[int] = None,
+                              since: Union[datetime, float, None] = None, page_size: int = 16,
+                              profile: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Walk a user's posts page by page, yielding
+        {"video_url", "video_id", "create_time"} dicts.
+
+        The next page is requested as soon as the current one arrives, so it
+        loads while the caller handles (e.g. downloads) the current posts; at
+        most two pages are held at a time. Stops after `limit` posts, or once a
+        whole page is older than `since` (a datetime or unix timestamp; older
+        posts, e.g. pinned ones, are skipped). The creation time comes from the
+        video id (id >> 32 is the unix timestamp). If given, `profile` is filled
+        with the avatarLarger / signature of the first page.
+        """
+        cutoff = since.timestamp() if isinstance(since, datetime) else since
+        cursor = "0"
+        yielded = 0
+        pending: Optional[asyncio.Future] = asyncio.ensure_future(self.get_user_posts(sec_uid, cursor, page_size))
+        try:
+            while pending is not None:
+                page = await pending
+                pending = None
+                if profile is not None and not profile:
+                    profile.update(avatarLarger=page["avatarLarger"], signature=page["signature"])
+                posts = [post_info(url) for url in page["video_urls"]]
+                if cutoff is not None:
+                    posts = [p for p in posts if p["create_time"] is None or p["create_time"] >= cutoff]
+                    if page["video_urls"] and not posts:
+                        return
+                needed = limit is None or yielded + len(posts) < limit
+                if page["has_more"] and page["video_urls"] and page["cursor"] not in ("", cursor) and needed:
+                    cursor = page["cursor"]
+                    pending = asyncio.ensure_future(self.get_user_posts(sec_uid, cursor, page_size))
+                for post in posts:
+                    yield post
+                    yielded += 1
+                    if limit is not None and yielded >= limit:
+                        return
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def download(self, url: str, file_path: str, proxy: Optional[str] = None) -> str:
+        """Stream `url` to `file_path` (written atomically) and return its absolute path."""
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        tmp = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        async with self._semaphore:
+            await self._limiter.acquire()
+            try:
+                async with self._get_session().get(url, proxy=proxy, headers={"User-Agent": USER_AGENT}) as response:
+                    response.raise_for_status()
+                    with open(tmp, "wb") as f:
+                        async for chunk in response.content.iter_chunked(1 << 16):
+                            f.write(chunk)
+                os.replace(tmp, file_path)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise Exception(f"Failed to download {url}: {e}")
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        return os.path.abspath(file_path)
+
+
+def post_info(video_url: str) -> Dict[str, Any]:
+    """Video id and creation time (unix seconds, from the id's high 32 bits) of a post URL."""
+    match = re.search(r"/video/(\d+)", video_url)
+    video_id = match.group(1) if match else None
+    return {
+        "video_url": video_url,
+        "video_id": video_id,
+        "create_time": int(video_id) >> 32 if video_id else None,
+    }
+
+
+# --- Sync access: one event loop in a background thread, shared clients per domain ---
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_clients: Dict[str, TikTokClient] = {}
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="tiktok-client-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """Run a coroutine on the background loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def shared_client(domain: str) -> TikTokClient:
+    """Client bound to the background loop, reused by every sync call for `domain`."""
+    with _loop_lock:
+        client = _clients.get(domain)
+    if client is None:
+        async def create() -> TikTokClient:
+            return TikTokClient(domain)
+        client = run_sync(create())
+        with _loop_lock:
+            client = _clients.setdefault(domain, client)
+    return client
@@ -0,0 +1,220 @@
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from matching import metrics
+
+# Trace every request, not only the ones that ask for it
+TRACE_ALL = os.environ.get("MATCHING_TRACE", "0") == "1"
+
+
+class Trace:
+    """Structured debug record of one request: attributes plus timed stages."""
+
+    def __init__(self, name: str, **attributes):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.stages: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float, **attributes):
+        with self._lock:
+            self.stages.append({"stage": name, "ms": round(1000 * seconds, 3), **attributes})
+
+    def annotate(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def to_dict(self, error: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "trace_id": self.id,
+                "name": self.name,
+                "started": self.started,
+                "total_ms": round(1000 * (time.perf_counter() - self._start), 3),
+                "error": error,
+                "attributes": dict(self.attributes),
+                "stages": list(self.stages),
+            }
+
+
+class TraceSink:
+    """
+    Destination of finished traces. The most recent `capacity` records are
+    kept in memory (a ring buffer, see `recent`); with `path` they are also
+    appended to a JSONL file by a background thread. `submit` never blocks:
+    records beyond `rate` per second, or that find the file queue full, are
+    dropped and counted.
+    """
+
+    def __init__(self, capacity: int = 256, rate: float = 50.0, path: Optional[str] = None, queue_size: int = 1024):
+        self.rate = rate
+        self.path = path
+        self._records: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._tokens = float(max(1.0, rate))
+        self._updated = time.monotonic()
+        self.submitted = 0
+        self.dropped = 0
+        self._queue: Optional[queue.Queue] = None
+        if path:
+            self._queue = queue.Queue(maxsize=queue_size)
+            threading.Thread(target=self._write_loop, name="trace-sink", daemon=True).start()
+
+    def _allow(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        with self._lock:
+            if not self._allow():
+                self.dropped += 1
+                return False
+            self.submitted += 1
+            self._records.append(record)
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+        return True
+
+    def _write_loop(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        while True:
+            record = self._queue.get()
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                print(f"Trace sink write failed: {e}")
+
+    def recent(self, limit: Optional[int] = None, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Newest first; `trace_id` selects one record."""
+        with self._lock:
+            records = list(self._records)
+        records.reverse()
+        if trace_id is not None:
+            records = [r for r in records if r["trace_id"] == trace_id]
+        return records[:limit] if limit is not None else records
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"kept": len(self._records), "capacity": self._records.maxlen, "submitted": self.submitted,
+                    "dropped": self.dropped, "rate_per_sec": self.rate, "path": self.path}
+
+
+sink = TraceSink(
+    capacity=int(os.environ.get("MATCHING_TRACE_CAPACITY", 256)),
+    rate=float(os.environ.get("MATCHING_TRACE_RATE", 50)),
+    path=os.environ.get("MATCHING_TRACE_FILE") or None,
+)
+
+# Traces the current request contributes to (a micro-batch records into all of its requests)
+_current: contextvars.ContextVar = contextvars.ContextVar("matching_traces", default=())
+
+
+@contextmanager
+def trace(name: str, requested: bool = False, submit: bool = True, **attributes) -> Iterator[Optional[Trace]]:
+    """
+    Trace the enclosed work if `requested` (or MATCHING_TRACE=1); yields the
+    Trace, or None when not tracing. The finished record goes to `sink`.
+    """
+    if not (requested or TRACE_ALL):
+        yield None
+        return
+    current = Trace(name, **attributes)
+    previous = _current.get()
+    token = _current.set(previous + (current,))
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Finished in another context (e.g. a streaming response closed elsewhere)
+            _current.set(previous)
+        if submit:
+            sink.submit(current.to_dict(error))
+
+
+@contextmanager
+def activate(traces: Iterable[Optional[Trace]]):
+    """Record stages into `traces` (e.g. those of a batch's requests) in this thread."""
+    token = _current.set(tuple(t for t in traces if t is not None))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def active() -> bool:
+    return bool(_current.get())
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """
+    Time the enclosed block: always into the matching_stage_seconds
+    histogram, and as a stage of the active traces if there are any.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started, **attributes)
+
+
+def record(name: str, seconds: float, **attributes):
+    """Add an already measured stage to the stage histogram and the active traces."""
+    metrics.STAGE_SECONDS.observe(seconds, name)
+    for t in _current.get():
+        t.add_stage(name, seconds, **attributes)
+
+
+def annotate(**attributes):
+    for t in _current.get():
+        t.annotate(**attributes)
+
+
+def merge(record: Dict[str, Any], **attributes):
+    """Copy the stages and attributes of a record made elsewhere (e.g. in an inference worker) into the active traces."""
+    for t in _current.get():
+        t.annotate(**record.get("attributes", {}))
+        with t._lock:
+            t.stages.extend({**s, **attributes} for s in record.get("stages", []))
+
+
+def describe(obj: Any) -> Any:
+    """JSON-friendly summary of model inputs: tensors become shape/dtype strings."""
+    if hasattr(obj, "shape") and hasattr(obj, "dtype"):
+        return f"Tensor(shape={list(obj.shape)}, dtype={obj.dtype})"
+    if isinstance(obj, dict):
+        return {k: describe(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [describe(v) for v in obj]
+    if obj is None or isinstance(obj, (int, float, str, bool)):
+        return obj
+    return str(obj)
@@ -0,0 +1,176 @@
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from matching.output_schema import KeyValueSchema
+from matching.ranking import EnumFilter, FlagFilter
+
+# Enum vocabularies for the prompt "3" answers. Attribute values are codes:
+# 0 = unknown / not stated, i + 1 = VALUES[i]. Append only, codes are persisted.
+SKIN_TONES = ("Fair", "Light", "Medium", "Yellow", "Brown", "Dark", "Deep")
+GENDERS = ("Male", "Female", "Male & Female")
+ETHNICITIES = ("White", "Black", "Latino", "Asian")
+LANGUAGES = (
+    "English", "Spanish", "Portuguese", "French", "German", "Italian", "Chinese", "Japanese",
+    "Korean", "Arabic", "Hindi", "Russian", "Vietnamese", "Thai", "Indonesian", "Turkish", "Other",
+)
+# Prompt "4" category list, bit i of the "categories" attribute = CATEGORIES[i]
+CATEGORIES = (
+    "Lifestyle & Daily Vlog", "Travel & Adventure", "Gaming & eSports", "Comedy & Humor",
+    "Food & Cooking", "Beauty & Makeup", "Fashion & Style", "Tech & Gadgets", "Fitness & Wellness",
+    "Education & Learning", "Finance & Investing", "Pets & Animals", "Music & Dance",
+    "Arts, Crafts & DIY", "Social Commentary & Current Affairs", "Home Renovation & Real Estate",
+    "Automotive & Motorsports", "Parenting & Family Life", "Mindfulness & Spiritual Growth",
+    "ASMR & Relaxation", "Science & Experiments", "Photography & Filmmaking",
+    "Environmental & Sustainability", "Books & Literature", "Hobbies & Collectibles",
+)
+
+# Bits of the "flags" attribute
+FLAG_MALE = 1 << 0
+FLAG_FEMALE = 1 << 1
+FLAG_COUPLE = 1 << 2
+FLAG_PET = 1 << 3
+FLAG_CHILD = 1 << 4
+FLAG_NAMES = {"male": FLAG_MALE, "female": FLAG_FEMALE, "couple": FLAG_COUPLE, "pet": FLAG_PET, "child": FLAG_CHILD}
+
+# Attributes holding bitmasks; they are OR-ed together across an influencer's videos
+BITMASK_ATTRIBUTES = ("flags", "categories")
+
+ATTRIBUTE_SCHEMA = KeyValueSchema([
+    {"key": "Skin Tone"},
+    {"key": "Gender"},
+    {"key": "Ethnicity"},
+    {"key": "Language"},
+    {"key": "Couple Appears?"},
+    {"key": "Pet Appears?"},
+    {"key": "Child Appears?"},
+])
+
+_ENUMS = {
+    "skin_tone": SKIN_TONES,
+    "gender": GENDERS,
+    "ethnicity": ETHNICITIES,
+    "language": LANGUAGES,
+}
+# Attributes holding enum codes
+ENUM_ATTRIBUTES = tuple(_ENUMS)
+_LOOKUP = {key: {v.lower(): i + 1 for i, v in enumerate(values)} for key, values in _ENUMS.items()}
+_LOOKUP["gender"].update({"male and female": GENDERS.index("Male & Female") + 1,
+                          "female & male": GENDERS.index("Male & Female") + 1})
+_LOOKUP["language"].update({"mandarin": LANGUAGES.index("Chinese") + 1, "cantonese": LANGUAGES.index("Chinese") + 1})
+_UNKNOWN = {"", "n/a", "na", "none", "unknown", "not specified", "not applicable", "unclear", "-"}
+_YES_NO_FLAGS = (("Couple Appears?", FLAG_COUPLE), ("Pet Appears?", FLAG_PET), ("Child Appears?", FLAG_CHILD))
+_CATEGORY_BITS = [(c.lower(), 1 << i) for i, c in enumerate(CATEGORIES)]
+
+
+def encode(key: str, value: Optional[str]) -> int:
+    """Code of an enum value for `key` ('skin_tone', 'gender', ...); 0 when unknown."""
+    if value is None:
+        return 0
+    text = value.strip().rstrip(".").lower()
+    if text in _UNKNOWN:
+        return 0
+    lookup = _LOOKUP[key]
+    code = lookup.get(text)
+    if code is None:
+        # "Medium (olive)", "English, Spanish": the first recognised word wins
+        code = next((lookup[w] for w in re.split(r"[^a-z&]+", text) if w in lookup), 0)
+        if code == 0 and key == "language":
+            code = LANGUAGES.index("Other") + 1
+    return code
+
+
+def decode(key: str, code: int) -> Optional[str]:
+    """Enum value for a code, None for 0."""
+    return _ENUMS[key][code - 1] if code else None
+
+
+def parse_attributes(text: str) -> Dict[str, int]:
+    """
+    Parse a prompt "3" answer ("Skin Tone: Light  \\nGender: Female  ...") into
+    enum codes plus the "flags" bitmask. Keys whose line is missing are left out.
+    """
+    parsed = ATTRIBUTE_SCHEMA.parse(text)
+    encoded: Dict[str, int] = {}
+    for key, field in (("skin_tone", "Skin Tone"), ("gender", "Gender"),
+                       ("ethnicity", "Ethnicity"), ("language", "Language")):
+        if parsed[field] is not None:
+            encoded[key] = encode(key, parsed[field])
+    flags = 0
+    seen = False
+    gender = encoded.get("gender", 0)
+    if gender:
+        seen = True
+        flags |= (FLAG_MALE, FLAG_FEMALE, FLAG_MALE | FLAG_FEMALE)[gender - 1]
+    for field, bit in _YES_NO_FLAGS:
+        value = parsed[field]
+        if value is not None:
+            seen = True
+            if value.lower().startswith("y"):
+                flags |= bit
+    if seen:
+        encoded["flags"] = flags
+    return encoded
+
+
+def parse_categories(text: str) -> int:
+    """Bitmask of the CATEGORIES named in a prompt "4" answer."""
+    text = re.sub(r"\s+", " ", text).lower()
+    mask = 0
+    for category, bit in _CATEGORY_BITS:
+        if category in text:
+            mask |= bit
+    return mask
+
+
+def decode_categories(mask: int) -> List[str]:
+    return [c for i, c in enumerate(CATEGORIES) if mask >> i & 1]
+
+
+def update_attributes(influencer: Any, encoded: Dict[str, int], index: Any = None):
+    """
+    Write parsed codes into `influencer.attributes` (a dict or a store row).
+    Bitmask attributes are merged with what earlier videos set; enum codes
+    replace the old value unless the new one is unknown. An optional
+    `BitmapIndex` is re-indexed for the influencer.
+    """
+    attributes = influencer.attributes
+    for key, value in encoded.items():
+        if key in BITMASK_ATTRIBUTES:
+            attributes[key] = int(attributes.get(key, 0)) | value
+        elif value or key not in attributes:
+            attributes[key] = value
+    if index is not None:
+        index.update(influencer)
+
+
+def load_batch_results(path: str = "batch_results.json") -> Dict[str, Dict[str, int]]:
+    """Parse every prompt "3" result in a batch_results.json file, keyed by video name."""
+    with open(path, "r", encoding="utf-8") as f:
+        results = json.load(f)
+    return {name: parse_attributes(item["result"]) for name, item in results.items() if item.get("result")}
+
+
+# --- Filters over the encoded columns (see ranking.rank_influencers / apply_filters) ---
+
+def enum_filter(key: str, values: Iterable[str]) -> EnumFilter:
+    """e.g. enum_filter("language", ["English", "Spanish"])"""
+    return EnumFilter(key, tuple(sorted({encode(key, v) for v in values} - {0})))
+
+
+def flag_filter(male: Optional[bool] = None, female: Optional[bool] = None, couple: Optional[bool] = None,
+                pet: Optional[bool] = None, child: Optional[bool] = None) -> FlagFilter:
+    """True requires the flag, False excludes it, None ignores it; e.g. flag_filter(pet=True, child=False)."""
+    all_of = none_of = 0
+    for wanted, bit in ((male, FLAG_MALE), (female, FLAG_FEMALE), (couple, FLAG_COUPLE),
+                        (pet, FLAG_PET), (child, FLAG_CHILD)):
+        if wanted is True:
+            all_of |= bit
+        elif wanted is False:
+            none_of |= bit
+    return FlagFilter("flags", all_of=all_of, none_of=none_of)
+
+
+def category_filter(categories: Sequence[str]) -> FlagFilter:
+    """Influencers with at least one of the given categories."""
+    return FlagFilter("categories", any_of=parse_categories("\n".join(categories)))
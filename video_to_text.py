@@ -1,9 +1,32 @@
-from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor
+from transformers import (
+    Qwen2_5_VLForConditionalGeneration, AutoProcessor, TextStreamer, TextIteratorStreamer,
+    StoppingCriteria, StoppingCriteriaList, LogitsProcessor, LogitsProcessorList,
+)
 from qwen_vl_utils import process_vision_info
 import torch
+import contextvars
+import os
+import threading
+import time
+from matching.result_cache import ResultCache
+from matching.frame_cache import FrameCache
+from matching.output_schema import SchemaDecoder, schema_fingerprint, token_table
+from matching.sampling import DEFAULT_FPS, DEFAULT_MAX_PIXELS, DEFAULT_POLICY, apply_policy, sampling_fingerprint, \
+    visual_tokens
+from matching import metrics, tracing
 
-# Load model and processor once (global, for efficiency)
+# Model and processor are loaded once, on first use (see load_model)
 MODEL_PATH = "./models/Qwen2.5-VL-32B-Instruct-AWQ"
+# Local directory for persistent caches (generated results, decoded frames)
+CACHE_DIR = os.environ.get("MATCHING_CACHE_DIR", "./cache")
+# Video sampling of prompts without a sampling policy (see matching.sampling)
+VIDEO_FPS = DEFAULT_FPS
+VIDEO_MAX_PIXELS = DEFAULT_MAX_PIXELS
+# Batched inference: rough GPU memory cost of one (padded) input token, used to
+# size batches from free memory, and the token budget when no GPU is visible
+BYTES_PER_TOKEN = int(os.environ.get("MATCHING_BYTES_PER_TOKEN", 1024 * 1024))
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("MATCHING_TOKEN_BUDGET", 32768))
+MAX_BATCH_SIZE = 8
 
 def get_model_and_processor():
     model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
@@ -14,92 +37,641 @@ def get_model_and_processor():
     processor = AutoProcessor.from_pretrained(MODEL_PATH)
     return model, processor
 
-model, processor = get_model_and_processor()
+_model = None
+_processor = None
+_model_lock = threading.Lock()
+# Held while inputs are on the GPU and `generate` runs. The server calls in from
+# several threads (scheduler, job worker, batch and streaming routes); with the
+# lock they take turns on the one model, and batch sizing reads free memory
+# while no other generate is running.
+_gpu_lock = threading.RLock()
 
-def video_to_text(video_url: str, prompt: str = "Describe this video.", max_new_tokens: int = 128) -> str:
+def load_model():
     """
-    Given a video URL or local path, return the generated text from the Qwen2.5-VL model.
-    Args:
-        video_url (str): Path or URL to the video file.
-        prompt (str): The prompt/question to ask about the video.
-        max_new_tokens (int): Maximum number of tokens to generate.
-    Returns:
-        str: The generated text output from the model.
+    The shared (model, processor), loaded on first call rather than at import
+    so that importing this module does not read the checkpoint. Thread-safe;
+    later calls return the already loaded pair.
     """
-    messages = [
+    global _model, _processor
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                model, processor = get_model_and_processor()
+                # Token classes for schema-constrained decoding, built here rather than on the first such request
+                token_table(processor.tokenizer)
+                _processor = processor
+                _model = model
+    return _model, _processor
+
+result_cache = ResultCache(os.path.join(CACHE_DIR, "video_to_text.sqlite"))
+frame_cache = FrameCache(os.path.join(CACHE_DIR, "frames"))
+
+def build_messages(video_url: str, prompt: str, sampling=None) -> list:
+    """Chat messages for a single video plus a text prompt; `sampling` sets how candidate frames are decoded."""
+    return [
         {
             "role": "user",
             "content": [
-                {
-                    "type": "video",
-                    "video": video_url,
-                    # You can add more video kwargs here if needed
-                    "max_pixels": 360 * 420,
-                    "fps": 1.0,
-                },
+                (sampling or DEFAULT_POLICY).video_element(video_url),
                 {"type": "text", "text": prompt},
             ],
         }
     ]
-    text = processor.apply_chat_template(
-        messages, tokenize=False, add_generation_prompt=True
-    )
-    image_inputs, video_inputs, video_kwargs = process_vision_info(messages, return_video_kwargs=True)
-    # 保存变量内容到txt文件，处理Tensor类型
-    def tensor_to_str(obj):
-        if hasattr(obj, 'tolist'):  # Tensor对象
-            return f"Tensor(shape={list(obj.shape)}, dtype={obj.dtype}, device={obj.device})"
-        elif isinstance(obj, dict):
-            return {k: tensor_to_str(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [tensor_to_str(item) for item in obj]
-        else:
-            return str(obj)
-    
-    # 保存image_inputs
-    with open("image_inputs.txt", "w", encoding="utf-8") as f:
-        f.write("Image Inputs:\n")
-        f.write(str(tensor_to_str(image_inputs)))
-    
-    # 保存video_inputs
-    with open("video_inputs.txt", "w", encoding="utf-8") as f:
-        f.write("Video Inputs:\n")
-        f.write(str(tensor_to_str(video_inputs)))
-    
-    # 保存video_kwargs
-    with open("video_kwargs.txt", "w", encoding="utf-8") as f:
-        f.write("Video Kwargs:\n")
-        f.write(str(tensor_to_str(video_kwargs)))
+
+def process_video(messages: list, video_url: str, use_cache: bool = True, sampling=None):
+    """
+    Run `process_vision_info` for a single-video message, reusing decoded
+    frames from the frame cache when the same video was processed before,
+    then keep the frames the sampling policy selects (see
+    `matching.sampling.apply_policy`); the cache holds the candidate frames,
+    so policies with the same fps / resolution share them.
+    Returns:
+        (image_inputs, video_inputs, video_kwargs) as from process_vision_info.
+    """
+    sampling = sampling or DEFAULT_POLICY
+    started = time.perf_counter()
+    cache_key = None
+    cached = None
+    if use_cache:
+        cache_key = FrameCache.make_key(video_url, sampling.fps, sampling.max_pixels, sampling.candidate_limit)
+        cached = frame_cache.get(cache_key)
+        metrics.record_cache_lookup("frames", cached is not None)
+    if cached is not None:
+        frames, video_kwargs = cached
+        image_inputs, video_inputs = None, [frames]
+        stage = "vision_cached"
+    else:
+        image_inputs, video_inputs, video_kwargs = process_vision_info(messages, return_video_kwargs=True)
+        if cache_key is not None and video_inputs and len(video_inputs) == 1:
+            frame_cache.put(cache_key, video_inputs[0], video_kwargs)
+        # For URLs process_vision_info also downloads the video, so that stage includes the transfer
+        stage = "vision_http" if video_url.startswith("http") else "vision"
+    tracing.record(stage, time.perf_counter() - started)
+    selection = None
+    if video_inputs and len(video_inputs) == 1 and hasattr(video_inputs[0], "shape"):
+        with tracing.stage("frame_selection"):
+            frames, video_kwargs, selection = apply_policy(sampling, video_inputs[0], video_kwargs)
+        video_inputs = [frames]
+        metrics.INPUT_VIDEO_TOKENS.observe(selection["visual_tokens"])
+    if tracing.active():
+        tracing.annotate(frame_cache_hit=cached is not None, frame_selection=selection,
+                         image_inputs=tracing.describe(image_inputs),
+                         video_inputs=tracing.describe(video_inputs), video_kwargs=tracing.describe(video_kwargs))
+    return image_inputs, video_inputs, video_kwargs
+
+def cache_prompt(prompt: str, schema=None, sampling=None) -> str:
+    """
+    Prompt text used in the result cache key; constrained outputs and
+    outputs of an explicit sampling policy are cached separately.
+    """
+    key = prompt if schema is None else f"{prompt}\0{schema_fingerprint(schema)}"
+    return key if sampling is None else f"{key}\0sampling:{sampling_fingerprint(sampling)}"
+
+def lookup_result(cache_key: str):
+    """Result cache lookup that also counts the hit or miss."""
+    cached = result_cache.get(cache_key)
+    metrics.record_cache_lookup("results", cached is not None)
+    return cached
+
+def eos_token_ids() -> list:
+    """Token ids that end generation for the loaded model."""
+    model, processor = load_model()
+    eos = model.generation_config.eos_token_id
+    ids = list(eos) if isinstance(eos, (list, tuple)) else [eos] if eos is not None else []
+    if processor.tokenizer.eos_token_id is not None and processor.tokenizer.eos_token_id not in ids:
+        ids.append(processor.tokenizer.eos_token_id)
+    return ids
+
+class SchemaLogitsProcessor(LogitsProcessor):
+    """
+    Constrains each batch row to its output schema (None = unconstrained).
+    Tokens the schema does not allow are masked out, and once a row's schema is
+    complete only end-of-sequence is allowed, so that row stops immediately.
+    """
+
+    def __init__(self, schemas: list, tokenizer):
+        eos_ids = eos_token_ids()
+        self.decoders = [SchemaDecoder(s, tokenizer, eos_ids) if s is not None else None for s in schemas]
+        self.states = [d.initial_state() if d is not None else None for d in self.decoders]
+        self._started = False
+        self._free_mask = None
+
+    def _free(self, scores):
+        if self._free_mask is None:
+            table = next(d for d in self.decoders if d is not None).table
+            free_ids = torch.tensor([t for t in table.free_ids if t < scores.shape[-1]], dtype=torch.long)
+            self._free_mask = torch.zeros(scores.shape[-1], dtype=torch.bool)
+            self._free_mask[free_ids] = True
+            self._free_mask = self._free_mask.to(scores.device)
+        return self._free_mask
+
+    def __call__(self, input_ids, scores):
+        if self._started:
+            last = input_ids[:, -1].tolist()
+            for row, decoder in enumerate(self.decoders):
+                if decoder is not None:
+                    self.states[row] = decoder.advance(self.states[row], last[row])
+        self._started = True
+        vocab = scores.shape[-1]
+        for row, decoder in enumerate(self.decoders):
+            if decoder is None:
+                continue
+            state = self.states[row]
+            allowed = decoder.allowed(state)
+            if allowed == SchemaDecoder.FREE:
+                keep = self._free(scores).clone()
+                allowed = decoder.line_end_ids(state)
+            else:
+                keep = torch.zeros(vocab, dtype=torch.bool, device=scores.device)
+            ids = [t for t in allowed if t < vocab]
+            if ids:
+                keep[torch.tensor(ids, dtype=torch.long, device=scores.device)] = True
+            scores[row] = scores[row].masked_fill(~keep, float("-inf"))
+        return scores
+
+def schema_processor(schemas: list):
+    """LogitsProcessorList enforcing per-row schemas, or None when no row has one."""
+    if not any(s is not None for s in schemas):
+        return None
+    _, processor = load_model()
+    return LogitsProcessorList([SchemaLogitsProcessor(schemas, processor.tokenizer)])
+
+class CallbackStreamer(TextStreamer):
+    """Forwards decoded text to a callback as `generate` produces it (batch size 1)."""
+
+    def __init__(self, tokenizer, callback):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True, clean_up_tokenization_spaces=False)
+        self.callback = callback
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.callback(text)
+
+class FirstTokenTimer(StoppingCriteria):
+    """Never stops generation; notes when the first token is out, i.e. when the prefill ended."""
+
+    def __init__(self):
+        self.time = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.time is None:
+            self.time = time.perf_counter()
+        return torch.zeros((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
+
+def record_generation(started: float, first_token: float, finished: float, input_tokens: list,
+                      output_tokens: list):
+    """Prefill / decode split of one `generate` and its token counts, for metrics and traces."""
+    if first_token is not None:
+        tracing.record("prefill", first_token - started)
+        tracing.record("decode", finished - first_token)
+    for count in input_tokens:
+        metrics.INPUT_TOKENS.observe(count)
+    for count in output_tokens:
+        metrics.OUTPUT_TOKENS.observe(count)
+
+def prepare_inputs(texts: list, image_inputs, video_inputs, video_kwargs: dict):
+    """Tokenize texts with their vision inputs into one padded batch on the model device."""
+    model, processor = load_model()
+    # Left padding so every row's generated tokens start right after its prompt
+    processor.tokenizer.padding_side = "left"
     inputs = processor(
-        text=[text],
+        text=texts,
         images=image_inputs,
         videos=video_inputs,
         padding=True,
         return_tensors="pt",
         **video_kwargs,
     )
+    return inputs.to(model.device)
 
-    inputs = inputs.to(model.device)
-    with torch.no_grad():
-        generated_ids = model.generate(**inputs, max_new_tokens=max_new_tokens)
-    generated_ids_trimmed = [
-        out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-    ]
-    output_text = processor.batch_decode(
-        generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-    )
-    
-    # 清理缓存，防止内存积累
+def generate_texts(texts: list, image_inputs, video_inputs, video_kwargs: dict, max_new_tokens: int,
+                   streamer=None, schemas: list = None) -> list:
+    """
+    Run one batched `generate` over chat-template texts and their vision inputs
+    (one video per text, in order) and return the decoded answers in order.
+    An optional transformers streamer receives tokens as they are generated;
+    `schemas` optionally gives an output schema (or None) per text.
+    """
+    model, processor = load_model()
+    with _gpu_lock:
+        with tracing.stage("tokenize", batch_size=len(texts)):
+            inputs = prepare_inputs(texts, image_inputs, video_inputs, video_kwargs)
+        logits_processor = schema_processor(schemas) if schemas else None
+        first_token = FirstTokenTimer()
+        generate_started = time.perf_counter()
+        with tracing.stage("generate", batch_size=len(texts)):
+            with torch.no_grad():
+                generated_ids = model.generate(**inputs, max_new_tokens=max_new_tokens, streamer=streamer,
+                                               logits_processor=logits_processor,
+                                               stopping_criteria=StoppingCriteriaList([first_token]))
+        generate_finished = time.perf_counter()
+        with tracing.stage("detokenize", batch_size=len(texts)):
+            generated_ids_trimmed = [
+                out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
+            ]
+            output_text = processor.batch_decode(
+                generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
+            )
+        # Shorter rows of a batch are padded after their end-of-sequence token
+        pad_id = processor.tokenizer.pad_token_id
+        output_tokens = [int((ids != pad_id).sum()) if pad_id is not None else len(ids) for ids in generated_ids_trimmed]
+        record_generation(generate_started, first_token.time, generate_finished,
+                          inputs.attention_mask.sum(dim=1).tolist(), output_tokens)
+        if tracing.active():
+            tracing.annotate(input_tokens=list(inputs.input_ids.shape), output_tokens=output_tokens)
+
+        # 清理缓存，防止内存积累
+        try:
+            # 删除中间变量
+            del inputs, generated_ids, generated_ids_trimmed
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+                torch.cuda.ipc_collect()
+        except Exception as e:
+            print(f"GPU memory cleanup failed: {e}")
+
+        return output_text
+
+def video_to_text(video_url: str, prompt: str = "Describe this video.", max_new_tokens: int = 128,
+                  use_cache: bool = True, on_text=None, schema=None, sampling=None) -> str:
+    """
+    Given a video URL or local path, return the generated text from the Qwen2.5-VL model.
+    Args:
+        video_url (str): Path or URL to the video file.
+        prompt (str): The prompt/question to ask about the video.
+        max_new_tokens (int): Maximum number of tokens to generate.
+        use_cache (bool): Look up / store the result in the persistent result cache,
+            keyed by (video content hash or canonical URL, prompt, max_new_tokens, model),
+            and reuse decoded frames from the frame cache.
+        on_text (callable, optional): Called with each chunk of decoded text as it
+            is generated (once with the whole text on a cache hit).
+        schema (optional): Output schema from `matching.output_schema`; decoding is
+            constrained to it and stops as soon as it is complete.
+        sampling (optional): `matching.sampling.SamplingPolicy` choosing the frames
+            (default: every frame at VIDEO_FPS within the default visual token budget).
+    Returns:
+        str: The generated text output from the model.
+    """
+    cache_key = None
+    if use_cache:
+        cache_key = ResultCache.make_key(video_url, cache_prompt(prompt, schema, sampling), max_new_tokens,
+                                         MODEL_PATH)
+        cached = lookup_result(cache_key)
+        tracing.annotate(result_cache_hit=cached is not None)
+        if cached is not None:
+            if on_text is not None:
+                on_text(cached)
+            return cached
+
+    _, processor = load_model()
+    messages = build_messages(video_url, prompt, sampling)
+    with tracing.stage("template"):
+        text = processor.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True
+        )
+    # 输入的形状等调试信息按需记录在trace中（见matching.tracing），不再写文件
+    image_inputs, video_inputs, video_kwargs = process_video(messages, video_url, use_cache=use_cache,
+                                                             sampling=sampling)
+    streamer = CallbackStreamer(processor.tokenizer, on_text) if on_text is not None else None
+    output_text = generate_texts([text], image_inputs, video_inputs, video_kwargs, max_new_tokens,
+                                 streamer=streamer, schemas=[schema])
+    del image_inputs, video_inputs, video_kwargs
+
+    result = output_text[0] if output_text else ""
+    if cache_key is not None:
+        result_cache.put(cache_key, result)
+    return result
+
+def video_to_text_multi(video_url: str, prompts: list, max_new_tokens: int = 128, use_cache: bool = True,
+                        schemas: list = None, samplings: list = None) -> list:
+    """
+    Answer several prompts about one video in a single pass.
+    The video is decoded once per sampling policy and all prompts whose
+    answers are not cached are batched into one `generate` call; prompts with
+    the same policy share the same video prefix in the chat template, so only
+    the prompt text differs between their rows.
+    Args:
+        video_url (str): Path or URL to the video file.
+        prompts (list): Prompts to ask about the video.
+        max_new_tokens (int): Maximum number of tokens to generate per prompt.
+        use_cache (bool): Use the result and frame caches.
+        schemas (list, optional): Output schema (or None) per prompt.
+        samplings (list, optional): Sampling policy (or None) per prompt.
+    Returns:
+        list: The generated text for each prompt, in order.
+    """
+    schemas = schemas or [None] * len(prompts)
+    samplings = samplings or [None] * len(prompts)
+    results = [None] * len(prompts)
+    cache_keys = [None] * len(prompts)
+    if use_cache:
+        for i, prompt in enumerate(prompts):
+            cache_keys[i] = ResultCache.make_key(video_url, cache_prompt(prompt, schemas[i], samplings[i]),
+                                                 max_new_tokens, MODEL_PATH)
+            results[i] = lookup_result(cache_keys[i])
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+
+    _, processor = load_model()
+    with tracing.stage("template", prompts=len(pending)):
+        texts = [
+            processor.apply_chat_template(build_messages(video_url, prompts[i], samplings[i]), tokenize=False,
+                                          add_generation_prompt=True)
+            for i in pending
+        ]
+    # Frames per policy; rows with the same policy share them
+    decoded = {}
+    for i in pending:
+        policy = samplings[i] or DEFAULT_POLICY
+        key = sampling_fingerprint(policy)
+        if key not in decoded:
+            _, video_inputs, video_kwargs = process_video(
+                build_messages(video_url, prompts[i], policy), video_url, use_cache=use_cache, sampling=policy
+            )
+            decoded[key] = (video_inputs[0], video_kwargs)
+    rows = [decoded[sampling_fingerprint(samplings[i] or DEFAULT_POLICY)] for i in pending]
+    batch_kwargs = {}
+    for _, video_kwargs in rows:
+        for key, value in video_kwargs.items():
+            batch_kwargs.setdefault(key, []).extend(value if isinstance(value, list) else [value])
+    outputs = generate_texts(texts, None, [frames for frames, _ in rows], batch_kwargs, max_new_tokens,
+                             schemas=[schemas[i] for i in pending])
+    for i, output in zip(pending, outputs):
+        results[i] = output
+        if cache_keys[i] is not None:
+            result_cache.put(cache_keys[i], output)
+    return results
+
+def estimate_video_tokens(frames) -> int:
+    """Visual tokens for a (T, C, H, W) frames tensor: 2-frame temporal patches of 28x28 merged pixels."""
+    t, _, h, w = frames.shape
+    return visual_tokens(t, h, w)
+
+def token_budget() -> int:
+    """Padded input tokens one batch may hold, from free GPU memory when available."""
     try:
-        # 删除中间变量
-        del inputs, generated_ids, generated_ids_trimmed, image_inputs, video_inputs, video_kwargs
         if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            torch.cuda.ipc_collect()
+            free = sum(torch.cuda.mem_get_info(i)[0] for i in range(torch.cuda.device_count()))
+            return max(1, int(free * 0.8) // BYTES_PER_TOKEN)
     except Exception as e:
-        print(f"GPU memory cleanup failed: {e}")
-    
-    return output_text[0] if output_text else ""
+        print(f"Could not read free GPU memory: {e}")
+    return DEFAULT_TOKEN_BUDGET
+
+def plan_batches(costs: list, budget: int, max_batch_size: int = MAX_BATCH_SIZE) -> list:
+    """
+    Group item indices into batches whose padded cost (longest item x batch size)
+    fits the budget. Items are packed shortest first to limit padding; every
+    batch holds at least one item.
+    """
+    batches, current, longest = [], [], 0
+    for i in sorted(range(len(costs)), key=lambda i: costs[i]):
+        longest_if_added = max(longest, costs[i])
+        if current and (longest_if_added * (len(current) + 1) > budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, longest_if_added = [], costs[i]
+        current.append(i)
+        longest = longest_if_added
+    if current:
+        batches.append(current)
+    return batches
+
+def videos_to_text(video_urls: list, prompt: str = "Describe this video.", max_new_tokens: int = 128,
+                   use_cache: bool = True) -> list:
+    """
+    Run the same prompt over several videos with batched inference.
+    Args:
+        video_urls (list): Paths or URLs of the videos.
+        prompt (str): The prompt/question to ask about every video.
+        max_new_tokens (int): Maximum number of tokens to generate per video.
+        use_cache (bool): Use the result and frame caches.
+    Returns:
+        list: One dict per video, in input order: {"result": text} or {"error": message}.
+    """
+    return video_prompts_to_text([(url, prompt) for url in video_urls], max_new_tokens, use_cache)
+
+def video_prompts_to_text(requests: list, max_new_tokens: int = 128, use_cache: bool = True) -> list:
+    """
+    Batched inference over (video_url, prompt) pairs, or (video_url, prompt, schema)
+    triples for schema-constrained output, optionally followed by a sampling policy.
+    Videos are preprocessed individually, grouped into batches sized to the
+    memory budget and each batch runs as one padded `processor(...)` call and a
+    single `generate`. A batch that runs out of memory is split and retried.
+    Args:
+        requests (list): (video_url, prompt) pairs, (video_url, prompt, schema) triples or
+            (video_url, prompt, schema, sampling) tuples.
+        max_new_tokens (int): Maximum number of tokens to generate per item.
+        use_cache (bool): Use the result and frame caches.
+    Returns:
+        list: One dict per request, in input order: {"result": text} or {"error": message}.
+    """
+    results = [None] * len(requests)
+    cache_keys = [None] * len(requests)
+    schemas = [request[2] if len(request) > 2 else None for request in requests]
+    samplings = [request[3] if len(request) > 3 else None for request in requests]
+    prepared = {}
+    for i, (video_url, prompt) in enumerate(request[:2] for request in requests):
+        try:
+            if not video_url.startswith("http") and not os.path.exists(video_url):
+                raise FileNotFoundError(f"Video not found: {video_url}")
+            if use_cache:
+                cache_keys[i] = ResultCache.make_key(video_url, cache_prompt(prompt, schemas[i], samplings[i]),
+                                                     max_new_tokens, MODEL_PATH)
+                cached = lookup_result(cache_keys[i])
+                if cached is not None:
+                    results[i] = {"result": cached}
+                    continue
+            _, processor = load_model()
+            messages = build_messages(video_url, prompt, samplings[i])
+            with tracing.stage("template", item=i):
+                text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            _, video_inputs, video_kwargs = process_video(messages, video_url, use_cache=use_cache,
+                                                          sampling=samplings[i])
+            prepared[i] = (text, video_inputs[0], video_kwargs)
+        except Exception as e:
+            results[i] = {"error": str(e)}
+
+    pending = sorted(prepared)
+    costs = [estimate_video_tokens(prepared[i][1]) for i in pending]
+    with _gpu_lock:
+        _run_batches(pending, costs, prepared, schemas, cache_keys, results, max_new_tokens)
+    return results
+
+def _run_batches(pending: list, costs: list, prepared: dict, schemas: list, cache_keys: list, results: list,
+                 max_new_tokens: int):
+    """Generate the prepared items of `video_prompts_to_text` in memory-sized batches (under the GPU lock)."""
+    queue = [[pending[j] for j in batch] for batch in plan_batches(costs, token_budget())]
+    while queue:
+        batch = queue.pop(0)
+        try:
+            batch_kwargs = {}
+            for i in batch:
+                for key, value in prepared[i][2].items():
+                    batch_kwargs.setdefault(key, []).extend(value if isinstance(value, list) else [value])
+            outputs = generate_texts(
+                [prepared[i][0] for i in batch], None, [prepared[i][1] for i in batch],
+                batch_kwargs, max_new_tokens, schemas=[schemas[i] for i in batch],
+            )
+        except torch.cuda.OutOfMemoryError as e:
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            if len(batch) > 1:
+                half = len(batch) // 2
+                queue[:0] = [batch[:half], batch[half:]]
+            else:
+                results[batch[0]] = {"error": f"Out of memory: {e}"}
+            continue
+        except Exception as e:
+            for i in batch:
+                results[i] = {"error": str(e)}
+            continue
+        for i, output in zip(batch, outputs):
+            results[i] = {"result": output}
+            if cache_keys[i] is not None:
+                result_cache.put(cache_keys[i], output)
+
+class CancelCriteria(StoppingCriteria):
+    """Stops `generate` at the next step once the event is set."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+class CountingStreamer(TextIteratorStreamer):
+    """TextIteratorStreamer that also counts generated tokens and times the first one."""
+
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.token_count = 0
+        self.first_token_time = None
+
+    def put(self, value):
+        is_prompt = self.skip_prompt and self.next_tokens_are_prompt
+        super().put(value)
+        if not is_prompt:
+            if self.first_token_time is None:
+                self.first_token_time = time.perf_counter()
+            self.token_count += value.shape[-1] if value.dim() else 1
+
+def video_to_text_stream(video_url: str, prompt: str = "Describe this video.", max_new_tokens: int = 128,
+                         use_cache: bool = True, cancel_event: threading.Event = None, schema=None,
+                         sampling=None):
+    """
+    Generator variant of `video_to_text` that yields text as it is decoded.
+    Yields {"text": chunk} events, then one final
+    {"done": True, "result": full_text, "cancelled": bool, "stats": {...}} with
+    time-to-first-token and decode tokens/sec. Setting `cancel_event`, or
+    closing the generator, stops generation at the next decode step. `schema`
+    and `sampling` work as in `video_to_text`.
+    """
+    started = time.perf_counter()
+    cancel_event = cancel_event or threading.Event()
+    cache_key = None
+    if use_cache:
+        cache_key = ResultCache.make_key(video_url, cache_prompt(prompt, schema, sampling), max_new_tokens,
+                                         MODEL_PATH)
+        cached = lookup_result(cache_key)
+        tracing.annotate(result_cache_hit=cached is not None)
+        if cached is not None:
+            elapsed = time.perf_counter() - started
+            yield {"text": cached}
+            yield {"done": True, "result": cached, "cancelled": False,
+                   "stats": {"cached": True, "ttft_ms": 1000 * elapsed, "total_ms": 1000 * elapsed,
+                             "output_tokens": None, "tokens_per_sec": None}}
+            return
+
+    model, processor = load_model()
+    messages = build_messages(video_url, prompt, sampling)
+    with tracing.stage("template"):
+        text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    image_inputs, video_inputs, video_kwargs = process_video(messages, video_url, use_cache=use_cache,
+                                                             sampling=sampling)
+    streamer = CountingStreamer(processor.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                clean_up_tokenization_spaces=False)
+    input_tokens = []
+    errors = []
+    timing = {}
+
+    def run():
+        # Waits here while another generate holds the GPU; a cancel before then skips the work
+        with _gpu_lock:
+            try:
+                if cancel_event.is_set():
+                    streamer.end()
+                    return
+                with tracing.stage("tokenize"):
+                    inputs = prepare_inputs([text], image_inputs, video_inputs, video_kwargs)
+                input_tokens.extend(inputs.attention_mask.sum(dim=1).tolist())
+                timing["generate_started"] = time.perf_counter()
+                with torch.no_grad():
+                    model.generate(
+                        **inputs, max_new_tokens=max_new_tokens, streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([CancelCriteria(cancel_event)]),
+                        logits_processor=schema_processor([schema]),
+                    )
+                del inputs
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+            finally:
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+
+    # The copied context keeps the request's traces active in the generate thread
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), name="video-to-text-stream",
+                              daemon=True)
+    thread.start()
+    chunks = []
+    completed = False
+    try:
+        for chunk in streamer:
+            if chunk:
+                chunks.append(chunk)
+                yield {"text": chunk}
+        completed = not cancel_event.is_set()
+    finally:
+        # Closing the generator (e.g. the client went away) cancels generation
+        cancel_event.set()
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    finished = time.perf_counter()
+    generate_started = timing.get("generate_started", finished)
+    result = "".join(chunks)
+    first = streamer.first_token_time
+    decode_time = finished - first if first is not None else 0.0
+    cancelled = not completed
+    # Detokenizing is interleaved with generation here, so both are one stage
+    tracing.record("generate", finished - generate_started, output_tokens=streamer.token_count,
+                   ttft_ms=round(1000 * (first - started), 3) if first is not None else None)
+    record_generation(generate_started, first, finished, input_tokens, [streamer.token_count])
+    if cache_key is not None and not cancelled:
+        result_cache.put(cache_key, result)
+    yield {"done": True, "result": result, "cancelled": cancelled,
+           "stats": {"cached": False,
+                     "ttft_ms": 1000 * (first - started) if first is not None else None,
+                     "total_ms": 1000 * (finished - started),
+                     "output_tokens": streamer.token_count,
+                     "tokens_per_sec": streamer.token_count / decode_time if decode_time > 0 else None}}
+
+def warmup(video_url: str = None, max_new_tokens: int = 1):
+    """
+    Load the model and run one tiny generate so CUDA kernels and the memory
+    allocator are initialised before the first real request. With `video_url`
+    the vision tower runs too (the frames are not cached).
+    """
+    model, processor = load_model()
+    if video_url:
+        messages = build_messages(video_url, "Describe this video.")
+        image_inputs, video_inputs, video_kwargs = process_video(messages, video_url, use_cache=False)
+    else:
+        messages = [{"role": "user", "content": [{"type": "text", "text": "Hello"}]}]
+        image_inputs, video_inputs, video_kwargs = None, None, {}
+    text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    generate_texts([text], image_inputs, video_inputs, video_kwargs, max_new_tokens)
 
 # Example usage (for testing)
 if __name__ == "__main__":
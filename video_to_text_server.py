@@ -1,9 +1,16 @@
 import sys
 import os
 import json
-import torch
-from matching.video_to_text import video_to_text
-from flask import Flask, request, jsonify
+import time
+import threading
+import uuid
+from matching.inference_backend import get_backend
+from matching import metrics, tracing
+from matching.batch_scheduler import BatchScheduler, InferenceRequest
+from matching.job_queue import JobStore, JobWorker, SUCCEEDED, FAILED
+from matching.output_schema import schema_from_dict
+from matching.sampling import sampling_from_dict
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 
 def load_prompts():
     """Load prompts from JSON file"""
@@ -19,17 +26,126 @@ def get_prompt(prompt_id="0"):
     prompts = load_prompts()
     return prompts.get(str(prompt_id), prompts["0"])["prompt"]
 
+def get_prompt_schema(prompt_id="0"):
+    """Output schema declared for a prompt ID in the JSON file, or None"""
+    prompts = load_prompts()
+    return prompts.get(str(prompt_id), prompts["0"]).get("schema")
+
+def get_prompt_sampling(prompt_id="0", proposed=False):
+    """
+    Frame sampling policy declared for a prompt ID in the JSON file, or None.
+    With `proposed`, the prompt's "proposed_sampling", which is only used on request.
+    """
+    prompts = load_prompts()
+    return prompts.get(str(prompt_id), prompts["0"]).get("proposed_sampling" if proposed else "sampling")
+
+def request_sampling(data, prompt_id, custom_prompt=None):
+    """
+    Sampling policy spec of a request: "sampling" in the body ("proposed" for the
+    prompt's proposed_sampling), else the prompt's policy (custom prompts use
+    the default sampling). Raises ValueError if invalid.
+    """
+    spec = data.get("sampling")
+    if spec == "proposed":
+        spec = None if custom_prompt else get_prompt_sampling(prompt_id, proposed=True)
+    elif spec is None and not custom_prompt:
+        spec = get_prompt_sampling(prompt_id)
+    if spec is not None and not isinstance(spec, dict):
+        raise ValueError(f'"sampling" must be an object or "proposed", got {spec!r}')
+    try:
+        sampling_from_dict(spec)
+    except TypeError as e:
+        raise ValueError(str(e))
+    return spec
+
+# 推理后端：模型在后台线程中加载，HTTP服务立即可用（/healthz、/readyz）。
+# MATCHING_PRELOAD=0 时改为首个请求时加载；MATCHING_WARMUP=1 时加载后再跑一次小的generate
+backend = get_backend()
+if os.environ.get("MATCHING_PRELOAD", "1") != "0":
+    backend.start_warmup(generate=os.environ.get("MATCHING_WARMUP", "0") == "1")
+
 def cleanup_cache():
     """清理GPU缓存"""
+    backend.release_memory()
+
+def trace_requested(data):
+    """Per-request debug tracing: "trace": true in the body or an X-Debug-Trace: 1 header"""
+    return bool(data.get("trace")) or request.headers.get("X-Debug-Trace") == "1"
+
+def with_trace_id(response, trace):
+    """Add the trace id to a JSON response when the request was traced"""
+    if trace is not None:
+        response["trace_id"] = trace.id
+    return response
+
+def run_inference_batch(requests):
+    """Run a micro-batch of InferenceRequests collected by the scheduler"""
+    # 批次中被追踪的请求都记录这一批的各阶段耗时
+    with tracing.activate(r.trace for r in requests):
+        tracing.annotate(batch_size=len(requests))
+        outputs = backend.video_prompts_to_text(
+            [(r.video_path, r.prompt, schema_from_dict(r.schema), sampling_from_dict(r.sampling)) for r in requests],
+            max_new_tokens=requests[0].max_new_tokens,
+            use_cache=requests[0].use_cache,
+        )
+    cleanup_cache()
+    return [out["result"] if "error" not in out else RuntimeError(out["error"]) for out in outputs]
+
+# 并发的 /video_to_text 请求会被合并成微批次，一次 generate 处理
+scheduler = BatchScheduler(
+    run_inference_batch,
+    max_batch_size=int(os.environ.get("MATCHING_MAX_BATCH_SIZE", 4)),
+    max_wait_ms=float(os.environ.get("MATCHING_MAX_WAIT_MS", 50)),
+    batch_key=lambda r: (r.max_new_tokens, r.use_cache),
+    concurrency=backend.parallelism,  # 多个推理worker时并行跑多个批次
+)
+scheduler.start()
+
+SCHEDULER_QUEUE_DEPTH = metrics.REGISTRY.gauge(
+    "matching_scheduler_queue_depth", "Requests waiting for the micro-batch scheduler")
+metrics.REGISTRY.register_collector(lambda: SCHEDULER_QUEUE_DEPTH.set(float(scheduler.queue_depth)))
+
+def run_job(payload, on_text):
+    """Run one /jobs video analysis, streaming partial text into the job store"""
     try:
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            torch.cuda.ipc_collect()
-    except Exception as e:
-        print(f"GPU memory cleanup failed: {e}")
+        with tracing.trace("job", payload.get("trace", False), video_path=payload["video_path"]):
+            return backend.video_to_text(
+                payload["video_path"],
+                prompt=payload["prompt"],
+                max_new_tokens=payload["max_new_tokens"],
+                use_cache=payload["use_cache"],
+                on_text=on_text,
+                schema=schema_from_dict(payload.get("schema")),
+                sampling=sampling_from_dict(payload.get("sampling")),
+            )
+    finally:
+        cleanup_cache()
+
+# 异步任务：持久化在SQLite中，服务重启后未完成的任务会重新排队
+job_store = JobStore(os.environ.get("MATCHING_JOBS_DB", "./jobs.sqlite"))
+job_worker = JobWorker(job_store, run_job)
+job_worker.start()
+
+# 正在进行的流式生成：stream_id -> 取消事件
+active_streams = {}
 
 app = Flask(__name__)
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request; its latency is recorded once the body is sent, so streams are timed to the end"""
+    started = g.get("request_started", time.perf_counter())
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    method = request.method
+    metrics.HTTP_REQUESTS.inc(1.0, route, method, str(response.status_code))
+    response.call_on_close(
+        lambda: metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route, method))
+    return response
+
 @app.route("/video_to_text", methods=["POST"])
 def handle_video_to_text():
     data = request.get_json()
@@ -37,34 +153,268 @@ def handle_video_to_text():
     prompt_id = data.get("prompt_id", "3")
     custom_prompt = data.get("prompt")  # 允许自定义prompt
     max_new_tokens = int(data.get("max_new_tokens", 1024))
+    use_cache = bool(data.get("use_cache", True))
     
     if not video_path or (not video_path.startswith("http") and not os.path.exists(video_path)):
         return jsonify({"error": "video_path is required and must exist."}), 400
     
-    # 使用自定义prompt或从JSON文件获取prompt
+    # 使用自定义prompt或从JSON文件获取prompt（JSON中的prompt可声明输出schema，约束解码并提前停止）
+    schema = None
     if custom_prompt:
         prompt = custom_prompt
     else:
         prompt = get_prompt(prompt_id)
+        schema = get_prompt_schema(prompt_id)
+    # 帧采样策略（prompts.json中的sampling，或请求体中的sampling）：帧数预算、场景切换关键帧、分辨率
+    try:
+        sampling = request_sampling(data, prompt_id, custom_prompt)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid sampling policy: {e}"}), 400
     
     # print(prompt)
     
     try:
-        result = video_to_text(video_path, prompt=prompt, max_new_tokens=max_new_tokens)
-        # 请求完成后清理缓存
+        # 交给调度器，与其他并发请求一起批量推理（批处理后会清理缓存）
+        with tracing.trace("video_to_text", trace_requested(data), video_path=video_path, prompt_id=prompt_id,
+                           max_new_tokens=max_new_tokens) as trace:
+            result = scheduler.run(InferenceRequest(video_path, prompt, max_new_tokens, use_cache, schema,
+                                                    sampling=sampling, trace=trace))
+        return jsonify(with_trace_id({"result": result}, trace))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/video_to_text_multi", methods=["POST"])
+def handle_video_to_text_multi():
+    """Answer several prompts about one video in a single pass"""
+    data = request.get_json()
+    video_path = data.get("video_path")
+    prompt_ids = [str(p) for p in data.get("prompt_ids", ["3", "4"])]
+    custom_prompts = data.get("prompts") or {}  # 允许按prompt_id覆盖prompt
+    max_new_tokens = int(data.get("max_new_tokens", 1024))
+    use_cache = bool(data.get("use_cache", True))
+
+    if not video_path or (not video_path.startswith("http") and not os.path.exists(video_path)):
+        return jsonify({"error": "video_path is required and must exist."}), 400
+    if not prompt_ids:
+        return jsonify({"error": "prompt_ids must not be empty."}), 400
+    if not isinstance(custom_prompts, dict) or not all(isinstance(p, str) for p in custom_prompts.values()):
+        return jsonify({"error": "prompts must be an object mapping prompt_id to a prompt string."}), 400
+
+    prompts = [custom_prompts.get(pid) or get_prompt(pid) for pid in prompt_ids]
+    schemas = [None if custom_prompts.get(pid) else schema_from_dict(get_prompt_schema(pid)) for pid in prompt_ids]
+    try:
+        samplings = [sampling_from_dict(request_sampling(data, pid, custom_prompts.get(pid))) for pid in prompt_ids]
+    except ValueError as e:
+        return jsonify({"error": f"Invalid sampling policy: {e}"}), 400
+
+    try:
+        with tracing.trace("video_to_text_multi", trace_requested(data), video_path=video_path,
+                           prompt_ids=prompt_ids) as trace:
+            outputs = backend.video_to_text_multi(video_path, prompts, max_new_tokens=max_new_tokens,
+                                                  use_cache=use_cache, schemas=schemas, samplings=samplings)
+        cleanup_cache()
+        return jsonify(with_trace_id({"results": dict(zip(prompt_ids, outputs))}, trace))
+    except Exception as e:
+        cleanup_cache()
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/videos_to_text", methods=["POST"])
+def handle_videos_to_text():
+    """Run one prompt over several videos with batched inference"""
+    data = request.get_json()
+    video_paths = data.get("video_paths")
+    prompt_id = data.get("prompt_id", "3")
+    custom_prompt = data.get("prompt")
+    max_new_tokens = int(data.get("max_new_tokens", 1024))
+    use_cache = bool(data.get("use_cache", True))
+
+    if not video_paths or not isinstance(video_paths, list):
+        return jsonify({"error": "video_paths must be a non-empty list."}), 400
+
+    prompt = custom_prompt if custom_prompt else get_prompt(prompt_id)
+    schema = None if custom_prompt else schema_from_dict(get_prompt_schema(prompt_id))
+    try:
+        sampling = sampling_from_dict(request_sampling(data, prompt_id, custom_prompt))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid sampling policy: {e}"}), 400
+
+    try:
+        with tracing.trace("videos_to_text", trace_requested(data), videos=len(video_paths),
+                           prompt_id=prompt_id) as trace:
+            outputs = backend.video_prompts_to_text([(path, prompt, schema, sampling) for path in video_paths],
+                                                    max_new_tokens=max_new_tokens, use_cache=use_cache)
         cleanup_cache()
-        return jsonify({"result": result})
+        # 每个视频单独返回结果或错误，顺序与输入一致
+        results = [
+            {"video_path": path, "result": out.get("result"), "error": out.get("error")}
+            for path, out in zip(video_paths, outputs)
+        ]
+        return jsonify(with_trace_id({"results": results}, trace))
     except Exception as e:
-        # 即使出错也要清理缓存
         cleanup_cache()
         return jsonify({"error": str(e)}), 500
 
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """Queue a video analysis and return its job id immediately"""
+    data = request.get_json()
+    video_path = data.get("video_path")
+    prompt_id = data.get("prompt_id", "3")
+    custom_prompt = data.get("prompt")
+
+    if not video_path or (not video_path.startswith("http") and not os.path.exists(video_path)):
+        return jsonify({"error": "video_path is required and must exist."}), 400
+    try:
+        sampling = request_sampling(data, prompt_id, custom_prompt)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid sampling policy: {e}"}), 400
+
+    payload = {
+        "video_path": video_path,
+        "prompt": custom_prompt if custom_prompt else get_prompt(prompt_id),
+        "schema": None if custom_prompt else get_prompt_schema(prompt_id),
+        "sampling": sampling,
+        "max_new_tokens": int(data.get("max_new_tokens", 1024)),
+        "use_cache": bool(data.get("use_cache", True)),
+        "trace": trace_requested(data),
+    }
+    job_id = job_store.create(payload)
+    job_worker.notify()
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Job status, partial output while running, and the result when done"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    job.pop("payload")
+    return jsonify(job)
+
+@app.route("/jobs/<job_id>/stream", methods=["GET"])
+def stream_job(job_id):
+    """Server-sent events with text as it is generated, then a final done event"""
+    if job_store.get(job_id) is None:
+        return jsonify({"error": "job not found"}), 404
+
+    def events():
+        sent = 0
+        while True:
+            job = job_store.get(job_id)
+            partial = job["partial"]
+            if len(partial) > sent:
+                yield f"data: {json.dumps({'text': partial[sent:]}, ensure_ascii=False)}\n\n"
+                sent = len(partial)
+            if job["status"] in (SUCCEEDED, FAILED):
+                done = {"status": job["status"], "result": job["result"], "error": job["error"]}
+                yield f"event: done\ndata: {json.dumps(done, ensure_ascii=False)}\n\n"
+                return
+            time.sleep(0.2)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/video_to_text/stream", methods=["POST"])
+def handle_video_to_text_stream():
+    """
+    Server-sent events with text as it is decoded. The first event carries a
+    stream_id that can be cancelled via /video_to_text/stream/<id>/cancel;
+    disconnecting also stops generation. The final `done` event has ttft/tokens-per-sec stats.
+    """
+    data = request.get_json()
+    video_path = data.get("video_path")
+    prompt_id = data.get("prompt_id", "3")
+    custom_prompt = data.get("prompt")
+    max_new_tokens = int(data.get("max_new_tokens", 1024))
+    use_cache = bool(data.get("use_cache", True))
+
+    if not video_path or (not video_path.startswith("http") and not os.path.exists(video_path)):
+        return jsonify({"error": "video_path is required and must exist."}), 400
+
+    prompt = custom_prompt if custom_prompt else get_prompt(prompt_id)
+    schema = None if custom_prompt else schema_from_dict(get_prompt_schema(prompt_id))
+    try:
+        sampling = sampling_from_dict(request_sampling(data, prompt_id, custom_prompt))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid sampling policy: {e}"}), 400
+    stream_id = uuid.uuid4().hex
+    cancel_event = threading.Event()
+    active_streams[stream_id] = cancel_event
+    traced = trace_requested(data)
+
+    def events():
+        with tracing.trace("video_to_text_stream", traced, video_path=video_path, stream_id=stream_id) as trace:
+            stream = backend.video_to_text_stream(video_path, prompt=prompt, max_new_tokens=max_new_tokens,
+                                                  use_cache=use_cache, cancel_event=cancel_event, schema=schema,
+                                                  sampling=sampling)
+            try:
+                yield f"event: start\ndata: {json.dumps(with_trace_id({'stream_id': stream_id}, trace))}\n\n"
+                for event in stream:
+                    if event.get("done"):
+                        yield f"event: done\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    else:
+                        yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            finally:
+                # 客户端断开时关闭生成器，停止生成
+                stream.close()
+                active_streams.pop(stream_id, None)
+                cleanup_cache()
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/video_to_text/stream/<stream_id>/cancel", methods=["POST"])
+def cancel_video_to_text_stream(stream_id):
+    """Stop an in-progress streaming generation"""
+    cancel_event = active_streams.get(stream_id)
+    if cancel_event is None:
+        return jsonify({"error": "stream not found"}), 404
+    cancel_event.set()
+    return jsonify({"stream_id": stream_id, "cancelled": True})
+
 @app.route("/prompts", methods=["GET"])
 def list_prompts():
     """List all available prompts"""
     prompts = load_prompts()
     return jsonify(prompts)
 
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Result and frame cache sizes and hit/miss counters"""
+    return jsonify(backend.cache_stats())
+
+@app.route("/debug/traces", methods=["GET"])
+def debug_traces():
+    """Recent request traces (newest first): ?limit=N, ?trace_id=... for one trace"""
+    limit = request.args.get("limit", type=int)
+    traces = tracing.sink.recent(limit=limit if limit is not None else 50, trace_id=request.args.get("trace_id"))
+    return jsonify({"traces": traces, "sink": tracing.sink.stats()})
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus metrics: stage latencies, token counts, cache lookups, GPU memory, HTTP requests.
+    Series recorded by inference worker processes carry a worker="N" label"""
+    body = metrics.render([({}, metrics.snapshot())] + backend.metrics_snapshots())
+    return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the HTTP server is up (the model may still be loading)"""
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: 200 once the model is loaded (and warmed up, if enabled), 503 before"""
+    status = backend.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route("/scheduler/stats", methods=["GET"])
+def scheduler_stats():
+    """Queue depth and micro-batch size statistics"""
+    return jsonify(scheduler.stats())
+
 if __name__ == "__main__":
-    print("[Model loaded. HTTP server running on http://0.0.0.0:5000 . POST to /video_to_text]")
-    app.run(host="0.0.0.0", port=5000) 
\ No newline at end of file
+    print("[HTTP server running on http://0.0.0.0:5000 . Model loading in background, see /readyz. POST to /video_to_text]")
+    app.run(host="0.0.0.0", port=5000, threaded=True) 
\ No newline at end of file